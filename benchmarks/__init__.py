@@ -0,0 +1,53 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+"""
+### vidtoch 基准测试
+
+生成确定的合成测试视频，分别测量解码、渲染、编码、封装各阶段及各种端到端转换方式的帧率、内存峰值、临时磁盘占用
+
+运行 python -m benchmarks -h 查看用法，此包不随 vidtoch 发布
+"""
+
+from .__measure__ import DiskSampler, isolated, peakRss
+from .__suite__ import DEFAULTENGINES, ENGINES, STAGES, compare, runSuite
+from .__synth__ import MOTIONS, RESOLUTIONS, synthesize
+
+__all__ = [
+    "DEFAULTENGINES",
+    "DiskSampler",
+    "ENGINES",
+    "MOTIONS",
+    "RESOLUTIONS",
+    "STAGES",
+    "compare",
+    "isolated",
+    "peakRss",
+    "runSuite",
+    "synthesize",
+]
@@ -0,0 +1,116 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from .__suite__ import DEFAULTENGINES, ENGINES, cleanup, compare, load, runSuite, save
+from .__synth__ import MOTIONS, RESOLUTIONS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="vidtoch 基准测试"
+    )
+    parser.add_argument(
+        "-o", "--out", default="bench_results.json", help="结果保存路径"
+    )
+    parser.add_argument("-b", "--baseline", help="与之比较的基线结果文件")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=0.05, help="帧率下降超过此比例视为变慢"
+    )
+    parser.add_argument(
+        "-w", "--workdir", help="工作目录，保留合成的测试视频以便重复使用"
+    )
+    parser.add_argument(
+        "-r",
+        "--resolutions",
+        nargs="+",
+        choices=RESOLUTIONS,
+        default=["small", "sd", "hd"],
+    )
+    parser.add_argument("-m", "--motions", nargs="+", choices=MOTIONS, default=MOTIONS)
+    parser.add_argument(
+        "-e", "--engines", nargs="+", choices=ENGINES, default=DEFAULTENGINES
+    )
+    parser.add_argument(
+        "-f", "--frames", type=int, default=100, help="每个测试视频的帧数"
+    )
+    parser.add_argument("-a", "--acq-rate", type=float, default=0.2, help="采集率")
+    parser.add_argument("--no-stages", action="store_true", help="不分别测量各阶段")
+    parser.add_argument("--ffmpeg", help="ffmpeg可执行文件的路径")
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="快速模式：只测量 small 分辨率、每个视频 30 帧",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="显示被测函数的输出"
+    )
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.resolutions, args.frames = ["small"], 30
+    workDir = args.workdir or tempfile.mkdtemp()
+    try:
+        results = runSuite(
+            workDir,
+            args.resolutions,
+            args.motions,
+            args.frames,
+            args.acq_rate,
+            args.engines,
+            not args.no_stages,
+            args.ffmpeg,
+            not args.verbose,
+        )
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workDir, ignore_errors=True)
+        else:
+            cleanup(workDir)
+    save(results, args.out)
+    print(f"结果已保存到：{os.path.abspath(args.out)}")
+    if args.baseline is None:
+        return 0
+    rows = compare(results, load(args.baseline), args.threshold)
+    regressed = 0
+    print(f"与基线比较(帧率下降超过{args.threshold:.0%}视为变慢)：")
+    for video, name, baseFps, fps, ratio, slower in rows:
+        regressed += slower
+        mark = "变慢" if slower else ""
+        print(
+            f"  {video:<28}{name:<24}{baseFps:>9.1f} -> {fps:>9.1f}  {ratio:>6.2f}x  {mark}"
+        )
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from queue import Empty
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计内存峰值
+    resource = None
+
+
+def dirSize(dirPath: str) -> int:
+    """统计目录中全部文件的总字节数，统计时被删除的文件忽略不计"""
+    total = 0
+    for root, _, fileNames in os.walk(dirPath):
+        for fileName in fileNames:
+            try:
+                total += os.path.getsize(os.path.join(root, fileName))
+            except OSError:
+                continue
+    return total
+
+
+def peakRss():
+    """返回 (当前进程内存峰值, 已结束子进程中最大的内存峰值)，单位字节，无法统计时为 (None, None)"""
+    if resource is None:
+        return None, None
+    # Linux 下 ru_maxrss 的单位是 KB，macOS 下是字节
+    unit = 1 if sys.platform == "darwin" else 1024
+    selfRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    # Linux 下 ru_maxrss 在 exec 后仍保留父进程的峰值，VmHWM 则随 exec 重新统计
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    selfRss = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    return selfRss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+
+
+class DiskSampler(threading.Thread):
+    def __init__(self, dirPath: str, interval: float = 0.02):
+        """
+        ### 在后台定时统计目录大小，记录峰值
+
+        ```
+        参数 dirPath: str，要统计的目录
+        参数 interval: float，统计间隔(秒)，可忽略
+        ```
+        """
+        super().__init__(daemon=True)
+        self.dirPath = dirPath
+        self.interval = interval
+        self.peak = 0
+        self.__stop = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, dirSize(self.dirPath))
+            if self.__stop.wait(self.interval):
+                break
+
+    def stop(self) -> int:
+        """停止统计并返回峰值"""
+        self.__stop.set()
+        self.join()
+        self.peak = max(self.peak, dirSize(self.dirPath))
+        return self.peak
+
+
+def _child(queue, tempRoot: str, quiet: bool, func, args: tuple):
+    """在全新进程中执行测量函数，临时文件全部写入专用目录以统计临时磁盘占用"""
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    tempDir = tempfile.mkdtemp(dir=tempRoot)
+    # 本进程、由本进程派生的工作进程及 ffmpeg 都使用专用临时目录
+    os.environ["TMPDIR"] = os.environ["TEMP"] = os.environ["TMP"] = tempDir
+    tempfile.tempdir = tempDir
+    sampler = DiskSampler(tempDir)
+    sampler.start()
+    try:
+        started = perf_counter()
+        result = func(*args)
+        elapsed = perf_counter() - started
+        error = None
+    except Exception as err:
+        result, elapsed, error = dict(), perf_counter() - started, repr(err)
+    tempBytes = sampler.stop()
+    shutil.rmtree(tempDir, ignore_errors=True)
+    selfRss, childRss = peakRss()
+    result.setdefault("seconds", elapsed)
+    result.update(
+        peakRss=selfRss, peakRssChild=childRss, tempBytes=tempBytes, error=error
+    )
+    queue.put(result)
+
+
+def isolated(func, *args, tempRoot: str = None, quiet: bool = True) -> dict:
+    """
+    ### 在新启动的进程中执行 func(*args)，返回其结果字典并附加资源统计
+
+    使用 spawn 方式启动进程，内存峰值从零开始统计，互不干扰；func 须是模块级函数，返回 dict
+
+    结果字典附加：seconds 耗时(func 未给出时)，peakRss 进程内存峰值，peakRssChild 最大的子进程内存峰值，tempBytes 临时目录占用峰值，error 异常信息
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue, tempRoot, quiet, func, args))
+    process.start()
+    try:
+        while True:
+            try:
+                return queue.get(timeout=0.5)
+            except Empty:
+                if not process.is_alive() and queue.empty():
+                    return dict(error=f"测量进程异常退出，退出码：{process.exitcode}。")
+    finally:
+        process.join()
@@ -0,0 +1,395 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import json
+import os
+import platform
+import shutil
+from time import localtime, perf_counter, strftime
+
+import cv2
+import numpy
+import vidtoch
+from cv2 import (
+    CAP_PROP_FPS,
+    CAP_PROP_FRAME_COUNT,
+    CAP_PROP_FRAME_HEIGHT,
+    CAP_PROP_FRAME_WIDTH,
+    COLOR_GRAY2BGR,
+)
+from cv2 import VideoCapture as vcapt
+from cv2 import VideoWriter, VideoWriter_fourcc, cvtColor
+from vidtoch import (
+    ENCODERPROFILES,
+    BatchRunner,
+    FFCmdUtils,
+    LumaStack,
+    effectiveCpus,
+    ffmpegInfo,
+    makeVideo,
+    vTools,
+)
+from vidtoch.__utils__ import _getRenderer, _gridSize, _readFrames
+
+from .__measure__ import isolated
+from .__synth__ import MOTIONS, synthesize
+
+RESULTVERSION = 1
+STAGES = "decode", "render", "encode", "mux"
+
+
+def _videoInfo(videoPath: str):
+    """返回视频的 ((宽, 高), 帧率, 帧数)"""
+    videoCapt = vcapt(videoPath)
+    size = (
+        int(videoCapt.get(CAP_PROP_FRAME_WIDTH)),
+        int(videoCapt.get(CAP_PROP_FRAME_HEIGHT)),
+    )
+    fps = videoCapt.get(CAP_PROP_FPS)
+    frameCount = int(videoCapt.get(CAP_PROP_FRAME_COUNT))
+    videoCapt.release()
+    return size, fps, frameCount
+
+
+def _stageDecode(videoPath, stackPath, acqRate, ffmpeg):
+    """解码并缩小到字符网格大小，帧写入亮度帧栈供后续阶段使用，只计读取帧的时间"""
+    ffutils = FFCmdUtils(ffmpeg)
+    size, _, _ = _videoInfo(videoPath)
+    gridSize = _gridSize(size, acqRate)
+    decoder = ffutils.openDecoder(videoPath, gridSize) if ffutils.isReady() else None
+    if decoder is None:
+        videoCapt = vcapt(videoPath)
+        frames = _readFrames(videoCapt, gridSize)
+    else:
+        frames = iter(decoder)
+    lumaStack = LumaStack(stackPath, gridSize)
+    seconds = 0.0
+    while True:
+        started = perf_counter()
+        grid = next(frames, None)
+        seconds += perf_counter() - started
+        if grid is None:
+            break
+        lumaStack.append(grid)
+    if decoder is None:
+        videoCapt.release()
+    else:
+        decoder.close()
+    return dict(frames=lumaStack.finish(), seconds=seconds)
+
+
+def _stageRender(videoPath, stackPath):
+    """逐帧渲染为原尺寸字符图像，只计渲染时间"""
+    size, _, _ = _videoInfo(videoPath)
+    renderer = _getRenderer()
+    grids = LumaStack.load(stackPath)
+    image = None
+    started = perf_counter()
+    for grid in grids:
+        image = renderer.render(grid, size, image)
+    return dict(frames=len(grids), seconds=perf_counter() - started)
+
+
+def _stageEncode(videoPath, stackPath, savePath, ffmpeg, profile=None):
+    """渲染后写入编码器，只计写入及关闭编码器的时间，同时记录输出文件大小"""
+    ffutils = FFCmdUtils(ffmpeg)
+    size, fps, _ = _videoInfo(videoPath)
+    renderer = _getRenderer()
+    grids = LumaStack.load(stackPath)
+    seconds = 0.0
+    if ffutils.isReady():
+        encoder = ffutils.openEncoder(
+            savePath, size, fps, None, "h264", overwrite=True, profile=profile
+        )
+        write, close = encoder.write, encoder.close
+    else:
+        videoWrt = VideoWriter(savePath, VideoWriter_fourcc(*"MP42"), fps, size, True)
+        write = lambda image: videoWrt.write(cvtColor(image, COLOR_GRAY2BGR))
+        close = videoWrt.release
+    for grid in grids:
+        image = renderer.render(grid, size)
+        started = perf_counter()
+        write(image)
+        seconds += perf_counter() - started
+    started = perf_counter()
+    close()
+    seconds += perf_counter() - started
+    outBytes = os.path.getsize(savePath)
+    return dict(frames=len(grids), seconds=seconds, outBytes=outBytes)
+
+
+def _stageMux(videoPath, encodedPath, savePath, ffmpeg):
+    """从源视频中取音频流与编码后的字符视频封装，需要 ffmpeg"""
+    ffutils = FFCmdUtils(ffmpeg)
+    if not ffutils.isReady():
+        raise RuntimeError("找不到ffmpeg，无法测量音频封装。")
+    _, _, frameCount = _videoInfo(videoPath)
+    started = perf_counter()
+    if not ffutils.audioCodec(videoPath):
+        raise RuntimeError("源视频没有音频。")
+    ffutils.mux(encodedPath, videoPath, savePath, True)
+    return dict(frames=frameCount, seconds=perf_counter() - started)
+
+
+def _engineMakeVideo(videoPath, savePath, acqRate, ffmpeg, **kwdargs):
+    makeVideo(videoPath, savePath, acqRate, overwrite=True, **kwdargs)
+
+
+def _engineSave(videoPath, savePath, acqRate, ffmpeg, executor="processes", **kwdargs):
+    with vTools(ffmpeg=ffmpeg, executor=executor) as vt:
+        vt.open(videoPath)
+        vt.save(savePath, acqRate, overwrite=True, **kwdargs)
+
+
+def _engineBatch(videoPath, savePath, acqRate, ffmpeg, **kwdargs):
+    with BatchRunner(ffmpeg=ffmpeg, procNum=1) as runner:
+        runner.saveMany([(videoPath, savePath, dict(acqRate=acqRate, overwrite=True))])
+
+
+# 端到端转换方式：名称 -> (函数, 输出文件后缀, 额外参数)，新增的转换方式在此登记即可参与测量
+ENGINES = {
+    "makeVideo": (_engineMakeVideo, ".avi", dict()),
+    "makeVideo.legacy": (_engineMakeVideo, ".avi", dict(stream=False)),
+    "makeVideo.threads": (_engineMakeVideo, ".avi", dict(executor="threads")),
+    "makeVideo.inline": (_engineMakeVideo, ".avi", dict(executor="inline")),
+    "vTools.save": (_engineSave, ".mp4", dict()),
+    "vTools.save.threads": (_engineSave, ".mp4", dict(executor="threads")),
+    "vTools.save.inline": (_engineSave, ".mp4", dict(executor="inline")),
+    "vTools.save.delta": (_engineSave, ".mp4", dict(delta=True)),
+    "vTools.save.segments": (_engineSave, ".mp4", dict(segments=4)),
+    "vTools.save.legacy": (_engineSave, ".mp4", dict(stream=False)),
+    "BatchRunner": (_engineBatch, ".mp4", dict()),
+}
+# 默认不测量产生大量临时图片的旧转换方式，需要时可显式指定
+DEFAULTENGINES = tuple(name for name in ENGINES if not name.endswith(".legacy"))
+
+
+def _runEngine(name, videoPath, savePath, acqRate, ffmpeg):
+    """测量一种端到端转换方式，返回帧数及输出文件大小"""
+    func, _, kwdargs = ENGINES[name]
+    _, _, frameCount = _videoInfo(videoPath)
+    started = perf_counter()
+    func(videoPath, savePath, acqRate, ffmpeg, **kwdargs)
+    seconds = perf_counter() - started
+    if not os.path.isfile(savePath):
+        raise RuntimeError("没有生成输出文件。")
+    return dict(frames=frameCount, seconds=seconds, outBytes=os.path.getsize(savePath))
+
+
+def _record(video: str, name: str, result: dict) -> dict:
+    """整理一条测量结果，补充帧率"""
+    frames, seconds = result.get("frames"), result.get("seconds")
+    fps = frames / seconds if frames and seconds else None
+    record = dict(video=video, name=name, fps=fps)
+    record.update(result)
+    return record
+
+
+def environment(ffmpeg: str = None) -> dict:
+    """记录测量环境，只有相同环境下的结果才具有可比性"""
+    info = None if ffmpeg is None else ffmpegInfo(ffmpeg)
+    return dict(
+        time=strftime("%Y-%m-%d %H:%M:%S", localtime()),
+        platform=platform.platform(),
+        machine=platform.machine(),
+        cpus=os.cpu_count(),
+        effectiveCpus=effectiveCpus(),
+        python=platform.python_version(),
+        numpy=numpy.__version__,
+        opencv=cv2.__version__,
+        vidtoch=vidtoch.VERSION,
+        ffmpeg=ffmpeg,
+        ffmpegVersion=info["version"] if info else None,
+    )
+
+
+def runSuite(
+    workDir: str,
+    resolutions=("small", "sd", "hd"),
+    motions=MOTIONS,
+    frames: int = 100,
+    acqRate: float = 0.2,
+    engines=DEFAULTENGINES,
+    stages: bool = True,
+    ffmpeg: str = None,
+    quiet: bool = True,
+):
+    """
+    ### 运行基准测试，返回可直接保存为 JSON 的结果字典
+
+    每项测量都在新启动的进程中进行，记录帧率、耗时、内存峰值及临时磁盘占用峰值
+
+    ```
+    参数 workDir: str，工作目录，保存合成的测试视频及各项输出
+    参数 resolutions: tuple，测试视频的分辨率名称，可用值见 RESOLUTIONS，可忽略
+    参数 motions: tuple，测试视频的运动类型，可忽略
+    参数 frames: int，每个测试视频的帧数，可忽略
+    参数 acqRate: float，采集率，可忽略
+    参数 engines: tuple，要测量的端到端转换方式名称，可用值见 ENGINES，可忽略
+    参数 stages: bool，是否分别测量解码、渲染、编码、封装各阶段，有 ffmpeg 时还分别测量各编码配置，可忽略
+    参数 ffmpeg: str，ffmpeg可执行文件的路径，为 None 则自动查找，可忽略
+    参数 quiet: bool，是否屏蔽被测函数的输出，可忽略
+    ```
+    """
+    unknown = set(engines).difference(ENGINES)
+    if unknown:
+        raise ValueError(
+            f"未知的转换方式：{sorted(unknown)}，可用值为：{tuple(ENGINES)}。"
+        )
+    ffutils = FFCmdUtils(ffmpeg)
+    ffmpeg = ffutils.executable
+    videoDir = os.path.join(workDir, "videos")
+    outDir = os.path.join(workDir, "outputs")
+    tempRoot = os.path.join(workDir, "temp")
+    for dirPath in (videoDir, outDir, tempRoot):
+        os.makedirs(dirPath, exist_ok=True)
+    records = list()
+    for resolution in resolutions:
+        for motion in motions:
+            videoPath = synthesize(
+                videoDir, resolution, motion, frames, ffutils=ffutils
+            )
+            video = os.path.splitext(os.path.basename(videoPath))[0]
+            print(f"测量 {video} ...")
+            measured = list()
+            if stages:
+                stackPath = os.path.join(outDir, f"{video}.npy")
+                encodedPath = os.path.join(outDir, f"{video}.stage.mp4")
+                muxedPath = os.path.join(outDir, f"{video}.muxed.mp4")
+                stageArgs = dict(
+                    decode=(_stageDecode, videoPath, stackPath, acqRate, ffmpeg),
+                    render=(_stageRender, videoPath, stackPath),
+                    encode=(_stageEncode, videoPath, stackPath, encodedPath, ffmpeg),
+                    mux=(_stageMux, videoPath, encodedPath, muxedPath, ffmpeg),
+                )
+                for stage in STAGES:
+                    if stage == "mux" and ffmpeg is None:
+                        continue
+                    result = isolated(*stageArgs[stage], tempRoot=tempRoot, quiet=quiet)
+                    measured.append((f"stage.{stage}", result))
+                # 各编码配置的编码帧率及输出大小
+                for profile in ENCODERPROFILES if ffmpeg is not None else ():
+                    profilePath = os.path.join(outDir, f"{video}.{profile}.mp4")
+                    result = isolated(
+                        _stageEncode,
+                        videoPath,
+                        stackPath,
+                        profilePath,
+                        ffmpeg,
+                        profile,
+                        tempRoot=tempRoot,
+                        quiet=quiet,
+                    )
+                    measured.append((f"stage.encode.{profile}", result))
+            for name in engines:
+                savePath = os.path.join(outDir, f"{video}.{name}{ENGINES[name][1]}")
+                result = isolated(
+                    _runEngine,
+                    name,
+                    videoPath,
+                    savePath,
+                    acqRate,
+                    ffmpeg,
+                    tempRoot=tempRoot,
+                    quiet=quiet,
+                )
+                measured.append((name, result))
+            for name, result in measured:
+                record = _record(video, name, result)
+                records.append(record)
+                print(describe(record))
+    return dict(
+        version=RESULTVERSION,
+        environment=environment(ffmpeg),
+        params=dict(
+            resolutions=list(resolutions),
+            motions=list(motions),
+            frames=frames,
+            acqRate=acqRate,
+        ),
+        results=records,
+    )
+
+
+def describe(record: dict) -> str:
+    """将一条测量结果格式化为一行文本"""
+    if record.get("error"):
+        return f"  {record['name']:<28}失败：{record['error']}"
+    fps = record["fps"]
+    peak = record.get("peakRss")
+    line = "  {:<28}{:>9} fps{:>9.3f} s  内存峰值 {}  临时磁盘峰值 {:.1f} MB".format(
+        record["name"],
+        "-" if fps is None else f"{fps:.1f}",
+        record["seconds"],
+        "-" if peak is None else f"{peak / 1048576:.1f} MB",
+        record["tempBytes"] / 1048576,
+    )
+    if record.get("outBytes") is not None:
+        line += f"  输出 {record['outBytes'] / 1024:.1f} KB"
+    return line
+
+
+def save(results: dict, savePath: str):
+    with open(savePath, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+def load(filePath: str) -> dict:
+    with open(filePath, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.05):
+    """
+    ### 与基线结果逐项比较帧率
+
+    返回 [(视频, 名称, 基线帧率, 本次帧率, 比值, 是否变慢), ...]，比值小于 1 - threshold 视为变慢；只比较双方都成功测量的项目
+    """
+    if results.get("environment", {}).get("platform") != baseline.get(
+        "environment", {}
+    ).get("platform"):
+        print("警告：本次结果与基线的测量环境不同，比较结果仅供参考。")
+    baseFps = {
+        (record["video"], record["name"]): record["fps"]
+        for record in baseline.get("results", ())
+        if record.get("fps")
+    }
+    rows = list()
+    for record in results["results"]:
+        key = (record["video"], record["name"])
+        if not record.get("fps") or key not in baseFps:
+            continue
+        ratio = record["fps"] / baseFps[key]
+        rows.append((*key, baseFps[key], record["fps"], ratio, ratio < 1 - threshold))
+    return rows
+
+
+def cleanup(workDir: str):
+    """删除工作目录中的输出及临时文件，保留合成的测试视频以便下次直接使用"""
+    for dirName in ("outputs", "temp"):
+        shutil.rmtree(os.path.join(workDir, dirName), ignore_errors=True)
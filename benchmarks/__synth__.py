@@ -0,0 +1,174 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import math
+import os
+import struct
+import wave
+
+from cv2 import FILLED, VideoWriter, VideoWriter_fourcc, circle, rectangle
+from numpy import dstack, linspace, random, uint8
+
+MOTIONS = "static", "pan", "noise"
+RESOLUTIONS = dict(
+    small=(320, 180),
+    sd=(640, 360),
+    hd=(1280, 720),
+    fhd=(1920, 1080),
+)
+
+
+def _texture(width: int, height: int, seed: int):
+    """生成确定的测试底图：渐变背景上叠加若干随机位置、颜色的矩形和圆"""
+    rng = random.RandomState(seed)
+    horz = linspace(0, 255, width, dtype="float32")[None, :]
+    vert = linspace(0, 255, height, dtype="float32")[:, None]
+    image = dstack(
+        (
+            (horz * 0.7 + vert * 0.3).astype(uint8),
+            (horz * 0.3 + vert * 0.7).astype(uint8),
+            (255 - (horz + vert) / 2).astype(uint8),
+        )
+    ).copy()
+    unit = max(min(width, height) // 12, 2)
+    for _ in range(24):
+        x, y = int(rng.randint(0, width)), int(rng.randint(0, height))
+        color = tuple(int(c) for c in rng.randint(0, 256, 3))
+        if rng.rand() < 0.5:
+            corner = (
+                x + int(rng.randint(unit, unit * 3)),
+                y + int(rng.randint(unit, unit * 3)),
+            )
+            rectangle(image, (x, y), corner, color, FILLED)
+        else:
+            circle(image, (x, y), int(rng.randint(unit // 2, unit * 2)), color, FILLED)
+    return image
+
+
+def _frames(size: tuple, motion: str, frames: int, seed: int):
+    """按运动类型逐帧产出 BGR 帧"""
+    width, height = size
+    if motion == "static":
+        image = _texture(width, height, seed)
+        for _ in range(frames):
+            yield image
+    elif motion == "pan":
+        # 在两倍宽的底图上匀速平移取景，整段视频恰好平移一个画面宽度
+        image = _texture(width * 2, height, seed)
+        for frameNum in range(frames):
+            offset = frameNum * width // max(frames - 1, 1)
+            yield image[:, offset : offset + width]
+    elif motion == "noise":
+        rng = random.RandomState(seed)
+        for _ in range(frames):
+            yield rng.randint(0, 256, (height, width, 3)).astype(uint8)
+    else:
+        raise ValueError(f"参数motion的值无效，可用值为：{MOTIONS}。")
+
+
+def writeTone(savePath: str, seconds: float, rate: int = 44100, freq: float = 440.0):
+    """写入确定的单声道 16 位正弦波 wav 文件，用作测试视频的音轨"""
+    count = int(seconds * rate)
+    with wave.open(savePath, "wb") as wavFile:
+        wavFile.setnchannels(1)
+        wavFile.setsampwidth(2)
+        wavFile.setframerate(rate)
+        wavFile.writeframes(
+            b"".join(
+                struct.pack("<h", int(8000 * math.sin(2 * math.pi * freq * i / rate)))
+                for i in range(count)
+            )
+        )
+
+
+def synthesize(
+    saveDir: str,
+    resolution: str,
+    motion: str,
+    frames: int = 100,
+    fps: float = 25.0,
+    seed: int = 0,
+    ffutils=None,
+):
+    """
+    ### 生成确定的合成测试视频，返回视频文件路径
+
+    相同参数生成的帧完全相同，文件已存在则直接返回；给定可用的 FFCmdUtils 时附加正弦波音轨，使音频封装也能被测量
+
+    ```
+    参数 saveDir: str，视频保存目录
+    参数 resolution: str，分辨率名称，可用值见 RESOLUTIONS
+    参数 motion: str，运动类型，'static' 静止画面，'pan' 平移画面，'noise' 随机噪声
+    参数 frames: int，帧数，可忽略
+    参数 fps: float，帧率，可忽略
+    参数 seed: int，随机数种子，可忽略
+    参数 ffutils: FFCmdUtils，用于附加音轨，可忽略
+    ```
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"参数resolution的值无效，可用值为：{tuple(RESOLUTIONS)}。")
+    if motion not in MOTIONS:
+        raise ValueError(f"参数motion的值无效，可用值为：{MOTIONS}。")
+    withAudio = ffutils is not None and ffutils.isReady()
+    name = f"{resolution}_{motion}_{frames}f_{seed}"
+    savePath = os.path.join(saveDir, f"{name}{('.avi', '.mkv')[withAudio]}")
+    if os.path.isfile(savePath):
+        return savePath
+    size = RESOLUTIONS[resolution]
+    videoPath = os.path.join(saveDir, f"{name}.avi")
+    videoWrt = VideoWriter(videoPath, VideoWriter_fourcc(*"MJPG"), fps, size, True)
+    for frame in _frames(size, motion, frames, seed):
+        videoWrt.write(frame)
+    videoWrt.release()
+    if not withAudio:
+        return videoPath
+    tonePath = os.path.join(saveDir, f"{name}.wav")
+    writeTone(tonePath, frames / fps)
+    command = [
+        ffutils.executable,
+        "-nostats",
+        "-loglevel",
+        "quiet",
+        "-i",
+        videoPath,
+        "-i",
+        tonePath,
+        "-c:v",  # 视频流原样复制
+        "copy",
+        "-c:a",  # 音频编码为 aac，与常见视频一致
+        "aac",
+        "-shortest",
+        "-y",
+        savePath,
+    ]
+    success = ffutils.executeCmd(command)
+    os.remove(tonePath)
+    if not success:
+        return videoPath
+    os.remove(videoPath)
+    return savePath
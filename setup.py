@@ -23,8 +23,8 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     license="MIT License",
-    packages=find_packages(),
-    install_requires=["opencv-python", "imgtoch>=0.2.2"],
+    packages=find_packages(exclude=("benchmarks", "benchmarks.*")),
+    install_requires=["opencv-python", "numpy", "Pillow", "imgtoch>=0.2.2"],
     python_requires=">=3.7",
     classifiers=[
         "Intended Audience :: Developers",
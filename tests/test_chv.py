@@ -0,0 +1,130 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import io
+
+import numpy
+import pytest
+
+from vidtoch import CharRenderer, CharVideoReader, CharVideoWriter, TerminalPlayer
+from vidtoch.__player__ import _FrameSource
+
+GRIDSIZE = 7, 5  # (列数, 行数)
+FRAMES = 23
+
+
+def _indices(count: int = FRAMES, levels: int = 4, seed: int = 0):
+    """产出 count 个随机字形序号网格，相邻帧只有部分单元格变化"""
+    rng = numpy.random.default_rng(seed)
+    frame = rng.integers(0, levels, GRIDSIZE[::-1], numpy.uint8)
+    for _ in range(count):
+        changed = rng.random(frame.shape) < 0.3
+        frame = numpy.where(changed, (frame + 1) % levels, frame).astype(numpy.uint8)
+        yield frame
+
+
+@pytest.fixture
+def chv(tmp_path, request):
+    """写入一个多块的 .chv 文件，返回 (文件路径, 写入的各帧)"""
+    compression = getattr(request, "param", "zlib")
+    filePath = str(tmp_path / "clip.chv")
+    frames = list(_indices())
+    renderer = CharRenderer("#+. ")
+    with CharVideoWriter(
+        filePath, renderer, GRIDSIZE, 10.0, (70, 50), compression, blockFrames=5
+    ) as writer:
+        for frame in frames:
+            writer.append(frame)
+    return filePath, frames
+
+
+@pytest.mark.parametrize("chv", ["zlib", "lzma"], indirect=True)
+def test_round_trip(chv):
+    filePath, frames = chv
+    with CharVideoReader(filePath) as reader:
+        assert len(reader) == FRAMES
+        assert reader.gridSize == GRIDSIZE
+        assert reader.size == (70, 50)
+        assert reader.fps == 10.0
+        assert reader.chars == CharRenderer("#+. ").chars
+        for written, read in zip(frames, reader):
+            assert numpy.array_equal(written, read)
+
+
+def test_seeks_to_any_frame(chv):
+    filePath, frames = chv
+    with CharVideoReader(filePath) as reader:
+        # 跨块的乱序访问，每次都可能换入其他块
+        for frameNum in (FRAMES - 1, 0, 12, 4, 5, 19, 20, 3):
+            assert numpy.array_equal(reader[frameNum], frames[frameNum])
+        assert numpy.array_equal(reader[-1], frames[-1])
+        assert reader.time(FRAMES - 1) == pytest.approx((FRAMES - 1) / 10.0)
+        with pytest.raises(IndexError):
+            reader[FRAMES]
+
+
+def test_reads_frames_without_index(chv):
+    filePath, frames = chv
+    with open(filePath, "r+b") as file:
+        file.truncate(file.seek(0, 2) - 4)  # 破坏文件末尾的索引
+    with CharVideoReader(filePath) as reader:
+        assert len(reader) == FRAMES
+        assert numpy.array_equal(reader[-1], frames[-1])
+
+
+def test_render_matches_renderer(chv):
+    filePath, frames = chv
+    with CharVideoReader(filePath) as reader:
+        image = reader.render(FRAMES - 1)
+        expected = CharRenderer.scale(
+            reader.renderer().compose(frames[-1]), reader.size
+        )
+        assert numpy.array_equal(image, expected)
+
+
+def test_frame_source_skips_to_final_frame(chv):
+    filePath, frames = chv
+    source = _FrameSource(filePath)
+    try:
+        for _ in range(FRAMES - 2):
+            assert source.skip()
+        assert numpy.array_equal(source.read(), frames[-2])
+        assert source.skip()  # 跳过最后一帧
+        assert not source.skip()
+        assert source.read() is None
+    finally:
+        source.close()
+
+
+def test_player_counts_every_frame(chv):
+    filePath, _ = chv
+    out = io.StringIO()
+    player = TerminalPlayer(filePath, size=(7, 5), fps=1e6, budget=0, out=out)
+    stats = player.play()
+    assert stats["shown"] + stats["dropped"] == stats["frames"] == FRAMES
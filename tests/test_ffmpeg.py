@@ -0,0 +1,179 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import os
+import sys
+
+import pytest
+
+from vidtoch import FFCmdUtils, __ffmpeg__, ffmpegInfo
+from vidtoch.__ffmpeg__ import findExecutable
+
+pytestmark = pytest.mark.skipif(
+    os.name == "nt", reason="替身 ffmpeg 是以 #! 启动的脚本，Windows 不支持"
+)
+
+STUB = """#!{python}
+import sys
+with open({log!r}, "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+if "-encoders" in sys.argv:
+    sys.stderr.write("ffmpeg version {version} Copyright (c) 2000-2024\\n")
+    print("Encoders:")
+    print(" V..... = Video")
+    print(" ------")
+    print(" V....D mpeg4                MPEG-4 part 2")
+    print(" V....D libopenh264          OpenH264 H.264 / AVC (codec h264)")
+    print(" A....D aac                  AAC (Advanced Audio Coding)")
+elif "-pix_fmts" in sys.argv:
+    print("Pixel formats:")
+    print("I.... = Supported Input  format for conversion")
+    print("-----")
+    print("IO... yuv420p                3             12      8-8-8")
+    print("IO... gray                   1              8      8")
+"""
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    """在临时目录中生成替身 ffmpeg，并使用独立的缓存目录及空的进程内缓存"""
+    binDir = tmp_path / "bin"
+    binDir.mkdir()
+    log = tmp_path / "calls.log"
+    monkeypatch.setenv("VIDTOCH_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setenv("PATH", str(binDir))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(__ffmpeg__, "_FOUND", dict())
+    monkeypatch.setattr(__ffmpeg__, "_INFOS", dict())
+
+    def write(version: str = "6.1-stub"):
+        path = binDir / "ffmpeg"
+        path.write_text(
+            STUB.format(python=sys.executable, log=str(log), version=version)
+        )
+        path.chmod(0o755)
+        return str(path)
+
+    def calls() -> int:
+        return len(log.read_text().splitlines()) if log.exists() else 0
+
+    write()
+    return binDir / "ffmpeg", write, calls
+
+
+def test_find_executable_searches_path(stub):
+    path, _, _ = stub
+    assert findExecutable() == str(path)
+    assert findExecutable("ffprobe") is None
+
+
+def test_find_executable_prefers_current_directory(stub, tmp_path):
+    local = tmp_path / "ffmpeg"
+    local.write_text("#!/bin/sh\n")
+    local.chmod(0o755)
+    assert findExecutable() == str(local)
+
+
+def test_find_executable_rechecks_removed_file(stub):
+    path, write, _ = stub
+    assert findExecutable() == str(path)
+    path.unlink()
+    assert findExecutable() is None
+    write()
+    assert findExecutable() == str(path)
+
+
+def test_ffmpeg_info_parses_capabilities(stub):
+    path, _, calls = stub
+    info = ffmpegInfo()
+    assert info["path"] == str(path)
+    assert info["version"] == "6.1-stub"
+    assert info["encoders"] == dict(mpeg4="mpeg4", libopenh264="h264", aac="aac")
+    assert info["pixFmts"] == ["yuv420p", "gray"]
+    assert calls() == 2  # -encoders 及 -pix_fmts 各一次
+
+
+def test_ffmpeg_info_is_cached_in_process_and_on_disk(stub):
+    path, _, calls = stub
+    first = ffmpegInfo(str(path))
+    assert ffmpegInfo(str(path)) is first
+    assert calls() == 2
+    # 模拟新的进程：进程内缓存为空时从磁盘缓存读取，不再运行 ffmpeg
+    __ffmpeg__._INFOS.clear()
+    assert ffmpegInfo(str(path)) == first
+    assert calls() == 2
+    assert os.path.isfile(os.path.join(os.environ["VIDTOCH_CACHE"], "ffmpeg.json"))
+
+
+def test_ffmpeg_info_reprobes_replaced_executable(stub):
+    path, write, calls = stub
+    assert ffmpegInfo(str(path))["version"] == "6.1-stub"
+    write("7.0-upgraded")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert ffmpegInfo(str(path))["version"] == "7.0-upgraded"
+    assert calls() == 4
+    # 磁盘缓存同样已更新
+    __ffmpeg__._INFOS.clear()
+    assert ffmpegInfo(str(path))["version"] == "7.0-upgraded"
+    assert calls() == 4
+
+
+def test_ffmpeg_info_refresh_ignores_cache(stub):
+    path, _, calls = stub
+    ffmpegInfo(str(path))
+    ffmpegInfo(str(path), refresh=True)
+    assert calls() == 4
+
+
+def test_ffmpeg_info_ignores_other_cache_versions(stub):
+    path, _, calls = stub
+    ffmpegInfo(str(path))
+    cachePath = os.path.join(os.environ["VIDTOCH_CACHE"], "ffmpeg.json")
+    with open(cachePath, "w", encoding="utf-8") as file:
+        file.write('{"version": -1, "executables": {}}')
+    __ffmpeg__._INFOS.clear()
+    assert ffmpegInfo(str(path))["version"] == "6.1-stub"
+    assert calls() == 4
+
+
+def test_ffmpeg_info_without_ffmpeg(stub):
+    path, _, _ = stub
+    path.unlink()
+    assert ffmpegInfo() is None
+    assert ffmpegInfo(str(path)) is None
+
+
+def test_can_encode_uses_probed_capabilities(stub):
+    path, _, _ = stub
+    ffutils = FFCmdUtils(str(path))
+    assert ffutils.canEncode("h264", "yuv420p")
+    assert ffutils.canEncode("mpeg4", "gray")
+    assert not ffutils.canEncode("h264", "yuv444p")
+    assert not ffutils.canEncode("hevc")
@@ -0,0 +1,202 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+from cv2 import VideoCapture
+
+from vidtoch import FFCmdUtils, JobManifest, __utils__, vTools
+from vidtoch.__job__ import fingerprint
+
+SOURCE = dict(path="/videos/clip.mp4", fingerprint="0" * 40)
+PARAMS = dict(acqRate=0.2, chars=None, bitRate=None)
+PLAN = [(0.0, 10), (0.95, 10), (1.95, None)]
+CONVERTTASK = __utils__._convertTask
+
+
+def test_manifest_resumes_with_same_source_and_params(tmp_path):
+    savePath = str(tmp_path / "out.mp4")
+    job = JobManifest(savePath)
+    assert not job.load(SOURCE, PARAMS)
+    job.begin(SOURCE, PARAMS, PLAN)
+    job.complete(1)
+    assert os.path.isdir(job.partsDir)
+    assert job.partPath(1, ".mp4") == os.path.join(job.partsDir, "seg_1.mp4")
+    resumed = JobManifest(savePath)
+    assert resumed.load(SOURCE, PARAMS)
+    assert resumed.plan == PLAN
+    assert resumed.isDone(1) and not resumed.isDone(0)
+
+
+@pytest.mark.parametrize(
+    "source, params",
+    [
+        (dict(SOURCE, fingerprint="1" * 40), PARAMS),
+        (SOURCE, dict(PARAMS, acqRate=0.3)),
+    ],
+)
+def test_manifest_rejects_changed_source_or_params(tmp_path, source, params):
+    savePath = str(tmp_path / "out.mp4")
+    JobManifest(savePath).begin(SOURCE, PARAMS, PLAN)
+    assert not JobManifest(savePath).load(source, params)
+
+
+def test_manifest_rejects_other_versions(tmp_path):
+    job = JobManifest(str(tmp_path / "out.mp4"))
+    job.begin(SOURCE, PARAMS, PLAN)
+    with open(job.path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    manifest["version"] += 1
+    with open(job.path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    assert not JobManifest(job.path[: -len(".vidtoch.json")]).load(SOURCE, PARAMS)
+
+
+def test_begin_discards_old_parts_and_remove_cleans_up(tmp_path):
+    job = JobManifest(str(tmp_path / "out.mp4"))
+    job.begin(SOURCE, PARAMS, PLAN)
+    partPath = job.partPath(0, ".mp4")
+    open(partPath, "wb").close()
+    job.complete(0)
+    job.begin(SOURCE, PARAMS, PLAN)
+    assert not os.path.exists(partPath)
+    assert not job.done
+    job.remove()
+    assert not os.path.exists(job.path)
+    assert not os.path.exists(job.partsDir)
+
+
+def test_fingerprint_changes_with_content(tmp_path):
+    filePath = tmp_path / "clip.bin"
+    filePath.write_bytes(b"a" * 100)
+    before = fingerprint(str(filePath), 16)
+    filePath.write_bytes(b"a" * 99 + b"b")  # 只改动末尾
+    assert fingerprint(str(filePath), 16) != before
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    """用真实的 ffmpeg 生成一段 4 秒 10 帧/秒、每秒一个关键帧的视频，没有支持 h264 的 ffmpeg 时跳过"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        pytest.skip("找不到ffmpeg")
+    monkeypatch.setenv("VIDTOCH_CACHE", str(tmp_path / "cache"))
+    if not __utils__._h264Ready(FFCmdUtils(ffmpeg)):
+        pytest.skip("ffmpeg不支持h264编码")
+    videoPath = str(tmp_path / "source.mp4")
+    subprocess.run(
+        [
+            ffmpeg,
+            "-v",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=size=64x48:rate=10:duration=4",
+            "-g",
+            "10",
+            "-pix_fmt",
+            "yuv420p",
+            videoPath,
+        ],
+        check=True,
+    )
+    return videoPath
+
+
+def _interrupt(monkeypatch, failFrom: int):
+    """替换分段转换任务，记录转换的段序号，序号不小于 failFrom 的段直接失败"""
+    converted = list()
+
+    def task(args):
+        converted.append(args[0])
+        if args[0] >= failFrom:
+            return args[0], False
+        return CONVERTTASK(args)
+
+    monkeypatch.setattr(__utils__, "_convertTask", task)
+    return converted
+
+
+def _countFrames(videoPath: str) -> int:
+    capture, frames = VideoCapture(videoPath), 0
+    while capture.grab():
+        frames += 1
+    capture.release()
+    return frames
+
+
+@pytest.mark.parametrize(
+    "clip, frames", [(dict(), 40), (dict(start=1, end=3), 20)], ids=["full", "clip"]
+)
+def test_resume_converts_only_missing_segments(
+    tmp_path, monkeypatch, video, clip, frames
+):
+    savePath = str(tmp_path / "out.mp4")
+    vt = vTools(executor="inline", procNum=1).open(video)
+    options = dict(overwrite=True, resume=True, segments=4, **clip)
+    converted = _interrupt(monkeypatch, 2)
+    assert not vt.save(savePath, **options)
+    job = JobManifest(savePath)
+    with open(job.path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    plan = manifest["plan"]
+    assert len(plan) == 4
+    # 各段首尾相接，合计即需要转换的全部帧，没有终点时最后一段直到视频结尾
+    counts = [count for _, count in plan]
+    if clip:
+        assert sum(counts) == frames
+    else:
+        assert counts[-1] is None and sum(counts[:-1]) < frames
+    assert [start for start, _ in plan] == sorted(start for start, _ in plan)
+    assert manifest["done"] == [0, 1]
+    assert converted == [0, 1, 2]
+    converted = _interrupt(monkeypatch, len(plan))
+    assert vt.save(savePath, **options)
+    assert converted == [2, 3]
+    assert _countFrames(savePath) == frames
+    assert not os.path.exists(job.path)
+    assert not os.path.exists(job.partsDir)
+    vt.close()
+
+
+def test_changed_params_restart_the_job(tmp_path, monkeypatch, video):
+    savePath = str(tmp_path / "out.mp4")
+    vt = vTools(executor="inline", procNum=1).open(video)
+    _interrupt(monkeypatch, 2)
+    assert not vt.save(savePath, overwrite=True, resume=True, segments=4)
+    converted = _interrupt(monkeypatch, 4)
+    assert vt.save(savePath, 0.3, overwrite=True, resume=True, segments=4)
+    assert converted == [0, 1, 2, 3]
+    assert _countFrames(savePath) == 40
+    vt.close()
@@ -0,0 +1,217 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import json
+import os
+import sys
+
+import pytest
+
+from vidtoch import __media__, probeMedia
+from vidtoch.__media__ import _parseProbe
+
+pytestmark = pytest.mark.skipif(
+    os.name == "nt", reason="替身 ffprobe 是以 #! 启动的脚本，Windows 不支持"
+)
+
+STUB = """#!{python}
+import sys
+with open({log!r}, "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+if "-select_streams" in sys.argv:
+    with open({packets!r}) as packets:
+        sys.stdout.write(packets.read())
+else:
+    with open({streams!r}) as streams:
+        sys.stdout.write(streams.read())
+"""
+
+# 封面图片、音频流在视频流之前，视频流的序号为 2
+STREAMS = [
+    dict(
+        index=0,
+        codec_type="video",
+        codec_name="mjpeg",
+        disposition=dict(attached_pic=1),
+    ),
+    dict(index=1, codec_type="audio", codec_name="aac", bit_rate="128000"),
+    dict(
+        index=2,
+        codec_type="video",
+        codec_name="h264",
+        width=640,
+        height=360,
+        avg_frame_rate="30000/1001",
+        r_frame_rate="30000/1001",
+        duration="0.233567",
+        nb_frames="999",
+        bit_rate="2000000",
+    ),
+]
+FORMAT = dict(duration="0.240000", start_time="0.000000", bit_rate="2150000")
+# 数据包按解码顺序输出，B 帧使显示时间乱序，末尾的空行应被忽略
+PACKETS = """0.000000,K__
+0.133467,___
+0.066733,___
+0.033367,___
+0.100100,___
+0.200200,K__
+0.166833,___
+
+"""
+
+
+@pytest.fixture
+def ffprobe(tmp_path, monkeypatch):
+    """生成读取给定 JSON 及数据包文本的替身 ffprobe，返回 (写入函数, 调用记录函数)"""
+    monkeypatch.setenv("VIDTOCH_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setattr(__media__, "_MEDIA", dict())
+    log = tmp_path / "calls.log"
+    streamsPath, packetsPath = tmp_path / "streams.json", tmp_path / "packets.csv"
+    path = tmp_path / "ffprobe"
+    path.write_text(
+        STUB.format(
+            python=sys.executable,
+            log=str(log),
+            streams=str(streamsPath),
+            packets=str(packetsPath),
+        )
+    )
+    path.chmod(0o755)
+
+    def write(streams=STREAMS, fmt=FORMAT, packets=PACKETS):
+        streamsPath.write_text(json.dumps(dict(streams=streams, format=fmt)))
+        packetsPath.write_text(packets)
+        return str(path)
+
+    def calls():
+        return log.read_text().splitlines() if log.exists() else list()
+
+    return write, calls
+
+
+@pytest.fixture
+def video(tmp_path):
+    videoPath = tmp_path / "clip.mp4"
+    videoPath.write_bytes(b"\0" * 64)
+    return str(videoPath)
+
+
+def test_reads_metadata_from_video_stream_packets(ffprobe, video):
+    write, calls = ffprobe
+    media = probeMedia(video, write())
+    assert media["probe"] == "ffprobe"
+    assert (media["width"], media["height"]) == (640, 360)
+    assert media["fps"] == pytest.approx(29.97, abs=0.01)
+    # 帧数以数据包数为准，而不是容器记录的 nb_frames
+    assert media["frames"] == 7
+    assert media["exactFrames"]
+    assert media["keyframes"] == [0.0, 0.2002]
+    assert media["duration"] == pytest.approx(0.233567)
+    assert media["videoCodec"] == "h264"
+    assert media["audioCodec"] == "aac"
+    assert (media["bitRate"], media["videoBitRate"], media["audioBitRate"]) == (
+        2150,
+        2000,
+        128,
+    )
+    assert [stream["index"] for stream in media["streams"]] == [0, 1, 2]
+    streamsCall, packetsCall = calls()
+    assert "-show_streams" in streamsCall
+    # 只转储视频流的数据包，音频及封面的数据包不输出
+    assert "-select_streams 2 " in packetsCall
+    assert "-show_packets" not in packetsCall
+
+
+def test_result_is_cached_in_process_and_on_disk(ffprobe, video):
+    write, calls = ffprobe
+    ffprobe = write()
+    first = probeMedia(video, ffprobe)
+    assert probeMedia(video, ffprobe) is first
+    __media__._MEDIA.clear()
+    assert probeMedia(video, ffprobe) == first
+    assert len(calls()) == 2
+    probeMedia(video, ffprobe, refresh=True)
+    assert len(calls()) == 4
+
+
+def test_falls_back_to_container_frame_count(ffprobe, video):
+    write, _ = ffprobe
+    media = probeMedia(video, write(packets=""))
+    assert media["frames"] == 999
+    assert media["exactFrames"]
+    assert media["keyframes"] is None
+
+
+def test_estimates_frames_from_duration(ffprobe, video):
+    write, _ = ffprobe
+    streams = [dict(STREAMS[2], nb_frames="N/A", duration="N/A")]
+    media = probeMedia(video, write(streams, packets=""))
+    assert media["duration"] == pytest.approx(0.24)
+    assert media["frames"] == 7  # round(0.24 * 29.97)
+    assert not media["exactFrames"]
+    assert media["audioCodec"] == ""
+
+
+def test_estimates_video_bit_rate_without_stream_bit_rates(ffprobe, video):
+    write, _ = ffprobe
+    streams = [dict(stream) for stream in STREAMS]
+    for stream in streams:
+        stream.pop("bit_rate", None)
+    streams[1]["bit_rate"] = "128000"
+    media = probeMedia(video, write(streams))
+    assert media["videoBitRate"] == 2150 - 128
+
+
+def test_without_video_stream_falls_back_to_opencv(ffprobe, video):
+    write, calls = ffprobe
+    # 只有音频及封面图片时没有视频流，OpenCV 也无法打开替身文件
+    assert probeMedia(video, write(STREAMS[:2])) is None
+    assert len(calls()) == 1
+
+
+@pytest.mark.parametrize(
+    "stream, rotation, size",
+    [
+        (dict(tags=dict(rotate="90")), 90, (360, 640)),
+        (dict(side_data_list=[dict(rotation=-90)]), 90, (360, 640)),
+        (dict(side_data_list=[dict(rotation=90)]), 270, (360, 640)),
+        (dict(tags=dict(rotate="180")), 180, (640, 360)),
+        (dict(), 0, (640, 360)),
+    ],
+)
+def test_parse_rotation(stream, rotation, size):
+    media = _parseProbe(dict(streams=[dict(STREAMS[2], **stream)], format=FORMAT))
+    assert media["rotation"] == rotation
+    assert (media["width"], media["height"]) == size
+
+
+def test_parse_frame_rate_falls_back_to_r_frame_rate():
+    stream = dict(STREAMS[2], avg_frame_rate="0/0", r_frame_rate="25/1")
+    assert _parseProbe(dict(streams=[stream]))["fps"] == 25.0
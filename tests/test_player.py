@@ -0,0 +1,122 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import io
+
+import numpy
+import pytest
+
+from vidtoch import TerminalPlayer
+
+CURSORHOME = "\x1b[{};1H"
+
+
+def _frames(count: int, value: int = 0, shape: tuple = (16, 32)):
+    """产出 count 个亮度均为 value 的灰度帧"""
+    for _ in range(count):
+        yield numpy.full(shape, value, numpy.uint8)
+
+
+def _play(source, **kwdargs):
+    out = io.StringIO()
+    options = dict(size=(8, 4), fps=1000, budget=10, status=False)
+    options.update(kwdargs)
+    stats = TerminalPlayer(source, out=out, **options).play()
+    return stats, out.getvalue()
+
+
+def test_plays_every_frame_of_an_iterable():
+    stats, text = _play(_frames(5))
+    assert stats["frames"] == 5
+    assert stats["shown"] == 5
+    assert stats["dropped"] == 0
+    assert text.startswith("\x1b[?25l")
+    assert "\x1b[?25h" in text
+
+
+def test_draws_the_configured_grid():
+    _, text = _play(_frames(1, 255), size=(6, 3), chars="#. ")
+    rows = [text.split(CURSORHOME.format(row))[1][:6] for row in (1, 2, 3)]
+    # 亮度均匀的帧每行都是同一个字符
+    assert all(row == row[0] * 6 for row in rows)
+    assert CURSORHOME.format(4) not in text
+
+
+def test_invert_swaps_dark_and_bright():
+    _, bright = _play(_frames(1, 255), size=(1, 1), chars="#. ")
+    _, dark = _play(_frames(1, 255), size=(1, 1), chars="#. ", invert=False)
+    assert bright.split(CURSORHOME.format(1))[1][0] == "#"
+    assert dark.split(CURSORHOME.format(1))[1][0] == " "
+
+
+def test_redraws_only_changed_rows():
+    dark = numpy.zeros((16, 32), numpy.uint8)
+    half = dark.copy()
+    half[:8] = 255  # 只有上半部分变亮
+    _, text = _play([dark, dark, half])
+    # 首帧绘制全部 4 行，第二帧没有变化，第三帧只重绘上面 2 行
+    assert text.count(CURSORHOME.format(1)) == 2
+    assert text.count(CURSORHOME.format(2)) == 2
+    assert text.count(CURSORHOME.format(3)) == 1
+    assert text.count(CURSORHOME.format(4)) == 1
+
+
+def test_accepts_bgr_frames():
+    stats, _ = _play(_frames(3, 128, (16, 32, 3)))
+    assert stats["shown"] == 3
+
+
+def test_stops_at_max_frames():
+    out = io.StringIO()
+    player = TerminalPlayer(_frames(100), size=(8, 4), fps=1000, budget=10, out=out)
+    stats = player.play(maxFrames=7)
+    assert stats["frames"] == 7
+    assert stats["shown"] == 7
+
+
+def test_drops_frames_when_drawing_falls_behind():
+    # 帧率极高且不允许延迟，绘制必然落后，落后的帧应被跳过而不是绘制
+    stats, _ = _play(_frames(50), fps=1e6, budget=0)
+    assert stats["dropped"] > 0
+    assert stats["shown"] + stats["dropped"] == stats["frames"] == 50
+
+
+def test_status_line_reports_counts():
+    _, text = _play(_frames(3), status=True)
+    assert "已绘制 3" in text
+    assert "丢帧 0" in text
+
+
+def test_rejects_invalid_arguments():
+    with pytest.raises(TypeError):
+        TerminalPlayer(object(), out=io.StringIO()).play()
+    with pytest.raises(ValueError):
+        TerminalPlayer(_frames(1), fps=0)
+    with pytest.raises(ValueError):
+        TerminalPlayer(_frames(1), budget=-1)
@@ -0,0 +1,169 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import os
+
+import numpy
+import pytest
+from imgtoch import makeImage
+from PIL import Image
+
+from vidtoch import AtlasCache, CharRenderer, DeltaRenderer
+
+CHARS = "HdRQA#PXCFJIv?!+^-:. "
+
+
+def _grid(rows: int = 6, columns: int = 9):
+    """覆盖全部灰度范围的灰度网格"""
+    return (
+        numpy.linspace(0, 255, rows * columns)
+        .round()
+        .astype(numpy.uint8)
+        .reshape(rows, columns)
+    )
+
+
+def _baseline(grid, tmp_path, chars: str = CHARS):
+    """用 imgtoch 逐字绘制同一网格，不缩放，作为对比基准"""
+    imgPath, savePath = tmp_path / "grid.png", tmp_path / "chars.png"
+    Image.fromarray(grid).save(imgPath)
+    makeImage(str(imgPath), str(savePath), chars, keepRatio=False, keepSize=False)
+    return numpy.asarray(Image.open(savePath).convert("L"))
+
+
+def test_lut_matches_imgtoch_char_index():
+    renderer = CharRenderer(CHARS)
+    lenChars = len(CHARS)
+    expected = [round(gray / 255 * (lenChars - 1)) for gray in range(256)]
+    assert renderer.lut.tolist() == expected
+
+
+def test_render_matches_imgtoch(tmp_path):
+    grid = _grid()
+    image = CharRenderer(CHARS).render(grid)
+    assert numpy.array_equal(image, _baseline(grid, tmp_path))
+
+
+def test_render_matches_imgtoch_with_custom_chars(tmp_path):
+    grid = _grid(3, 5)
+    image = CharRenderer("@%*o. ").render(grid)
+    assert numpy.array_equal(image, _baseline(grid, tmp_path, "@%*o. "))
+
+
+def test_render_scales_to_size():
+    image = CharRenderer(CHARS).render(_grid(), (40, 30))
+    assert image.shape == (30, 40)
+
+
+def _sequence():
+    """依次为：首帧、相同帧、少量单元格变化、再次相同、大量单元格变化、网格大小变化"""
+    first = _grid()
+    few = first.copy()
+    few[1, 2], few[4, 7] = 255 - few[1, 2], 255 - few[4, 7]
+    many = 255 - first
+    return [first, first.copy(), few, few.copy(), many, _grid(4, 5)]
+
+
+@pytest.mark.parametrize("size", [None, (64, 48)])
+def test_delta_render_matches_full_render(size):
+    renderer = CharRenderer(CHARS)
+    delta = DeltaRenderer(renderer, size)
+    for grid in _sequence():
+        assert numpy.array_equal(delta.render(grid), renderer.render(grid, size))
+    assert delta.frames == 6
+    assert delta.framesSkipped == 2
+    # 少量变化的帧只重绘 2 个单元格，其余 52 个跳过
+    assert delta.cellsSkipped == 54 * 2 + 52
+
+
+def test_delta_render_keeps_earlier_frames_intact():
+    renderer = CharRenderer(CHARS)
+    delta = DeltaRenderer(renderer)
+    first, _, few, *_ = _sequence()
+    image = delta.render(first)
+    delta.render(few)  # 重绘画布上的部分单元格
+    assert numpy.array_equal(image, renderer.render(first))
+
+
+def test_cache_reuses_stored_atlas(tmp_path):
+    cache = AtlasCache(str(tmp_path))
+    built = CharRenderer(CHARS, cache=cache)
+    key = AtlasCache.key(CHARS, "", 14, 2, 2)
+    assert os.listdir(tmp_path) == [key]
+    loaded = CharRenderer(CHARS, cache=cache)
+    assert isinstance(loaded.atlas, numpy.memmap)
+    assert loaded.chars == built.chars
+    assert numpy.array_equal(loaded.lut, built.lut)
+    assert numpy.array_equal(loaded.atlas, built.atlas)
+
+
+def test_cache_key_changes_with_parameters():
+    key = AtlasCache.key(CHARS, "", 14, 2, 2)
+    assert AtlasCache.key(CHARS[::-1], "", 14, 2, 2) != key
+    assert AtlasCache.key(CHARS, "", 16, 2, 2) != key
+    assert AtlasCache.key(CHARS, "", 14, 3, 2) != key
+    assert AtlasCache.key(CHARS, "", 14, 2, 3) != key
+
+
+def test_cache_key_changes_when_font_file_changes(tmp_path):
+    fontPath = tmp_path / "font.ttf"
+    fontPath.write_bytes(b"\0" * 16)
+    key = AtlasCache.key(CHARS, str(fontPath), 14, 2, 2)
+    os.utime(fontPath, ns=(0, 10**9))
+    assert AtlasCache.key(CHARS, str(fontPath), 14, 2, 2) != key
+
+
+@pytest.mark.parametrize("damage", ["corrupt", "missing"])
+def test_damaged_cache_entry_is_rebuilt(tmp_path, damage):
+    cache = AtlasCache(str(tmp_path))
+    built = CharRenderer(CHARS, cache=cache)
+    key = AtlasCache.key(CHARS, "", 14, 2, 2)
+    atlasPath = tmp_path / key / "atlas.npy"
+    if damage == "corrupt":
+        atlasPath.write_bytes(b"not a numpy file")
+    else:
+        atlasPath.unlink()
+    assert cache.load(key) is None
+    assert not (tmp_path / key).exists()
+    rebuilt = CharRenderer(CHARS, cache=cache)
+    assert numpy.array_equal(rebuilt.atlas, built.atlas)
+    chars, lut, atlas = cache.load(key)
+    assert chars == built.chars
+    assert numpy.array_equal(atlas, built.atlas)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = AtlasCache(str(tmp_path), maxEntries=2)
+    keys = list()
+    for index, chars in enumerate(("ab", "cd", "ef")):
+        CharRenderer(chars, cache=cache)
+        keys.append(AtlasCache.key(chars, "", 14, 2, 2))
+        os.utime(tmp_path / keys[-1], (index, index))
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == sorted(keys[1:])
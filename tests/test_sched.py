@@ -0,0 +1,171 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import functools
+import os
+
+import pytest
+
+from vidtoch import __sched__, effectiveCpus
+from vidtoch.__sched__ import cgroupCpuLimit, planStages
+
+V2 = "0::/user.slice/app.scope\n"
+V1 = "12:cpu,cpuacct:/user.slice/app.scope\n11:memory:/user.slice\n"
+
+
+def _fakeCgroups(tmp_path, monkeypatch, procCgroup: str, files: dict):
+    """在临时目录中生成 cgroup 文件，并让 /proc/self/cgroup 读取给定内容，返回伪造的 cgroup 根目录"""
+    root = tmp_path / "cgroup"
+    root.mkdir()
+    for relPath, text in files.items():
+        filePath = root / relPath
+        filePath.parent.mkdir(parents=True, exist_ok=True)
+        filePath.write_text(text)
+    procPath = tmp_path / "self_cgroup"
+    procPath.write_text(procCgroup)
+    readText = __sched__._readText
+
+    def fakeRead(filePath: str):
+        if filePath == "/proc/self/cgroup":
+            filePath = str(procPath)
+        return readText(filePath)
+
+    monkeypatch.setattr(__sched__, "_readText", fakeRead)
+    return str(root)
+
+
+@pytest.mark.parametrize(
+    "procCgroup, files, limit",
+    [
+        # cgroup v2
+        (V2, {"cpu.max": "150000 100000\n"}, 1.5),
+        (V2, {"cpu.max": "max 100000\n"}, None),
+        (
+            V2,
+            {
+                "cpu.max": "max 100000",
+                "user.slice/cpu.max": "400000 100000",
+                "user.slice/app.scope/cpu.max": "50000 100000",
+            },
+            0.5,
+        ),
+        (V2, {"user.slice/cpu.max": "200000 100000"}, 2.0),
+        # 容器中挂载点即本容器的 cgroup，进程所在路径的目录并不存在
+        ("0::/docker/0123abcd\n", {"cpu.max": "250000 100000"}, 2.5),
+        # cgroup v1
+        (
+            V1,
+            {
+                "cpu,cpuacct/cpu.cfs_quota_us": "200000",
+                "cpu,cpuacct/cpu.cfs_period_us": "100000",
+            },
+            2.0,
+        ),
+        (V1, {"cpu/cpu.cfs_quota_us": "50000", "cpu/cpu.cfs_period_us": "100000"}, 0.5),
+        (V1, {"cpu/cpu.cfs_quota_us": "-1", "cpu/cpu.cfs_period_us": "100000"}, None),
+        (V1, {"cpu/cpu.cfs_quota_us": "100000"}, None),
+        # v2 没有配额时再读取 v1
+        (
+            V2 + V1,
+            {
+                "cpu.max": "max 100000",
+                "cpu/cpu.cfs_quota_us": "300000",
+                "cpu/cpu.cfs_period_us": "100000",
+            },
+            3.0,
+        ),
+        # 文件缺失或内容无法解析
+        (V2, {}, None),
+        ("", {}, None),
+        ("garbage\n1:cpu\n", {"cpu.max": "max"}, None),
+    ],
+    ids=[
+        "v2-quota",
+        "v2-max",
+        "v2-nested-min",
+        "v2-parent",
+        "v2-container",
+        "v1-combined",
+        "v1-cpu",
+        "v1-unlimited",
+        "v1-no-period",
+        "v2-max-v1-quota",
+        "missing",
+        "no-proc",
+        "malformed",
+    ],
+)
+def test_cgroup_cpu_limit(tmp_path, monkeypatch, procCgroup, files, limit):
+    root = _fakeCgroups(tmp_path, monkeypatch, procCgroup, files)
+    assert cgroupCpuLimit(root) == limit
+
+
+@pytest.mark.parametrize(
+    "affinity, quota, cpus",
+    [
+        (8, None, 8),
+        (8, "150000 100000", 2),
+        (8, "20000 100000", 1),
+        (2, "400000 100000", 2),
+        (8, "max 100000", 8),
+    ],
+)
+def test_effective_cpus(tmp_path, monkeypatch, affinity, quota, cpus):
+    files = dict() if quota is None else {"cpu.max": quota}
+    root = _fakeCgroups(tmp_path, monkeypatch, V2, files)
+    monkeypatch.setattr(
+        __sched__, "cgroupCpuLimit", functools.partial(cgroupCpuLimit, root)
+    )
+    monkeypatch.setattr(
+        os, "sched_getaffinity", lambda pid: set(range(affinity)), raising=False
+    )
+    assert effectiveCpus() == cpus
+
+
+COSTS = dict(decode=1.0, render=3.0, encode=1.0)
+
+
+@pytest.mark.parametrize(
+    "costs, cpus, limits, plan",
+    [
+        (COSTS, 3, None, dict(decode=1, render=1, encode=1)),
+        # 少于阶段数时每个阶段仍有 1 个
+        (COSTS, 1, None, dict(decode=1, render=1, encode=1)),
+        (COSTS, 5, None, dict(decode=1, render=3, encode=1)),
+        # 瓶颈阶段每帧耗时相同时先分给排在前面的阶段
+        (COSTS, 6, None, dict(decode=2, render=3, encode=1)),
+        (COSTS, 8, None, dict(decode=2, render=4, encode=2)),
+        # 瓶颈阶段已达上限，再分给其他阶段也无用
+        (COSTS, 8, dict(render=2), dict(decode=1, render=2, encode=1)),
+        (dict(decode=1.0, render=0.1), 4, dict(decode=1), dict(decode=1, render=1)),
+        (dict(render=1.0), 4, None, dict(render=4)),
+    ],
+)
+def test_plan_stages(costs, cpus, limits, plan):
+    assert planStages(costs, cpus, limits) == plan
@@ -0,0 +1,492 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import asyncio
+import os
+import shutil
+import tempfile
+from asyncio.subprocess import PIPE
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+
+from numpy import ascontiguousarray, frombuffer, uint8
+
+from .__metrics__ import Metrics
+from .__sched__ import effectiveCpus
+from .__utils__ import (
+    NONETYPE,
+    FFCmdUtils,
+    _charImage,
+    _checkObservers,
+    _checkProcNum,
+    _checkSaveExt,
+    _clearObstacle,
+    _getRenderer,
+    _gridSize,
+    _h264Ready,
+    _report,
+    _sourceBitRate,
+)
+
+
+async def _result(value):
+    """父类方法返回协程时等待其结果，提前返回的普通值原样返回"""
+    if asyncio.iscoroutine(value):
+        return await value
+    return value
+
+
+async def _kill(process):
+    """结束尚未退出的子进程并等待其退出"""
+    if process is not None and process.returncode is None:
+        process.kill()
+        await process.wait()
+
+
+class AsyncFFEncoder:
+    """
+    ### 异步 ffmpeg 编码管道
+
+    与 FFEncoder 相同，但写入时等待管道缓冲区排空而不阻塞事件循环
+
+    请通过 AsyncFFCmdUtils.openEncoder 方法创建，使用 async with 语句启动及关闭，语句块中出现异常(包括任务被取消)时直接结束 ffmpeg 进程
+    """
+
+    def __init__(self, command):
+        self.__command = command
+        self.__proc = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, excType, excValue, excTB):
+        if excType is None:
+            await self.close()
+        else:
+            await self.kill()
+
+    async def start(self):
+        """启动 ffmpeg 进程"""
+        self.__proc = await asyncio.create_subprocess_exec(
+            *self.__command, stdin=PIPE, startupinfo=FFCmdUtils.STARTUP
+        )
+        return self
+
+    async def write(self, frame) -> bool:
+        """写入一帧，帧的尺寸及像素格式须与创建编码管道时指定的一致"""
+        try:
+            self.__proc.stdin.write(ascontiguousarray(frame).tobytes())
+            await self.__proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            return False
+        return True
+
+    async def close(self) -> bool:
+        """关闭输入并等待 ffmpeg 编码结束，返回编码是否成功"""
+        try:
+            self.__proc.stdin.close()
+            await self.__proc.stdin.wait_closed()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        return not await self.__proc.wait()
+
+    async def kill(self):
+        """立即结束 ffmpeg 进程"""
+        await _kill(self.__proc)
+
+
+class AsyncFFDecoder:
+    """
+    ### 异步 ffmpeg 解码管道
+
+    与 FFDecoder 相同，但以 async for 逐帧读取，等待数据时不阻塞事件循环
+
+    请通过 AsyncFFCmdUtils.openDecoder 方法创建，使用 async with 语句启动及关闭
+    """
+
+    def __init__(self, command, size: tuple, channels: int):
+        self.__command = command
+        self.__size = width, height = size
+        self.__shape = (height, width) if channels == 1 else (height, width, channels)
+        self.__frameBytes = width * height * channels
+        self.__finished = False
+        self.__proc = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, excType, excValue, excTB):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self.read()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    @property
+    def size(self):
+        """输出帧的 (宽, 高)"""
+        return self.__size
+
+    async def start(self):
+        """启动 ffmpeg 进程"""
+        self.__proc = await asyncio.create_subprocess_exec(
+            *self.__command, stdout=PIPE, startupinfo=FFCmdUtils.STARTUP
+        )
+        return self
+
+    async def read(self):
+        """读取下一帧，已无帧可读时返回 None"""
+        try:
+            buffer = await self.__proc.stdout.readexactly(self.__frameBytes)
+        except asyncio.IncompleteReadError:
+            self.__finished = True
+            return None
+        return frombuffer(buffer, uint8).reshape(self.__shape)
+
+    async def close(self) -> bool:
+        """结束 ffmpeg 进程，返回解码是否正常结束，未读完即关闭视为提前终止"""
+        if self.__proc is None:
+            return False
+        if not self.__finished and self.__proc.returncode is None:
+            self.__proc.kill()
+        # 读取端暂停读取时管道不会断开，进程退出后也等不到结束，须先读完剩余数据
+        await self.__proc.stdout.read()
+        return not await self.__proc.wait()
+
+
+class AsyncFFCmdUtils(FFCmdUtils):
+    """
+    ### FFCmdUtils 的异步版本
+
+    mux, demux, convert, combine, extract 是协程，参数及返回值与 FFCmdUtils 相同，ffmpeg 以 asyncio 子进程运行，不占用线程
+
+    等待中的协程被取消时会结束对应的 ffmpeg 进程；openEncoder, openDecoder 返回异步编解码管道；其余方法仍为同步方法
+    """
+
+    ENCODER, DECODER = AsyncFFEncoder, AsyncFFDecoder
+
+    def executeCmd(self, cmd):
+        return self.runCmd(cmd)
+
+    @staticmethod
+    async def runCmd(cmd) -> bool:
+        """以子进程运行命令并等待其结束，返回是否成功，被取消时结束子进程"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, startupinfo=FFCmdUtils.STARTUP
+            )
+        except Exception:
+            return False
+        try:
+            return not await process.wait()
+        finally:
+            await _kill(process)
+
+    async def mux(self, videoPath, audioPath, *args, codec=None, **kwdargs):
+        if codec is None and isinstance(audioPath, str):
+            # 读取音频编码要运行 ffprobe，放到线程池中，不阻塞事件循环
+            loop = asyncio.get_running_loop()
+            codec = await loop.run_in_executor(None, self.audioCodec, audioPath)
+            codec = codec or ""  # 无法读取时按没有音频处理，原样复制
+        return await _result(
+            super().mux(videoPath, audioPath, *args, codec=codec, **kwdargs)
+        )
+
+    async def demux(self, *args, **kwdargs):
+        return await _result(super().demux(*args, **kwdargs))
+
+    async def convert(self, *args, **kwdargs):
+        return await _result(super().convert(*args, **kwdargs))
+
+    async def combine(self, *args, **kwdargs):
+        return await _result(super().combine(*args, **kwdargs))
+
+    async def extract(self, *args, **kwdargs):
+        return await _result(super().extract(*args, **kwdargs))
+
+
+class AsyncConverter:
+    def __init__(self, chars: str = None, ffmpeg: str = None, procNum=None):
+        """
+        ### 异步字符视频转换器，需要 ffmpeg
+
+        解码、编码由 asyncio 子进程完成，渲染交给共用的进程池，同一事件循环中可同时等待任意多个转换，不为每个转换创建线程
+
+        取消转换任务时会结束其 ffmpeg 进程、撤销尚未开始的渲染任务并删除临时文件
+
+        请确保你的程序运行入口处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果
+
+        ```
+        参数 chars: str，生成的视频要使用的字符，可忽略
+        参数 ffmpeg: str，ffmpeg可执行文件的路径，为 None 则在当前目录或环境变量中查找，可忽略
+        参数 procNum: int，渲染进程池的进程数，所有转换共用，默认及为'auto'时是容器配额等限制下实际可用的cpu数，可忽略
+        ```
+        """
+        if chars is not None:
+            if not isinstance(chars, str):
+                raise TypeError("参数chars的值必须是字符串类型。")
+            if len(chars) < 2:
+                raise ValueError("参数chars的值字符个数不能少于2个。")
+        if not isinstance(ffmpeg, (str, NONETYPE)):
+            raise TypeError("参数ffmpeg的值必须是字符串类型。")
+        procNum, _ = _checkProcNum(procNum, effectiveCpus())
+        self.ffutils = AsyncFFCmdUtils(ffmpeg)
+        if not self.ffutils.isReady():
+            raise RuntimeError("找不到ffmpeg，无法使用异步转换。")
+        if not _h264Ready(self.ffutils):
+            raise RuntimeError("ffmpeg不支持h264编码，无法使用异步转换。")
+        self.__chars = chars
+        self.__procNum = procNum
+        # 事件循环运行后已有子进程监视线程等，fork 出的工作进程可能因继承的锁而卡死，因此以 spawn 方式启动
+        self.__executor = ProcessPoolExecutor(
+            procNum, get_context("spawn"), _getRenderer, (chars,)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, excTB):
+        self.close()
+
+    def close(self):
+        """关闭渲染进程池，不等待进程退出"""
+        self.__executor.shutdown(wait=False)
+
+    async def save(
+        self,
+        videoPath: str,
+        savePath: str,
+        acqRate: float = 0.2,
+        bitRate: int = None,
+        overwrite: bool = False,
+        window: int = None,
+    ) -> bool:
+        """
+        ### 保存为字符视频，返回是否成功
+
+        ```
+        参数 videoPath: str，源视频文件路径
+        参数 savePath：str，生成的视频的保存路径，包括文件名
+        参数 acqRate: float，对原视频的采集率，0 < acqRate <= 1，值越大视频越清晰字体越小，可忽略
+        参数 bitRate: int，生成的视频的码率，默认单位为k，可忽略
+        参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 window: int，同时在途的最大帧数，默认是进程数*2，可忽略
+        ```
+        """
+        return await self.__run(
+            videoPath, savePath, acqRate, bitRate, overwrite, window, None
+        )
+
+    async def progress(
+        self,
+        videoPath: str,
+        savePath: str,
+        acqRate: float = 0.2,
+        bitRate: int = None,
+        overwrite: bool = False,
+        window: int = None,
+        interval: float = 1.0,
+    ):
+        """
+        ### 保存为字符视频，并以异步迭代器逐个产出事件
+
+        参数同 save 方法，interval 为进度事件的最小间隔(秒)；事件格式见 Metrics，最后一个事件是 finish
+
+        转换开始前即结束时(如已有同名文件且 overwrite 为 False)不产出事件，参数错误、源视频无法打开等异常在迭代时抛出
+
+        提前退出 async for 或取消正在迭代的任务即取消转换
+        """
+        queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            self.__run(
+                videoPath,
+                savePath,
+                acqRate,
+                bitRate,
+                overwrite,
+                window,
+                (queue.put_nowait,),
+                interval,
+            )
+        )
+        try:
+            # 转换可能在发出任何事件之前就已结束，须同时等待事件及转换任务
+            while not (task.done() and queue.empty()):
+                getter = asyncio.ensure_future(queue.get())
+                try:
+                    done, _ = await asyncio.wait(
+                        (getter, task), return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if getter not in done:
+                    continue  # 任务已结束，取出剩余的事件后退出
+                event = getter.result()
+                yield event
+                if event["event"] == "finish":
+                    break
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def __run(
+        self,
+        videoPath: str,
+        savePath: str,
+        acqRate: float,
+        bitRate: int,
+        overwrite: bool,
+        window: int,
+        observers,
+        interval: float = 1.0,
+    ) -> bool:
+        if not isinstance(videoPath, str):
+            raise TypeError("参数videoPath的值数据类型必须是字符串。")
+        if not isinstance(savePath, str):
+            raise TypeError("参数savePath的值必须是字符串类型。")
+        _checkSaveExt(savePath)
+        if not isinstance(acqRate, (int, float)):
+            raise TypeError("参数acqRate的值必须是整型或浮点型。")
+        if not (0 < acqRate <= 1):
+            raise ValueError("参数acqRate的值必须大于0小于等于1。")
+        if not isinstance(bitRate, (int, NONETYPE)):
+            raise TypeError("参数bitRate的值必须是整型数据。")
+        if not isinstance(window, (int, NONETYPE)):
+            raise TypeError("参数window的值必须是整型数据。")
+        if window is not None and window < 1:
+            raise ValueError("参数window的值必须大于0。")
+        observers = _checkObservers(observers)
+        # 读取元数据需要扫描数据包，放到线程中进行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        media = await loop.run_in_executor(None, self.ffutils.probe, videoPath)
+        if media is None:
+            raise ValueError("源视频文件无法打开，请检查路径是否正确或其他问题。")
+        size = media["width"], media["height"]
+        fps, frameCount = media["fps"], media["frames"] or 0
+        if os.path.exists(savePath):
+            if not overwrite:
+                print("已有同名文件或目录且参数overwrite值为'False'，生成中断。")
+                return False
+            _clearObstacle(savePath)
+        if bitRate is None:
+            bitRate = _sourceBitRate(media, videoPath)
+        metrics = None
+        if observers:
+            metrics = Metrics(observers, videoPath, savePath, frameCount, interval)
+            metrics.emit("start", frames=frameCount, fps=fps, size=list(size))
+        success = False
+        try:
+            success = await self.__convert(
+                videoPath,
+                savePath,
+                size,
+                fps,
+                acqRate,
+                bitRate,
+                window or self.__procNum * 2,
+                metrics,
+            )
+        except BaseException as err:
+            if metrics is not None:
+                metrics.emit("error", message=repr(err))
+            raise
+        finally:
+            if metrics is not None:
+                metrics.finish(success)
+        return success
+
+    async def __convert(
+        self, videoPath, savePath, size, fps, acqRate, bitRate, window, metrics
+    ) -> bool:
+        """解码、渲染、编码同时进行，最后封装源视频的音频"""
+        loop = asyncio.get_running_loop()
+        tempDir = tempfile.mkdtemp()
+        vidTmpFullPath = os.path.join(tempDir, os.path.basename(savePath))
+        decoder = self.ffutils.openDecoder(
+            videoPath, _gridSize(size, acqRate, self.__chars)
+        )
+        encoder = self.ffutils.openEncoder(
+            vidTmpFullPath, size, fps, bitRate, "h264", overwrite=True
+        )
+        pending = deque()
+        try:
+            await decoder.start()
+            await encoder.start()
+            async for grid in decoder:
+                if metrics is not None:
+                    metrics.counters["decoded"] += 1
+                pending.append(
+                    loop.run_in_executor(
+                        self.__executor, _charImage, grid, size, self.__chars
+                    )
+                )
+                if len(pending) >= window:
+                    if not await self.__write(encoder, pending, metrics):
+                        return False
+            while pending:
+                if not await self.__write(encoder, pending, metrics):
+                    return False
+            if not await decoder.close():
+                _report("ffmpeg解码异常结束，生成中断。", metrics)
+                return False
+            if not await encoder.close():
+                return False
+            # 直接从源视频中取音频流封装，源视频没有音频时只复制视频流
+            return await self.ffutils.mux(vidTmpFullPath, videoPath, savePath, True)
+        finally:
+            # 正常结束时两个进程均已退出，出错或被取消时在此结束
+            for future in pending:
+                future.cancel()
+            await decoder.close()
+            await encoder.kill()
+            shutil.rmtree(tempDir, ignore_errors=True)
+
+    @staticmethod
+    async def __write(encoder: AsyncFFEncoder, pending: deque, metrics) -> bool:
+        """等待最早提交的一帧渲染完成并写入编码器"""
+        image = await pending.popleft()
+        if metrics is None:
+            return await encoder.write(image)
+        metrics.counters["rendered"] += 1
+        started = perf_counter()
+        success = await encoder.write(image)
+        metrics.encoded(perf_counter() - started, image.nbytes)
+        return success
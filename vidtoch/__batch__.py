@@ -0,0 +1,310 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+from queue import SimpleQueue
+from time import perf_counter
+
+from cv2 import VideoCapture as vcapt
+from cv2 import VideoWriter, VideoWriter_fourcc
+
+from .__media__ import probeMedia
+from .__sched__ import effectiveCpus
+from .__utils__ import (
+    NONETYPE,
+    FFCmdUtils,
+    _checkProfile,
+    _checkSaveExt,
+    _checkProcNum,
+    _clearObstacle,
+    _convertSegment,
+    _cv2Writer,
+    _frameRate,
+    _getRenderer,
+    _gridSize,
+    _h264Ready,
+    _readFrames,
+    _renderInline,
+    _sourceBitRate,
+    _streamOptions,
+)
+
+JOBPARAMS = (
+    "acqRate",
+    "bitRate",
+    "chars",
+    "overwrite",
+    "delta",
+    "color",
+    "palette",
+    "profile",
+    "targetFps",
+)
+
+
+def _warmUp(chars: str = None):
+    """进程池初始化函数，预先构建字形图集，之后的每个视频都不必再付出这部分开销"""
+    _getRenderer(chars)
+
+
+def _saveClip(
+    ffmpeg: str,
+    videoPath: str,
+    savePath: str,
+    acqRate: float = 0.2,
+    bitRate: int = None,
+    chars: str = None,
+    overwrite: bool = False,
+    delta: bool = False,
+    color: bool = False,
+    palette: int = None,
+    profile: str = None,
+    targetFps: float = None,
+):
+    """在工作进程中完整转换一个视频，返回 (是否成功, 实际写入的帧数)，失败时帧数为 0"""
+    if os.path.exists(savePath):
+        if not overwrite:
+            raise FileExistsError("已有同名文件或目录且参数overwrite值为'False'。")
+        _clearObstacle(savePath)
+    media = probeMedia(videoPath, FFCmdUtils.detProbe(ffmpeg))
+    if media is None:
+        raise ValueError("源视频文件无法打开。")
+    size = media["width"], media["height"]
+    outFps, ratio = _frameRate(media["fps"], targetFps)
+    if ffmpeg is None:
+        videoCapt = vcapt(videoPath)
+        fourcc = VideoWriter_fourcc(*"MP42")
+        videoWrt = VideoWriter(savePath, fourcc, outFps, size, True)
+        if not videoWrt.isOpened():
+            videoCapt.release()
+            raise OSError("视频写入失败，检查保存位置是否存在及是否有写入权限。")
+        gridSize = _gridSize(size, acqRate, chars)
+        grids = _readFrames(videoCapt, gridSize, color, ratio)
+        write, written = _cv2Writer(videoWrt, color), 0
+        try:
+            for image in _renderInline(grids, size, chars, delta, palette):
+                write(image)
+                written += 1
+        finally:
+            videoWrt.release()
+            videoCapt.release()
+        # OpenCV 写入单帧时不报告错误，以是否写出了帧及生成了文件作为结果
+        if not written or not os.path.isfile(savePath):
+            return False, 0
+        return True, written
+    if bitRate is None and profile is None:
+        bitRate = _sourceBitRate(media, videoPath)
+    tempDir = tempfile.mkdtemp()
+    try:
+        vidTmpFullPath = os.path.join(tempDir, os.path.basename(savePath))
+        success, written = _convertSegment(
+            ffmpeg,
+            videoPath,
+            vidTmpFullPath,
+            (0, None),
+            size,
+            outFps,
+            bitRate,
+            acqRate,
+            chars,
+            delta,
+            color,
+            palette,
+            profile,
+            ratio,
+        )
+        if not success:
+            return False, 0
+        # 直接从源视频中取音频流封装，源视频没有音频时只复制视频流
+        if not FFCmdUtils(ffmpeg).mux(vidTmpFullPath, videoPath, savePath, True):
+            return False, 0
+        return True, written
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+
+def _failed(index: int, videoPath: str, savePath: str, err: Exception = None):
+    """转换失败的任务结果，err 为导致失败的异常"""
+    return dict(
+        index=index,
+        source=videoPath,
+        dest=savePath,
+        success=False,
+        frames=0,
+        seconds=0.0,
+        error=None if err is None else f"{type(err).__name__}: {err}",
+    )
+
+
+def _convertClip(task: tuple):
+    """进程池的任务包装，返回记录转换结果及耗时的字典，转换中的异常记录在结果中而不抛出"""
+    index, ffmpeg, videoPath, savePath, params = task
+    result = _failed(index, videoPath, savePath)
+    started = perf_counter()
+    try:
+        result["success"], result["frames"] = _saveClip(
+            ffmpeg, videoPath, savePath, **params
+        )
+    except Exception as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+    result["seconds"] = perf_counter() - started
+    return result
+
+
+class BatchRunner:
+    def __init__(self, chars: str = None, ffmpeg: str = None, procNum=None):
+        """
+        ### 批量转换字符视频
+
+        整个批次共用一个常驻进程池及一份 ffmpeg 配置，每个工作进程每次独立完成一个视频的解码、渲染、编码及音频封装
+
+        适合大量短视频：进程池启动、字形图集构建等开销只付出一次，同时在转换的视频数不超过进程数
+
+        请确保你的程序运行入口处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果
+
+        ```
+        参数 chars: str，默认使用的字符，各任务可在参数中单独指定，可忽略
+        参数 ffmpeg: str，ffmpeg可执行文件的路径，为 None 则在当前目录或环境变量中查找，找不到则生成的文件无声音，可忽略
+        参数 procNum: int，进程数，即同时转换的最大视频数，默认及为'auto'时是容器配额等限制下实际可用的cpu数，可忽略
+        ```
+        """
+        if chars is not None:
+            if not isinstance(chars, str):
+                raise TypeError("参数chars的值必须是字符串类型。")
+            if len(chars) < 2:
+                raise ValueError("参数chars的值字符个数不能少于2个。")
+        if not isinstance(ffmpeg, (str, NONETYPE)):
+            raise TypeError("参数ffmpeg的值必须是字符串类型。")
+        procNum, _ = _checkProcNum(procNum, effectiveCpus())
+        self.__chars = chars
+        ffutils = FFCmdUtils(ffmpeg)
+        self.__ffmpeg = ffutils.executable
+        if self.__ffmpeg is not None and not _h264Ready(ffutils):
+            print("ffmpeg不支持h264编码，使用OpenCV合成，生成的视频没有声音。")
+            self.__ffmpeg = None
+        self.__procNum = procNum
+        self.__pool = Pool(procNum, _warmUp, (chars,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close(excType is not None)
+
+    def __task(self, index: int, job):
+        """检查一个任务并整理为 _convertClip 的参数"""
+        if not isinstance(job, (tuple, list)) or len(job) not in (2, 3):
+            raise TypeError(
+                "任务必须是 (源视频路径, 保存路径) 或 (源视频路径, 保存路径, 参数字典)。"
+            )
+        videoPath, savePath, params = (*job, None)[:3]
+        if not isinstance(videoPath, str) or not isinstance(savePath, str):
+            raise TypeError("任务中的源视频路径及保存路径必须是字符串。")
+        params = dict(params or ())
+        unknown = set(params).difference(JOBPARAMS)
+        if unknown:
+            raise ValueError(
+                f"任务参数无效：{sorted(unknown)}，可用参数为：{JOBPARAMS}。"
+            )
+        params.setdefault("chars", self.__chars)
+        # 借用 vTools.save 的检查，彩色模式与增量渲染不能同时使用等
+        _streamOptions(
+            True,
+            None,
+            params.get("delta"),
+            1,
+            color=params.get("color"),
+            palette=params.get("palette"),
+            targetFps=params.get("targetFps"),
+        )
+        _checkProfile(params.get("profile"))
+        _checkSaveExt(savePath)
+        if self.__ffmpeg is None and os.path.splitext(savePath)[1] != ".avi":
+            raise ValueError("找不到ffmpeg时保存路径中文件名需为'.avi'后缀。")
+        return index, self.__ffmpeg, videoPath, savePath, params
+
+    def imap(self, jobs):
+        """
+        ### 逐个提交任务并按完成先后产出结果
+
+        jobs 可以是列表或迭代器，每个任务为 (源视频路径, 保存路径) 或 (源视频路径, 保存路径, 参数字典)
+
+        参数字典可包含 acqRate, bitRate, chars, overwrite, delta, color, palette, profile, targetFps，含义同 vTools.save
+
+        每个结果是一个字典：index 任务序号，source, dest 路径，success 是否成功，frames 帧数，seconds 耗时(秒)，error 失败原因
+
+        参数无效的任务不会中断整个批次，同样以 success 为 False 的结果产出，error 中记录原因
+        """
+        if self.__pool is None:
+            raise RuntimeError("BatchRunner已关闭。")
+        finished = SimpleQueue()
+        pending = 0
+        for index, job in enumerate(jobs):
+            try:
+                task = self.__task(index, job)
+            except (TypeError, ValueError) as err:
+                paths = job if isinstance(job, (tuple, list)) else ()
+                source, dest = (*paths, None, None)[:2]
+                yield _failed(index, source, dest, err)
+                continue
+            if pending >= self.__procNum * 2:
+                yield finished.get()
+                pending -= 1
+            self.__pool.apply_async(
+                _convertClip,
+                (task,),
+                callback=finished.put,
+                error_callback=lambda err, task=task: finished.put(
+                    _failed(task[0], task[2], task[3], err)
+                ),
+            )
+            pending += 1
+        while pending:
+            yield finished.get()
+            pending -= 1
+
+    def saveMany(self, jobs):
+        """转换全部任务，返回按任务顺序排列的结果列表，结果格式见 imap"""
+        results = sorted(self.imap(jobs), key=lambda result: result["index"])
+        succeeded = sum(result["success"] for result in results)
+        print(f"批量转换完成，成功{succeeded}/{len(results)}个。")
+        return results
+
+    def close(self, terminate: bool = False):
+        """关闭进程池，terminate 为 True 时不等待未完成的任务"""
+        if self.__pool is None:
+            return
+        if terminate:
+            self.__pool.terminate()
+        else:
+            self.__pool.close()
+        self.__pool.join()
+        self.__pool = None
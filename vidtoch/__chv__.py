@@ -0,0 +1,405 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import json
+import lzma
+import os
+import struct
+import zlib
+
+from numpy import ascontiguousarray, cumsum, frombuffer, uint8
+
+from .__render__ import CharRenderer
+
+MAGIC, ENDMAGIC = b"VCHV", b"VCHE"
+FORMATVERSION = 1
+COMPRESSIONS = "zlib", "lzma"
+_HEAD = struct.Struct("<4sBI")  # 文件头：标识、格式版本、JSON 头长度
+_BLOCK = struct.Struct("<II")  # 块头：压缩后长度、帧数
+_TAIL = struct.Struct("<QI4s")  # 文件尾：索引位置、索引长度、结束标识
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "lzma":
+        return lzma.compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return zlib.decompress(data)
+
+
+class CharVideoWriter:
+    def __init__(
+        self,
+        filePath: str,
+        renderer: CharRenderer,
+        gridSize: tuple,
+        fps: float,
+        size: tuple,
+        compression: str = "zlib",
+        blockFrames: int = 50,
+    ):
+        """
+        ### 字符视频(.chv)写入器
+
+        文件只保存一次字符集及字体参数，之后每帧保存形如 (行数, 列数) 的 uint8 字形序号网格
+
+        每 blockFrames 帧为一块，块内首帧原样保存，其余帧保存与上一帧之差(按 256 取模)，整块压缩；文件末尾写入块索引供随机跳转
+
+        ```
+        参数 filePath: str，保存路径
+        参数 renderer: CharRenderer，生成字形序号所用的渲染器，其字符集及字体参数会被写入文件
+        参数 gridSize: tuple，字符网格的 (列数, 行数)
+        参数 fps: float，原视频帧率
+        参数 size: tuple，原视频的 (宽, 高)，转换回视频时的默认输出大小
+        参数 compression: str，块压缩方式，可用值：'zlib'，较快；'lzma'，压缩率更高，可忽略
+        参数 blockFrames: int，每块的最大帧数，越小随机跳转越快，压缩率越低，可忽略
+        ```
+        """
+        if not isinstance(renderer, CharRenderer):
+            raise TypeError("参数renderer的值必须是CharRenderer对象。")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"参数compression的值无效，可用值为：{COMPRESSIONS}。")
+        if not isinstance(blockFrames, int) or blockFrames < 1:
+            raise ValueError("参数blockFrames的值必须是大于0的整数。")
+        self.columns, self.rows = self.gridSize = tuple(gridSize)
+        self.compression = compression
+        self.blockFrames = blockFrames
+        self.frames = 0
+        self.__blocks = list()
+        self.__times = list()
+        self.__pending = list()
+        self.__previous = None
+        header = dict(
+            chars=renderer.chars,
+            fontPath=renderer.fontPath,
+            fontSize=renderer.fontSize,
+            horzSep=renderer.horzSep,
+            vertSep=renderer.vertSep,
+            columns=self.columns,
+            rows=self.rows,
+            fps=fps,
+            size=list(size),
+            compression=compression,
+        )
+        header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        self.__file = open(filePath, "wb")
+        self.__file.write(_HEAD.pack(MAGIC, FORMATVERSION, len(header)))
+        self.__file.write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    def append(self, indices, pts: float = None):
+        """
+        ### 追加一帧字形序号网格
+
+        ```
+        参数 indices: numpy.ndarray，形如 (行数, 列数) 的 uint8 字形序号网格，如 CharRenderer.indices 的返回值
+        参数 pts: float，此帧的显示时间(秒)，为 None 则按帧率推算，可忽略
+        ```
+        """
+        if indices.shape != (self.rows, self.columns):
+            raise ValueError("字形序号网格的形状与字符网格大小不一致。")
+        indices = ascontiguousarray(indices, uint8)
+        if self.__pending:
+            # 与上一帧之差，画面不变的单元格为 0，压缩后几乎不占空间
+            self.__pending.append((indices - self.__previous).tobytes())
+        else:
+            self.__pending.append(indices.tobytes())
+        self.__previous = indices
+        self.__times.append(pts)
+        self.frames += 1
+        if len(self.__pending) >= self.blockFrames:
+            self.__flush()
+
+    def __flush(self):
+        """压缩并写入当前块"""
+        if not self.__pending:
+            return
+        payload = _compress(b"".join(self.__pending), self.compression)
+        offset = self.__file.tell()
+        self.__file.write(_BLOCK.pack(len(payload), len(self.__pending)))
+        self.__file.write(payload)
+        self.__blocks.append((offset, len(self.__pending)))
+        self.__pending = list()
+
+    def close(self) -> int:
+        """写入剩余的帧及索引并关闭文件，返回总帧数"""
+        if self.__file.closed:
+            return self.frames
+        self.__flush()
+        times = None
+        if any(pts is not None for pts in self.__times):
+            times = self.__times
+        index = dict(frames=self.frames, blocks=self.__blocks, times=times)
+        index = zlib.compress(json.dumps(index).encode("utf-8"))
+        offset = self.__file.tell()
+        self.__file.write(index)
+        self.__file.write(_TAIL.pack(offset, len(index), ENDMAGIC))
+        self.__file.close()
+        return self.frames
+
+
+class CharVideoReader:
+    def __init__(self, filePath: str):
+        """
+        ### 字符视频(.chv)读取器
+
+        支持 len()、按帧号索引(可随机跳转)及逐帧迭代，得到的是 uint8 字形序号网格
+
+        文件末尾的索引缺失(如写入中途崩溃)时，会逐块扫描重建索引，已完整写入的块仍可读取
+
+        ```
+        参数 filePath: str，.chv 文件路径
+        ```
+        """
+        self.__file = open(filePath, "rb")
+        try:
+            magic, version, headerLength = _HEAD.unpack(self.__file.read(_HEAD.size))
+            if magic != MAGIC:
+                raise ValueError("文件不是字符视频(.chv)格式。")
+            if version > FORMATVERSION:
+                raise ValueError(f"不支持的字符视频格式版本：{version}。")
+            header = json.loads(self.__file.read(headerLength).decode("utf-8"))
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError):
+            self.__file.close()
+            raise ValueError("字符视频文件头已损坏。")
+        except Exception:
+            self.__file.close()
+            raise
+        self.header = header
+        self.chars = header["chars"]
+        self.fps = header["fps"]
+        self.size = tuple(header["size"])
+        self.columns, self.rows = self.gridSize = header["columns"], header["rows"]
+        self.compression = header["compression"]
+        self.__dataStart = _HEAD.size + headerLength
+        self.__blocks, self.__times = self.__loadIndex()
+        self.__firstFrames = list()
+        frames = 0
+        for _, count in self.__blocks:
+            self.__firstFrames.append(frames)
+            frames += count
+        self.frames = frames
+        self.__cached = None, None  # (块序号, 块内全部帧)
+        self.__renderer = None
+
+    def __loadIndex(self):
+        """读取文件末尾的块索引，缺失或损坏时逐块扫描重建"""
+        fileSize = self.__file.seek(0, os.SEEK_END)
+        if fileSize >= self.__dataStart + _TAIL.size:
+            self.__file.seek(fileSize - _TAIL.size)
+            offset, length, magic = _TAIL.unpack(self.__file.read(_TAIL.size))
+            if magic == ENDMAGIC:
+                self.__file.seek(offset)
+                try:
+                    index = json.loads(zlib.decompress(self.__file.read(length)))
+                    return [tuple(block) for block in index["blocks"]], index["times"]
+                except (zlib.error, ValueError, KeyError):
+                    pass
+        blocks, offset = list(), self.__dataStart
+        frameBytes = self.columns * self.rows
+        while offset + _BLOCK.size <= fileSize:
+            self.__file.seek(offset)
+            length, count = _BLOCK.unpack(self.__file.read(_BLOCK.size))
+            if not count or offset + _BLOCK.size + length > fileSize:
+                break
+            try:
+                payload = self.__file.read(length)
+                if len(_decompress(payload, self.compression)) != count * frameBytes:
+                    break
+            except (zlib.error, lzma.LZMAError):
+                break
+            blocks.append((offset, count))
+            offset += _BLOCK.size + length
+        return blocks, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, frameNum: int):
+        if not isinstance(frameNum, int):
+            raise TypeError("帧号必须是整数。")
+        if frameNum < 0:
+            frameNum += self.frames
+        if not (0 <= frameNum < self.frames):
+            raise IndexError("帧号超出范围。")
+        blockNum = self.__blockOf(frameNum)
+        return self.__block(blockNum)[frameNum - self.__firstFrames[blockNum]]
+
+    def __iter__(self):
+        for blockNum in range(len(self.__blocks)):
+            yield from self.__block(blockNum)
+
+    def __blockOf(self, frameNum: int) -> int:
+        """二分查找帧所在的块"""
+        low, high = 0, len(self.__firstFrames) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.__firstFrames[middle] <= frameNum:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def __block(self, blockNum: int):
+        """解压一整块并还原为各帧的字形序号网格，最近使用的一块保留在内存中"""
+        if self.__cached[0] == blockNum:
+            return self.__cached[1]
+        offset, count = self.__blocks[blockNum]
+        self.__file.seek(offset)
+        length, _ = _BLOCK.unpack(self.__file.read(_BLOCK.size))
+        payload = _decompress(self.__file.read(length), self.compression)
+        deltas = frombuffer(payload, uint8).reshape(count, self.rows, self.columns)
+        # 逐帧累加差值即还原各帧，uint8 溢出回绕恰好抵消写入时的取模
+        frames = cumsum(deltas, axis=0, dtype=uint8)
+        frames.flags.writeable = False
+        self.__cached = blockNum, frames
+        return frames
+
+    def time(self, frameNum: int) -> float:
+        """返回给定帧的显示时间(秒)"""
+        if self.__times is not None and self.__times[frameNum] is not None:
+            return self.__times[frameNum]
+        return frameNum / self.fps if self.fps else 0.0
+
+    def renderer(self, fontPath: str = None, fontSize: int = None) -> CharRenderer:
+        """
+        ### 返回与文件字符集一致的渲染器
+
+        可指定其他字体文件或字号以其他分辨率重新栅格化，字符顺序保持文件中的顺序不变
+        """
+        if fontPath is None and fontSize is None and self.__renderer is not None:
+            return self.__renderer
+        header = self.header
+        renderer = CharRenderer(
+            self.chars,
+            header["fontPath"] if fontPath is None else fontPath,
+            header["fontSize"] if fontSize is None else fontSize,
+            header["horzSep"],
+            header["vertSep"],
+        )
+        # 按新字体排序可能改变字符顺序，须还原为文件中的顺序，字形序号才能对应
+        if renderer.chars != self.chars:
+            renderer.reorder(self.chars)
+        if fontPath is None and fontSize is None:
+            self.__renderer = renderer
+        return renderer
+
+    def render(self, frameNum: int, size: tuple = None):
+        """将给定帧渲染为字符图像数组，size 为输出的 (宽, 高)，为 None 则使用原视频大小"""
+        image = self.renderer().compose(self[frameNum])
+        return CharRenderer.scale(image, size or self.size)
+
+    def toVideo(
+        self,
+        savePath: str,
+        size: tuple = None,
+        bitRate: int = None,
+        codec: str = "h264",
+        ffmpeg: str = None,
+        audioFrom: str = None,
+        overwrite: bool = False,
+    ) -> bool:
+        """
+        ### 将字符视频转换为普通视频
+
+        字形序号原样保存在文件中，转换结果与直接由源视频生成的字符视频逐帧一致
+
+        ```
+        参数 savePath: str，输出视频的保存路径
+        参数 size: tuple，输出视频的 (宽, 高)，为 None 则使用原视频大小，可忽略
+        参数 bitRate: int，输出视频码率，单位为k，仅使用 ffmpeg 时生效，可忽略
+        参数 codec: str，视频编码器，仅使用 ffmpeg 时生效，可忽略
+        参数 ffmpeg: str，ffmpeg 可执行文件路径，为 None 则使用 OpenCV 编码(不含音频)，可忽略
+        参数 audioFrom: str，音频来源，可以是音频文件或含音轨的视频文件(如源视频)，仅使用 ffmpeg 时生效，可忽略
+        参数 overwrite: bool，输出文件已存在时是否覆盖，可忽略
+        ```
+        """
+        if os.path.exists(savePath) and not overwrite:
+            print(f"文件已存在：{savePath}")
+            return False
+        size = tuple(size or self.size)
+        images = (self.render(frameNum, size) for frameNum in range(self.frames))
+        if ffmpeg is None:
+            return self.__toVideoByCV2(savePath, size, images)
+        # 延迟导入，__utils__ 模块本身依赖此模块
+        from .__utils__ import FFCmdUtils
+
+        ffutils = FFCmdUtils(ffmpeg)
+        target = savePath
+        if audioFrom is not None:
+            dirPath, basename = os.path.split(savePath)
+            target = os.path.join(dirPath, f"noaudio_{basename}")
+        encoder = ffutils.openEncoder(
+            target, size, self.fps, bitRate, codec, "gray", True
+        )
+        if encoder is None:
+            return False
+        try:
+            with encoder:
+                for image in images:
+                    if not encoder.write(image):
+                        return False
+            if not encoder.close():
+                return False
+            if audioFrom is None:
+                return True
+            return ffutils.mux(target, audioFrom, savePath, overwrite)
+        finally:
+            if target != savePath and os.path.exists(target):
+                os.remove(target)
+
+    def __toVideoByCV2(self, savePath, size, images) -> bool:
+        from cv2 import COLOR_GRAY2BGR, VideoWriter, VideoWriter_fourcc, cvtColor
+
+        writer = VideoWriter(savePath, VideoWriter_fourcc(*"mp4v"), self.fps, size)
+        try:
+            for image in images:
+                if writer.write(cvtColor(image, COLOR_GRAY2BGR)) is False:
+                    print("视频写入失败。")
+                    return False
+            return True
+        finally:
+            writer.release()
+
+    def close(self):
+        self.__file.close()
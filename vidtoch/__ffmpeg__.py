@@ -0,0 +1,219 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import json
+import os
+import re
+import subprocess
+from subprocess import PIPE, run
+
+INFOVERSION = 1  # 磁盘缓存格式的版本，格式改变时旧缓存自动失效
+_FOUND = dict()  # (当前目录, PATH) -> 查找到的可执行文件路径
+_INFOS = dict()  # ffmpeg 路径 -> (文件标识, 探测到的版本及能力)
+
+
+def _startupInfo():
+    """Windows 下返回隐藏子进程控制台窗口的 STARTUPINFO，其他平台不需要，返回 None"""
+    if os.name != "nt":
+        return None
+    return subprocess.STARTUPINFO(dwFlags=1, wShowWindow=0)
+
+
+STARTUP = _startupInfo()
+
+
+def _cacheHome():
+    """返回本模块的用户缓存目录，可用环境变量 VIDTOCH_CACHE 指定"""
+    cacheHome = os.getenv("VIDTOCH_CACHE")
+    if cacheHome:
+        return cacheHome
+    if os.name == "nt":
+        base = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "vidtoch", "Cache")
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "vidtoch")
+
+
+def _isExecutable(filePath: str) -> bool:
+    return os.path.isfile(filePath) and os.access(filePath, os.X_OK)
+
+
+def findExecutable(name: str = "ffmpeg"):
+    """
+    ### 查找可执行文件的位置
+
+    首先会在当前目录寻找，找不到则在系统环境变量中寻找，再找不到则返回 None
+
+    同一进程内当前目录及 PATH 不变时只查找一次，之后直接返回上次的结果
+    """
+    if os.name == "nt":
+        name = f"{name}.exe"
+    key = name, os.getcwd(), os.getenv("PATH", "")
+    execPath = _FOUND.get(key)
+    if execPath is not None and _isExecutable(execPath):
+        return execPath
+    for dirPath in (key[1], *key[2].split(os.pathsep)):
+        execPath = os.path.join(dirPath, name)
+        if dirPath and _isExecutable(execPath):
+            _FOUND[key] = execPath = os.path.abspath(execPath)
+            return execPath
+    return None
+
+
+def _capture(cmd):
+    """执行命令并返回其 (标准输出, 标准错误) 文本，无法执行或执行失败时返回 None"""
+    try:
+        result = run(cmd, stdout=PIPE, stderr=PIPE, startupinfo=STARTUP)
+    except Exception:
+        return None
+    if result.returncode:
+        return None
+    return (
+        result.stdout.decode("utf-8", "replace"),
+        result.stderr.decode("utf-8", "replace"),
+    )
+
+
+def _parseEncoders(text: str) -> dict:
+    """解析 'ffmpeg -encoders' 的输出，返回 {编码器名: 编码格式名}"""
+    encoders = dict()
+    for line in text.splitlines():
+        # 形如 ' V....D libx264    libx264 H.264 ... (codec h264)'，首列为 6 个标志字符
+        fields = line.split()
+        if len(fields) > 1 and len(fields[0]) == 6 and fields[1] != "=":
+            # 编码器名与编码格式名不同时，说明末尾以 '(codec 格式名)' 注明
+            match = re.search(r"\(codec (\w+)\)\s*$", line)
+            encoders[fields[1]] = match.group(1) if match else fields[1]
+    return encoders
+
+
+def _parsePixFmts(text: str) -> list:
+    """解析 'ffmpeg -pix_fmts' 的输出，返回像素格式名称列表"""
+    pixFmts, started = list(), False
+    for line in text.splitlines():
+        # 说明与表格之间以一行 '-----' 分隔，表格每行首列为 5 个标志字符
+        if not started:
+            started = line.startswith("-----")
+            continue
+        fields = line.split()
+        if len(fields) > 1 and len(fields[0]) == 5:
+            pixFmts.append(fields[1])
+    return pixFmts
+
+
+def _probe(ffmpeg: str):
+    """运行 ffmpeg 查询版本、编码器及像素格式，ffmpeg 无法运行时返回 None"""
+    output = _capture([ffmpeg, "-encoders"])
+    if output is None:
+        return None
+    # 未隐藏横幅时版本信息打印在标准错误的第一行，如 'ffmpeg version 6.1.1 Copyright ...'
+    match = re.search(r"version (\S+)", output[1])
+    pixFmts = _capture([ffmpeg, "-hide_banner", "-pix_fmts"])
+    return dict(
+        version=match.group(1) if match else None,
+        encoders=_parseEncoders(output[0]),
+        pixFmts=_parsePixFmts(pixFmts[0]) if pixFmts else list(),
+    )
+
+
+def _stamp(ffmpeg: str):
+    """可执行文件的标识，文件被替换或升级后随之改变"""
+    stat = os.stat(ffmpeg)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _loadInfos(cachePath: str) -> dict:
+    try:
+        with open(cachePath, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+    except Exception:
+        return dict()
+    if cache.get("version") != INFOVERSION:
+        return dict()
+    return cache.get("executables", dict())
+
+
+def _dumpInfos(cachePath: str, infos: dict):
+    """先写入临时文件再改名，缓存目录不可写时放弃写入"""
+    tempPath = f"{cachePath}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        with open(tempPath, "w", encoding="utf-8") as file:
+            json.dump(dict(version=INFOVERSION, executables=infos), file, indent=2)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+
+
+def ffmpegInfo(ffmpeg: str = None, refresh: bool = False):
+    """
+    ### 返回 ffmpeg 的路径、版本及支持的编码器、像素格式
+
+    探测结果按可执行文件的路径、大小及修改时间缓存在进程内及用户缓存目录的 ffmpeg.json 中，之后的进程无需再运行 ffmpeg 查询
+
+    ```
+    参数 ffmpeg: str，ffmpeg 可执行文件路径，为 None 则在当前目录或环境变量中查找，可忽略
+    参数 refresh: bool，是否忽略缓存重新探测，可忽略
+    ```
+
+    返回值：字典，键为 path、version、encoders({编码器名: 编码格式名})、pixFmts(像素格式名称列表)，ffmpeg 不可用时返回 None
+    """
+    if ffmpeg is None:
+        ffmpeg = findExecutable()
+        if ffmpeg is None:
+            return None
+    ffmpeg = os.path.abspath(ffmpeg)
+    try:
+        stamp = _stamp(ffmpeg)
+    except OSError:
+        return None
+    if not refresh and ffmpeg in _INFOS and _INFOS[ffmpeg][0] == stamp:
+        return _INFOS[ffmpeg][1]
+    cachePath = os.path.join(_cacheHome(), "ffmpeg.json")
+    infos = _loadInfos(cachePath)
+    entry = infos.get(ffmpeg)
+    if refresh or not entry or entry.get("stamp") != stamp:
+        info = _probe(ffmpeg)
+        if info is None:
+            return None
+        entry = dict(info, stamp=stamp)
+        infos[ffmpeg] = entry
+        _dumpInfos(cachePath, infos)
+    info = dict(
+        path=ffmpeg,
+        version=entry["version"],
+        encoders=entry["encoders"],
+        pixFmts=entry["pixFmts"],
+    )
+    _INFOS[ffmpeg] = stamp, info
+    return info
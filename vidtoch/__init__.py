@@ -1,6 +1,36 @@
 # coding: utf-8
 
-from .__utils__ import FFCmdUtils, makeVideo, vTools
+from importlib import import_module
+
+# 公开名称 -> 所在子模块，首次访问时才导入子模块，import vidtoch 本身不会加载 OpenCV、imgtoch 等依赖库
+_EXPORTS = {
+    "AsyncConverter": "__aio__",
+    "AsyncFFCmdUtils": "__aio__",
+    "AsyncFFDecoder": "__aio__",
+    "AsyncFFEncoder": "__aio__",
+    "BatchRunner": "__batch__",
+    "CharVideoReader": "__chv__",
+    "CharVideoWriter": "__chv__",
+    "ffmpegInfo": "__ffmpeg__",
+    "JobManifest": "__job__",
+    "LumaStack": "__luma__",
+    "probeMedia": "__media__",
+    "Histogram": "__metrics__",
+    "JsonLinesSink": "__metrics__",
+    "Metrics": "__metrics__",
+    "TerminalPlayer": "__player__",
+    "AtlasCache": "__render__",
+    "CharRenderer": "__render__",
+    "DeltaRenderer": "__render__",
+    "FrameRing": "__ring__",
+    "effectiveCpus": "__sched__",
+    "ENCODERPROFILES": "__utils__",
+    "FFCmdUtils": "__utils__",
+    "FFDecoder": "__utils__",
+    "FFEncoder": "__utils__",
+    "makeVideo": "__utils__",
+    "vTools": "__utils__",
+}
 
 NAME = "vidtoch"
 VERSIONNUM = 0, 4, 0
@@ -9,4 +39,44 @@ AUTHOR = "hrpzcf"
 EMAIL = "hrpzcf@foxmail.com"
 WEBSITE = "https://gitee.com/hrpzcf/vidtoch"
 
-__all__ = ["FFCmdUtils", "makeVideo", "vTools"]
+__all__ = [
+    "ENCODERPROFILES",
+    "AsyncConverter",
+    "AsyncFFCmdUtils",
+    "AsyncFFDecoder",
+    "AsyncFFEncoder",
+    "AtlasCache",
+    "BatchRunner",
+    "CharRenderer",
+    "CharVideoReader",
+    "CharVideoWriter",
+    "DeltaRenderer",
+    "FFCmdUtils",
+    "FFDecoder",
+    "FFEncoder",
+    "FrameRing",
+    "Histogram",
+    "JobManifest",
+    "JsonLinesSink",
+    "LumaStack",
+    "Metrics",
+    "TerminalPlayer",
+    "effectiveCpus",
+    "ffmpegInfo",
+    "makeVideo",
+    "probeMedia",
+    "vTools",
+]
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value  # 之后的访问不再经过此函数
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
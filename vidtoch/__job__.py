@@ -0,0 +1,134 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import hashlib
+import json
+import os
+import shutil
+
+MANIFESTVERSION = 1
+
+
+def fingerprint(filePath: str, blockSize: int = 1 << 20) -> str:
+    """
+    ### 计算文件指纹
+
+    由文件大小及首尾各 blockSize 字节的内容计算，不必读完整个大文件，文件被替换或改动后几乎必然不同
+    """
+    digest = hashlib.sha1()
+    fileSize = os.path.getsize(filePath)
+    digest.update(str(fileSize).encode("ascii"))
+    with open(filePath, "rb") as file:
+        digest.update(file.read(blockSize))
+        if fileSize > blockSize:
+            file.seek(max(fileSize - blockSize, blockSize))
+            digest.update(file.read(blockSize))
+    return digest.hexdigest()
+
+
+class JobManifest:
+    def __init__(self, savePath: str):
+        """
+        ### 可续传转换任务的清单
+
+        清单以 JSON 格式保存在输出文件旁('输出文件名.vidtoch.json')，记录源视频指纹、转换参数、分段计划及已完成的段
+
+        已完成的视频段保存在输出文件旁的 '输出文件名.parts' 目录中，任务全部完成后清单及该目录会被删除
+
+        ```
+        参数 savePath: str，任务最终输出的视频文件路径
+        ```
+        """
+        if not isinstance(savePath, str):
+            raise TypeError("参数savePath的值数据类型必须是字符串。")
+        savePath = os.path.abspath(savePath)
+        self.path = f"{savePath}.vidtoch.json"
+        self.partsDir = f"{savePath}.parts"
+        self.source = None
+        self.params = None
+        self.plan = None
+        self.done = set()
+
+    def load(self, source: str, params: dict) -> bool:
+        """读取已有清单，清单存在且源视频指纹与转换参数都一致时返回 True，否则返回 False"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except Exception:
+            return False
+        if manifest.get("version") != MANIFESTVERSION:
+            return False
+        if manifest.get("source") != source or manifest.get("params") != params:
+            return False
+        self.source, self.params = source, params
+        self.plan = [tuple(segment) for segment in manifest["plan"]]
+        self.done = set(manifest["done"])
+        return True
+
+    def begin(self, source: str, params: dict, plan: list):
+        """开始一个新任务，清除旧的视频段并写入新清单"""
+        shutil.rmtree(self.partsDir, ignore_errors=True)
+        os.makedirs(self.partsDir)
+        self.source, self.params = source, params
+        self.plan = [tuple(segment) for segment in plan]
+        self.done = set()
+        self.dump()
+
+    def complete(self, segNum: int):
+        """记录一个视频段已完成并立即写入清单"""
+        self.done.add(segNum)
+        self.dump()
+
+    def isDone(self, segNum: int) -> bool:
+        return segNum in self.done
+
+    def partPath(self, segNum: int, ext: str) -> str:
+        """返回给定视频段的保存路径"""
+        return os.path.join(self.partsDir, f"seg_{segNum}{ext}")
+
+    def dump(self):
+        """先写入临时文件再改名，写入中途崩溃也不会留下损坏的清单"""
+        manifest = dict(
+            version=MANIFESTVERSION,
+            source=self.source,
+            params=self.params,
+            plan=self.plan,
+            done=sorted(self.done),
+        )
+        tempPath = f"{self.path}.tmp"
+        with open(tempPath, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        os.replace(tempPath, self.path)
+
+    def remove(self):
+        """任务完成后删除清单及视频段目录"""
+        shutil.rmtree(self.partsDir, ignore_errors=True)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
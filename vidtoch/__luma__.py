@@ -0,0 +1,93 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import os
+import struct
+
+from numpy import ascontiguousarray, load
+
+HEADERSIZE = 128  # 固定长度的 .npy 文件头，写完全部帧后可原地改写帧数
+
+
+def _npyHeader(shape: tuple) -> bytes:
+    """生成总长度固定为 HEADERSIZE 字节的 .npy (1.0 版) uint8 数组文件头"""
+    header = "{'descr': '|u1', 'fortran_order': False, 'shape': %r, }" % (shape,)
+    header = header.ljust(HEADERSIZE - 11) + "\n"
+    if len(header) != HEADERSIZE - 10:
+        raise ValueError("数组形状过长，无法写入文件头。")
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+
+
+class LumaStack:
+    def __init__(self, path: str, gridSize: tuple, channels: int = 1):
+        """
+        ### 亮度帧栈写入器
+
+        逐帧追加字符网格大小的灰度帧，全部写完后改写文件头中的帧数，得到形如 (帧数, 行数, 列数) 的标准 .npy 文件
+
+        之后可用 LumaStack.load 以内存映射方式读取，再次渲染时无需重新解码视频
+
+        ```
+        参数 path: str，.npy 文件的保存路径
+        参数 gridSize: tuple，字符网格的 (列数, 行数)
+        参数 channels: int，每帧的通道数，彩色模式为 3，此时文件形如 (帧数, 行数, 列数, 3)，可忽略
+        ```
+        """
+        self.path = path
+        self.gridSize = columns, rows = tuple(gridSize)
+        self.__frameShape = (
+            (rows, columns) if channels == 1 else (rows, columns, channels)
+        )
+        self.frames = 0
+        self.__file = open(path, "wb")
+        self.__file.write(_npyHeader((0, *self.__frameShape)))
+
+    def append(self, grid):
+        """追加一帧，帧的形状须为 (行数, 列数) 或 (行数, 列数, 通道数)"""
+        self.__file.write(ascontiguousarray(grid).data)
+        self.frames += 1
+
+    def finish(self) -> int:
+        """写入最终帧数并关闭文件，返回帧数"""
+        self.__file.seek(0)
+        self.__file.write(_npyHeader((self.frames, *self.__frameShape)))
+        self.__file.close()
+        return self.frames
+
+    def discard(self):
+        """放弃写入并删除文件"""
+        self.__file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def load(path: str):
+        """以只读内存映射方式读取亮度帧栈"""
+        return load(path, mmap_mode="r")
@@ -0,0 +1,351 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import json
+import os
+from subprocess import PIPE, run
+
+from .__ffmpeg__ import STARTUP, _cacheHome
+from .__job__ import fingerprint
+
+MEDIAVERSION = 1  # 磁盘缓存格式的版本，格式改变时旧缓存自动失效
+_MEDIA = dict()  # (文件路径, 文件大小, 修改时间) -> 元数据
+
+
+def _number(value):
+    """将 ffprobe 输出的数值文本转为浮点数，'N/A' 等无效值返回 None"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number else None  # 排除 nan
+
+
+def _rate(value):
+    """将形如 '30000/1001' 的帧率文本转为浮点数，无效时返回 None"""
+    numerator, _, denominator = f"{value}".partition("/")
+    numerator, denominator = _number(numerator), _number(denominator or 1)
+    if not numerator or not denominator:
+        return None
+    return numerator / denominator
+
+
+def _kbps(value):
+    """将 ffprobe 输出的比特率(bit/s)转为 kbit/s 整数，无效时返回 None"""
+    number = _number(value)
+    return None if not number else int(number / 1000)
+
+
+def _rotation(stream: dict) -> int:
+    """
+    ### 返回视频流的旋转角度，即播放时需将画面顺时针旋转的度数，为 0、90、180、270 之一
+
+    旧版 ffmpeg 写在 rotate 标签中(顺时针)，新版写在显示矩阵侧数据中(逆时针)
+    """
+    rotation = _number(stream.get("tags", dict()).get("rotate"))
+    if rotation is None:
+        for sideData in stream.get("side_data_list", ()):
+            if "rotation" in sideData:
+                rotation = -(_number(sideData["rotation"]) or 0)
+                break
+    return int(round((rotation or 0) / 90)) * 90 % 360
+
+
+def _mainStreams(streams: list):
+    """返回第一条视频流及第一条音频流的 (视频流, 音频流)，没有时对应位置为 None"""
+    video = audio = None
+    for stream in streams:
+        codecType = stream.get("codec_type")
+        # 音频文件中的封面图片也是视频流，需跳过
+        if codecType == "video" and video is None:
+            if not stream.get("disposition", dict()).get("attached_pic"):
+                video = stream
+        elif codecType == "audio" and audio is None:
+            audio = stream
+    return video, audio
+
+
+def _parseProbe(data: dict, packets: list = ()):
+    """
+    ### 将 ffprobe 输出的 JSON 及视频流的数据包整理为元数据字典，没有视频流时返回 None
+
+    packets 为视频流各数据包的 (时间文本, 标志文本) 列表
+    """
+    streams = data.get("streams", list())
+    video, audio = _mainStreams(streams)
+    if video is None:
+        return None
+    fmt = data.get("format", dict())
+    rotation = _rotation(video)
+    width, height = int(video.get("width") or 0), int(video.get("height") or 0)
+    if rotation in (90, 270):
+        width, height = height, width
+    fps = _rate(video.get("avg_frame_rate")) or _rate(video.get("r_frame_rate"))
+    duration = _number(video.get("duration")) or _number(fmt.get("duration"))
+    # 解码时每个数据包恰好输出一帧，数据包数即准确的帧数；其次使用容器记录的帧数，最后由时长估算
+    exactFrames = True
+    if packets:
+        frames = len(packets)
+    elif _number(video.get("nb_frames")):
+        frames = int(video["nb_frames"])
+    elif duration and fps:
+        frames, exactFrames = round(duration * fps), False
+    else:
+        frames, exactFrames = None, False
+    keyframes = list()
+    for ptsTime, flags in packets:
+        ptsTime = _number(ptsTime)
+        if ptsTime is not None and "K" in flags:
+            keyframes.append(ptsTime)
+    bitRate = _kbps(fmt.get("bit_rate"))
+    audioBitRate = None if audio is None else _kbps(audio.get("bit_rate"))
+    videoBitRate = _kbps(video.get("bit_rate"))
+    if videoBitRate is None and bitRate is not None:
+        # mkv、webm 等容器不记录各流的比特率，以总比特率减去音频比特率估算
+        videoBitRate = max(bitRate - (audioBitRate or 0), 1)
+    return dict(
+        probe="ffprobe",
+        width=width,
+        height=height,
+        rotation=rotation,
+        fps=fps,
+        frames=frames,
+        exactFrames=exactFrames,
+        duration=duration,
+        startTime=_number(fmt.get("start_time")) or 0.0,
+        bitRate=bitRate,
+        videoCodec=video.get("codec_name"),
+        videoBitRate=videoBitRate,
+        audioCodec="" if audio is None else audio.get("codec_name"),
+        audioBitRate=audioBitRate,
+        keyframes=sorted(keyframes) or None,
+        streams=[
+            dict(
+                index=stream.get("index"),
+                type=stream.get("codec_type"),
+                codec=stream.get("codec_name"),
+                bitRate=_kbps(stream.get("bit_rate")),
+            )
+            for stream in streams
+        ],
+    )
+
+
+def _runProbe(command: list):
+    """运行 ffprobe 并返回标准输出的文本，失败时返回 None"""
+    try:
+        result = run(command, stdout=PIPE, startupinfo=STARTUP)
+    except Exception:
+        return None
+    if result.returncode:
+        return None
+    return result.stdout.decode("utf-8", "replace")
+
+
+def _probeByFFprobe(videoPath: str, ffprobe: str):
+    """
+    ### 由 ffprobe 读取容器、各流信息及视频流的全部数据包，只读取数据包，不解码
+
+    先只读取文件头得到各流信息，再只输出所选视频流的数据包时间及标志，音频等其他流的数据包不输出
+    """
+    output = _runProbe(
+        [
+            ffprobe,
+            "-loglevel",
+            "quiet",
+            "-show_format",  # 输出容器信息
+            "-show_streams",  # 输出各流信息
+            "-of",  # 输出为 JSON
+            "json",
+            videoPath,
+        ]
+    )
+    if output is None:
+        return None
+    try:
+        data = json.loads(output)
+    except ValueError:
+        return None
+    video, _ = _mainStreams(data.get("streams", list()))
+    if video is None or video.get("index") is None:
+        return None
+    output = _runProbe(
+        [
+            ffprobe,
+            "-loglevel",
+            "quiet",
+            "-select_streams",  # 只输出视频流的数据包
+            str(video["index"]),
+            "-show_entries",  # 只输出数据包的时间及标志
+            "packet=pts_time,flags",
+            "-of",  # 输出为不带键名的 csv，每行一个数据包
+            "csv=p=0",
+            videoPath,
+        ]
+    )
+    packets = list()
+    for line in (output or "").splitlines():
+        ptsTime, _, flags = line.partition(",")
+        if ptsTime:
+            packets.append((ptsTime, flags))
+    return _parseProbe(data, packets)
+
+
+def _probeByCV2(videoPath: str):
+    """ffprobe 不可用时由 OpenCV 读取，帧数、时长为估算值，没有各流比特率及关键帧信息"""
+    from cv2 import (
+        CAP_PROP_BITRATE,
+        CAP_PROP_FPS,
+        CAP_PROP_FRAME_COUNT,
+        CAP_PROP_FRAME_HEIGHT,
+        CAP_PROP_FRAME_WIDTH,
+        CAP_PROP_ORIENTATION_META,
+        VideoCapture,
+    )
+
+    videoCapt = VideoCapture(videoPath)
+    try:
+        if not videoCapt.isOpened():
+            return None
+        fps = videoCapt.get(CAP_PROP_FPS) or None
+        frames = int(videoCapt.get(CAP_PROP_FRAME_COUNT)) or None
+        bitRate = int(videoCapt.get(CAP_PROP_BITRATE)) or None  # 含音频的总比特率
+        rotation = int(videoCapt.get(CAP_PROP_ORIENTATION_META)) % 360
+        # 各版本 OpenCV 报告的宽高是否已按旋转角度交换不一致，以实际读出的第一帧为准
+        success, frame = videoCapt.read()
+        if success:
+            height, width = frame.shape[:2]
+        else:
+            width = int(videoCapt.get(CAP_PROP_FRAME_WIDTH))
+            height = int(videoCapt.get(CAP_PROP_FRAME_HEIGHT))
+    finally:
+        videoCapt.release()
+    return dict(
+        probe="cv2",
+        width=width,
+        height=height,
+        rotation=rotation,
+        fps=fps,
+        frames=frames,
+        exactFrames=False,
+        duration=frames / fps if frames and fps else None,
+        startTime=0.0,
+        bitRate=bitRate,
+        videoCodec=None,
+        videoBitRate=None,
+        audioCodec=None,
+        audioBitRate=None,
+        keyframes=None,
+        streams=list(),
+    )
+
+
+def _loadMedia(cachePath: str):
+    try:
+        with open(cachePath, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+    except Exception:
+        return None
+    if cache.get("version") != MEDIAVERSION:
+        return None
+    return cache.get("media")
+
+
+def _dumpMedia(cachePath: str, media: dict):
+    """先写入临时文件再改名，缓存目录不可写时放弃写入"""
+    tempPath = f"{cachePath}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        with open(tempPath, "w", encoding="utf-8") as file:
+            json.dump(dict(version=MEDIAVERSION, media=media), file)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+
+
+def probeMedia(videoPath: str, ffprobe: str = None, refresh: bool = False):
+    """
+    ### 读取视频文件的元数据，只读取容器信息及数据包，不解码
+
+    优先使用 ffprobe，不可用时退回使用 OpenCV；结果按源视频指纹缓存在进程内及用户缓存目录的 media 文件夹中，同一文件只需读取一次
+
+    ```
+    参数 videoPath: str，视频文件路径
+    参数 ffprobe: str，ffprobe 可执行文件路径，为 None 则只使用 OpenCV 读取，可忽略
+    参数 refresh: bool，是否忽略缓存重新读取，可忽略
+    ```
+
+    返回值：字典，无法读取或没有视频流时返回 None，各键含义如下：
+    ```
+    probe: str，读取方式，'ffprobe' 或 'cv2'
+    width, height: int，画面按旋转角度转正后的宽、高，与解码得到的帧一致
+    rotation: int，播放时需将画面顺时针旋转的度数
+    fps: float，平均帧率
+    frames: int，视频流的帧数，exactFrames 为 False 时是估算值，未知时为 None
+    exactFrames: bool，帧数是否准确
+    duration: float，视频流的时长(秒)，未知时为 None
+    startTime: float，容器的起始时间戳(秒)
+    bitRate, videoBitRate, audioBitRate: int，总比特率及视频流、音频流的比特率(kbit/s)，未知时为 None
+    videoCodec, audioCodec: str，视频流、音频流的编码名称，没有音频流时 audioCodec 为空字符串，未知时为 None
+    keyframes: list，视频流中关键帧的时间(秒)列表，未知时为 None
+    streams: list，各流的 {index, type, codec, bitRate}
+    ```
+    """
+    if not isinstance(videoPath, str):
+        raise TypeError("参数videoPath的值数据类型必须是字符串。")
+    videoPath = os.path.abspath(videoPath)
+    try:
+        stat = os.stat(videoPath)
+    except OSError:
+        return None
+    key = videoPath, stat.st_size, stat.st_mtime_ns
+    media = _MEDIA.get(key)
+    # OpenCV 读取的结果不完整，ffprobe 可用时重新读取
+    if (
+        not refresh
+        and media is not None
+        and (ffprobe is None or media["probe"] != "cv2")
+    ):
+        return media
+    cachePath = os.path.join(_cacheHome(), "media", f"{fingerprint(videoPath)}.json")
+    media = None if refresh else _loadMedia(cachePath)
+    if media is None or (ffprobe is not None and media["probe"] == "cv2"):
+        media = None
+        if ffprobe is not None:
+            media = _probeByFFprobe(videoPath, ffprobe)
+        if media is None:
+            media = _probeByCV2(videoPath)
+        if media is None:
+            return None
+        _dumpMedia(cachePath, media)
+    media = dict(media, path=videoPath)
+    _MEDIA[key] = media
+    return media
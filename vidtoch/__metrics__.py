@@ -0,0 +1,223 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import json
+from time import perf_counter, time
+
+_END = object()
+
+
+class Histogram:
+    def __init__(self):
+        """
+        ### 延迟直方图
+
+        以 2 的幂(微秒)为桶边界，记录一次的开销为常数，内存占用固定，百分位数按所在桶的上界估计
+        """
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        """记录一次耗时(秒)"""
+        self.buckets[min(int(seconds * 1e6).bit_length(), 39)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """返回第 q 百分位数(秒)的估计值，0 < q <= 100"""
+        if not self.count:
+            return 0.0
+        rank, seen = q / 100 * self.count, 0
+        for bucket, number in enumerate(self.buckets):
+            seen += number
+            if seen >= rank:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """返回可序列化为 JSON 的统计摘要，时间单位为秒"""
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else 0.0,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            max=self.max,
+        )
+
+
+class Metrics:
+    def __init__(
+        self, observers, source: str, dest: str, total: int = None, interval=1.0
+    ):
+        """
+        ### 一次转换的计数器、延迟直方图及事件分发
+
+        每个事件是一个字典，包含 event 事件名、time 时间戳、elapsed 已用时间(秒)、source 源文件、dest 输出文件及事件的其他数据，依次传给各个观察者
+
+        事件名：start 开始，schedule 自动调度确定的各阶段线程数或进程数，progress 进度(至多每 interval 秒一次)，segment 视频段完成，error 出错，finish 结束
+
+        观察者是接受一个事件字典的可调用对象，观察者抛出的异常会中断转换，可借此取消转换
+
+        ```
+        参数 observers: list，观察者列表
+        参数 source: str，源视频路径
+        参数 dest: str，输出视频路径
+        参数 total: int，总帧数，用于计算进度及剩余时间，未知时为 None，可忽略
+        参数 interval: float，progress 事件的最小间隔(秒)，可忽略
+        ```
+        """
+        self.observers = list(observers)
+        self.source, self.dest = source, dest
+        self.total = total if total and total > 0 else None
+        self.interval = interval
+        self.counters = dict(decoded=0, rendered=0, encoded=0, bytesWritten=0)
+        self.latency = dict()
+        self.__started = perf_counter()
+        self.__lastProgress = self.__started
+        self.__lastDone = 0
+        self.__inner = 0.0
+
+    def emit(self, event: str, **data):
+        """向所有观察者分发一个事件"""
+        record = dict(
+            event=event,
+            time=time(),
+            elapsed=perf_counter() - self.__started,
+            source=self.source,
+            dest=self.dest,
+        )
+        record.update(data)
+        for observer in self.observers:
+            observer(record)
+
+    def observe(self, stage: str, seconds: float):
+        """记录给定阶段一次处理的耗时"""
+        histogram = self.latency.get(stage)
+        if histogram is None:
+            histogram = self.latency[stage] = Histogram()
+        histogram.add(seconds)
+
+    def track(self, stage: str, iterable, counter: str = None):
+        """
+        ### 包装一个产出帧的可迭代对象，记录每一帧的耗时并计数
+
+        嵌套包装时(如渲染包装了解码)只记录本阶段自身的耗时，不含上游阶段的耗时
+        """
+        iterator = iter(iterable)
+        while True:
+            outer, self.__inner = self.__inner, 0.0
+            started = perf_counter()
+            item = next(iterator, _END)
+            elapsed = perf_counter() - started
+            inner, self.__inner = self.__inner, outer + elapsed
+            if item is _END:
+                return
+            self.observe(stage, elapsed - inner)
+            if counter is not None:
+                self.counters[counter] += 1
+            yield item
+
+    def encoded(self, seconds: float, nbytes: int):
+        """记录一帧写入编码器，并在距上次进度事件超过 interval 秒时发出进度事件"""
+        self.observe("encode", seconds)
+        self.counters["encoded"] += 1
+        self.counters["bytesWritten"] += nbytes
+        if perf_counter() - self.__lastProgress >= self.interval:
+            self.progress(self.counters["encoded"])
+
+    def progress(self, done: int, unit: str = "frames", total: int = None):
+        """
+        ### 发出进度事件
+
+        包含已完成数 done、总数 total、全程平均速率 rate、自上次进度事件以来的速率 recentRate 及按 recentRate 估计的剩余秒数 eta
+        """
+        now = perf_counter()
+        elapsed, interval = now - self.__started, now - self.__lastProgress
+        rate = done / elapsed if elapsed > 0 else 0.0
+        recentRate = (done - self.__lastDone) / interval if interval > 0 else rate
+        self.__lastProgress, self.__lastDone = now, done
+        if total is None and unit == "frames":
+            total = self.total
+        eta = (total - done) / recentRate if total and recentRate else None
+        self.emit(
+            "progress",
+            unit=unit,
+            done=done,
+            total=total,
+            rate=rate,
+            recentRate=recentRate,
+            eta=eta,
+        )
+
+    def snapshot(self) -> dict:
+        """返回当前计数器及各阶段延迟统计"""
+        return dict(
+            counters=dict(self.counters),
+            latency={
+                stage: histogram.summary() for stage, histogram in self.latency.items()
+            },
+        )
+
+    def finish(self, success: bool, **data):
+        """发出结束事件，附带计数器及延迟统计"""
+        self.emit("finish", success=bool(success), **self.snapshot(), **data)
+
+
+class JsonLinesSink:
+    def __init__(self, filePath: str, mode: str = "a"):
+        """
+        ### 将事件逐行写入 JSON Lines 文件的观察者
+
+        每个事件写入一行并立即刷新，调度程序可持续读取该文件以发现停滞或过慢的转换
+
+        ```
+        参数 filePath: str，输出文件路径
+        参数 mode: str，文件打开模式，'a' 追加，'w' 覆盖，可忽略
+        ```
+        """
+        if mode not in ("a", "w"):
+            raise ValueError("参数mode的值只能是'a'或'w'。")
+        self.__file = open(filePath, mode, encoding="utf-8")
+
+    def __call__(self, event: dict):
+        self.__file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self.__file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    def close(self):
+        self.__file.close()
@@ -0,0 +1,351 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import shutil
+import sys
+import threading
+from time import perf_counter, sleep
+
+from cv2 import (
+    CAP_PROP_FPS,
+    COLOR_BGR2GRAY,
+    INTER_AREA,
+    INTER_NEAREST,
+    VideoCapture,
+    cvtColor,
+    resize,
+)
+from numpy import array
+
+from .__chv__ import CharVideoReader
+from .__utils__ import _getRenderer
+
+CHARASPECT = 0.5  # 终端字符单元格的宽高比
+STATUSINTERVAL = 0.5  # 状态行的刷新间隔(秒)
+HIDECURSOR, SHOWCURSOR = "\x1b[?25l", "\x1b[?25h"
+CLEARSCREEN = "\x1b[2J"
+
+
+class _FrameSource:
+    """
+    ### 统一的帧来源
+
+    read 返回下一帧，已无帧时返回 None；skip 跳过一帧而不取出图像，返回是否确有一帧被跳过
+
+    .chv 文件产出的是字形序号网格(indexed 为 True)，其他来源产出的是灰度或 BGR 图像
+    """
+
+    def __init__(self, source, fps: float = None):
+        self.indexed = False
+        self.chars = None
+        self.size = None
+        self.__capture = self.__reader = self.__iterator = None
+        self.__frameNum = 0
+        if isinstance(source, str) and source.lower().endswith(".chv"):
+            self.__reader = CharVideoReader(source)
+            self.indexed, self.chars = True, self.__reader.chars
+            self.size = self.__reader.size
+            self.fps = fps or self.__reader.fps
+        elif isinstance(source, (str, int)):
+            self.__capture = VideoCapture(source)
+            if not self.__capture.isOpened():
+                self.__capture.release()
+                raise ValueError(f"无法打开视频来源：{source}")
+            self.fps = fps or self.__capture.get(CAP_PROP_FPS) or 30.0
+        else:
+            try:
+                self.__iterator = iter(source)
+            except TypeError:
+                raise TypeError(
+                    "参数source的值必须是视频路径、摄像头序号或可迭代的帧序列。"
+                )
+            self.fps = fps or 25.0
+
+    def read(self):
+        if self.__reader is not None:
+            if self.__frameNum >= len(self.__reader):
+                return None
+            self.__frameNum += 1
+            return self.__reader[self.__frameNum - 1]
+        if self.__capture is not None:
+            boolResult, frame = self.__capture.read()
+            return frame if boolResult else None
+        return next(self.__iterator, None)
+
+    def skip(self) -> bool:
+        if self.__reader is not None:
+            # 可随机跳转，跳过的帧无需解压
+            if self.__frameNum >= len(self.__reader):
+                return False
+            self.__frameNum += 1
+            return True
+        if self.__capture is not None:
+            # grab 只读取数据，不做色彩转换
+            return self.__capture.grab()
+        return next(self.__iterator, None) is not None
+
+    def close(self):
+        if self.__reader is not None:
+            self.__reader.close()
+        if self.__capture is not None:
+            self.__capture.release()
+
+
+class _LatestFrame(threading.Thread):
+    """
+    ### 实时来源的采集线程
+
+    持续读取来源并只保留最新的一帧，绘制跟不上时未被取走的旧帧即被丢弃，延迟不会累积
+    """
+
+    def __init__(self, source: _FrameSource):
+        super().__init__(daemon=True)
+        self.source = source
+        self.frames = self.dropped = 0
+        self.finished = False
+        self.__frame = None
+        self.__stopped = False
+        self.__cond = threading.Condition()
+
+    def run(self):
+        while not self.__stopped:
+            frame = self.source.read()
+            with self.__cond:
+                if frame is None:
+                    self.finished = True
+                    self.__cond.notify()
+                    return
+                if self.__frame is not None:
+                    self.dropped += 1
+                self.__frame = frame, perf_counter()
+                self.frames += 1
+                self.__cond.notify()
+
+    def take(self):
+        """等待并取走最新的一帧，返回 (帧, 采集时间)，来源已结束时返回 None"""
+        with self.__cond:
+            while self.__frame is None and not self.finished:
+                self.__cond.wait()
+            latest, self.__frame = self.__frame, None
+            return latest
+
+    def stop(self):
+        self.__stopped = True
+
+
+class TerminalPlayer:
+    def __init__(
+        self,
+        source,
+        chars: str = None,
+        fps: float = None,
+        size: tuple = None,
+        budget: float = 0.1,
+        invert: bool = True,
+        live: bool = None,
+        status: bool = True,
+        out=None,
+    ):
+        """
+        ### 在终端中实时播放字符视频
+
+        逐帧解码并缩小到字符网格大小，以 ANSI 转义序列按原帧率绘制文本，每帧只重绘发生变化的行
+
+        文件及帧序列按帧率定时播放，绘制落后于预定时间超过 budget 秒时跳过帧以追上进度；摄像头等实时来源由采集线程只保留最新一帧，来不及绘制的帧直接丢弃
+
+        ```
+        参数 source: str or int or iterable，视频文件路径或网络流地址、.chv 字符视频文件路径、摄像头序号，或产出灰度/BGR 图像数组的可迭代对象(如 FFDecoder、生成器)
+        参数 chars: str，使用的字符，为 None 则使用默认字符，.chv 文件使用文件中的字符，可忽略
+        参数 fps: float，播放帧率，为 None 则使用来源的帧率，可迭代对象默认为 25，可忽略
+        参数 size: tuple，字符画面的 (列数, 行数)，为 None 则按原视频宽高比适应终端大小，可忽略
+        参数 budget: float，允许的最大延迟(秒)，绘制落后超过此值即跳帧，可忽略
+        参数 invert: bool，是否为深色背景的终端反转明暗，即亮处使用笔画密的字符，可忽略
+        参数 live: bool，是否为实时来源，为 None 则摄像头视为实时来源，其他视为按帧率播放的来源，可忽略
+        参数 status: bool，是否在底部显示实际帧率及丢帧数，可忽略
+        参数 out: 文本流，输出目标，为 None 则使用 sys.stdout，可忽略
+        ```
+        """
+        if not isinstance(budget, (int, float)) or budget < 0:
+            raise ValueError("参数budget的值必须是不小于0的数。")
+        if fps is not None and not (isinstance(fps, (int, float)) and fps > 0):
+            raise ValueError("参数fps的值必须是大于0的数。")
+        self.source = source
+        self.chars = chars
+        self.fps = fps
+        self.size = size
+        self.budget = budget
+        self.invert = invert
+        self.live = isinstance(source, int) if live is None else live
+        self.status = status
+        self.out = out
+        self.stats = None
+        self.__lines = None
+
+    def play(self, maxFrames: int = None) -> dict:
+        """
+        ### 开始播放，播放完毕、达到 maxFrames 帧或按 Ctrl+C 时结束
+
+        返回统计字典：frames(来源帧数)、shown(绘制帧数)、dropped(丢弃帧数)、elapsed(秒)、fps(实际绘制帧率)、maxLag(最大延迟秒数)
+        """
+        source = _FrameSource(self.source, self.fps)
+        out = sys.stdout if self.out is None else self.out
+        if source.indexed:
+            table = source.chars
+        else:
+            renderer = _getRenderer(self.chars)
+            table, self.__lut = renderer.chars, renderer.lut
+        if self.invert:
+            table = table[::-1]
+        self.__table = array(list(table))
+        self.__grid, self.__lines = self.size, None
+        self.stats = dict(
+            frames=0, shown=0, dropped=0, elapsed=0.0, fps=0.0, maxLag=0.0
+        )
+        self.__out = out
+        self.__started = self.__lastStatus = perf_counter()
+        out.write(HIDECURSOR + CLEARSCREEN)
+        try:
+            if self.live:
+                self.__playLive(source, maxFrames)
+            else:
+                self.__playPaced(source, maxFrames)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.close()
+            self.__updateStats()
+            self.__drawStatus(True)
+            rows = 0 if self.__lines is None else len(self.__lines)
+            out.write(f"\x1b[{rows + 2};1H{SHOWCURSOR}\n")
+            out.flush()
+        return self.stats
+
+    def __playPaced(self, source: _FrameSource, maxFrames: int):
+        """按帧率定时播放，落后超过延迟预算时跳过帧"""
+        stats, interval = self.stats, 1 / source.fps
+        frameNum = 0
+        while maxFrames is None or frameNum < maxFrames:
+            lag = perf_counter() - (self.__started + frameNum * interval)
+            if lag > self.budget:
+                if not source.skip():
+                    break
+                stats["dropped"] += 1
+                frameNum += 1
+                continue
+            frame = source.read()
+            if frame is None:
+                break
+            self.__draw(frame, source)
+            stats["maxLag"] = max(stats["maxLag"], lag)
+            stats["shown"] += 1
+            frameNum += 1
+            delay = self.__started + frameNum * interval - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        stats["frames"] = frameNum
+
+    def __playLive(self, source: _FrameSource, maxFrames: int):
+        """实时来源：采集与绘制并行，总是绘制最新的一帧"""
+        stats = self.stats
+        grabber = _LatestFrame(source)
+        grabber.start()
+        try:
+            while maxFrames is None or stats["shown"] < maxFrames:
+                latest = grabber.take()
+                if latest is None:
+                    break
+                frame, captured = latest
+                self.__draw(frame, source)
+                stats["maxLag"] = max(stats["maxLag"], perf_counter() - captured)
+                stats["shown"] += 1
+        finally:
+            grabber.stop()
+            grabber.join(1)
+            stats["frames"], stats["dropped"] = grabber.frames, grabber.dropped
+
+    def __gridSize(self, frameSize: tuple):
+        """按原视频宽高比及终端字符单元格宽高比，计算适应终端大小的 (列数, 行数)"""
+        width, height = frameSize
+        termColumns, termRows = shutil.get_terminal_size()
+        termRows -= 1 if self.status else 0
+        columns = max(termColumns, 1)
+        rows = round(columns * height / width * CHARASPECT)
+        if rows > termRows:
+            rows = max(termRows, 1)
+            columns = max(
+                min(round(rows * width / height / CHARASPECT), termColumns), 1
+            )
+        return columns, max(rows, 1)
+
+    def __draw(self, frame, source: _FrameSource):
+        """将一帧量化为字符网格，只重绘与上一帧不同的行"""
+        if source.indexed:
+            if self.__grid is None:
+                self.__grid = self.__gridSize(source.size)
+            indices = frame
+            if (frame.shape[1], frame.shape[0]) != tuple(self.__grid):
+                indices = resize(frame, tuple(self.__grid), interpolation=INTER_NEAREST)
+        else:
+            if frame.ndim == 3:
+                frame = cvtColor(frame, COLOR_BGR2GRAY)
+            if self.__grid is None:
+                self.__grid = self.__gridSize((frame.shape[1], frame.shape[0]))
+            grid = resize(frame, tuple(self.__grid), interpolation=INTER_AREA)
+            indices = self.__lut[grid]
+        columns = indices.shape[1]
+        # 每行的字符数组视作一个定长字符串，整行比较是否变化
+        lines = self.__table[indices].view(f"<U{columns}").ravel()
+        if self.__lines is None or self.__lines.shape != lines.shape:
+            changed = range(len(lines))
+        else:
+            changed = (lines != self.__lines).nonzero()[0]
+        self.__lines = lines
+        self.__out.write("".join(f"\x1b[{row + 1};1H{lines[row]}" for row in changed))
+        self.__drawStatus()
+        self.__out.flush()
+
+    def __updateStats(self):
+        stats = self.stats
+        stats["elapsed"] = perf_counter() - self.__started
+        if stats["elapsed"] > 0:
+            stats["fps"] = stats["shown"] / stats["elapsed"]
+
+    def __drawStatus(self, force: bool = False):
+        """定时在画面下方刷新实际帧率及丢帧数"""
+        if not self.status or self.__lines is None:
+            return
+        now = perf_counter()
+        if not force and now - self.__lastStatus < STATUSINTERVAL:
+            return
+        self.__lastStatus = now
+        self.__updateStats()
+        stats = self.stats
+        self.__out.write(
+            f"\x1b[{len(self.__lines) + 1};1H\x1b[2K"
+            f"{stats['fps']:.1f} fps | 已绘制 {stats['shown']} | 丢帧 {stats['dropped']}"
+        )
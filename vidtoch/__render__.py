@@ -0,0 +1,461 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from functools import lru_cache
+
+from cv2 import (
+    COLOR_BGR2GRAY,
+    COLOR_GRAY2BGR,
+    INTER_LINEAR,
+    INTER_NEAREST,
+    bitwise_not,
+    cvtColor,
+    multiply,
+    resize,
+)
+from imgtoch import VERSION as IMGTOCHVERSION
+from numpy import (
+    arange,
+    ascontiguousarray,
+    asarray,
+    count_nonzero,
+    dtype,
+    empty,
+    intp,
+    load,
+    nonzero,
+    save,
+    stack,
+    take,
+    uint8,
+    uint32,
+    void,
+    zeros_like,
+)
+from PIL import Image, ImageDraw, ImageFont
+from PIL import __version__ as PILVERSION
+
+from .__ffmpeg__ import _cacheHome
+
+
+def _textSize(imgFont, text: str):
+    """返回文本在给定字体下的 (宽, 高)，兼容新旧版本 Pillow"""
+    if hasattr(imgFont, "getsize"):
+        return imgFont.getsize(text)
+    left, top, right, bottom = imgFont.getbbox(text)
+    return right, bottom
+
+
+def _loadFont(fontPath: str, fontSize: int):
+    if fontPath:
+        return ImageFont.truetype(fontPath, fontSize)
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=None)
+def _paletteLut(levels: int):
+    """每个颜色通道量化为 levels 个均匀分布的色阶的 256 项查找表"""
+    return (arange(256) * levels // 256 * 255 / (levels - 1)).round().astype(uint8)
+
+
+class AtlasCache:
+    FILES = "chars.npy", "lut.npy", "atlas.npy"
+
+    def __init__(self, cacheDir: str = None, maxEntries: int = 64):
+        """
+        ### 字形图集磁盘缓存
+
+        以 (字符, 字体, 单元格大小, imgtoch 版本) 为键，将排序后的字符、灰度查找表及字形图集保存为 .npy 文件
+
+        读取时以内存映射方式打开，新进程及新工作进程无需重新排序及栅格化字符，缓存条目数超过上限时按最近使用时间淘汰
+
+        ```
+        参数 cacheDir: str，缓存目录，为 None 则使用用户缓存目录下的 atlas 文件夹，可忽略
+        参数 maxEntries: int，最多保留的缓存条目数，可忽略
+        ```
+        """
+        if cacheDir is None:
+            cacheDir = os.path.join(_cacheHome(), "atlas")
+        if not isinstance(cacheDir, str):
+            raise TypeError("参数cacheDir的值数据类型必须是字符串。")
+        if not isinstance(maxEntries, int) or maxEntries < 1:
+            raise ValueError("参数maxEntries的值必须是大于0的整数。")
+        self.cacheDir = cacheDir
+        self.maxEntries = maxEntries
+
+    @staticmethod
+    def key(chars: str, fontPath: str, fontSize: int, horzSep: int, vertSep: int):
+        """计算缓存键，字体文件以其绝对路径、大小及修改时间区分"""
+        fontId = ""
+        if fontPath:
+            fontPath = os.path.abspath(fontPath)
+            stat = os.stat(fontPath)
+            fontId = f"{fontPath}:{stat.st_size}:{stat.st_mtime_ns}"
+        identity = "\0".join(
+            map(
+                str,
+                (
+                    chars,
+                    fontId,
+                    fontSize,
+                    horzSep,
+                    vertSep,
+                    IMGTOCHVERSION,
+                    PILVERSION,
+                ),
+            )
+        )
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def load(self, key: str):
+        """读取缓存，返回 (排序后的字符, 查找表, 字形图集)，无缓存或缓存损坏时返回 None"""
+        entryDir = os.path.join(self.cacheDir, key)
+        if not os.path.isdir(entryDir):
+            return None
+        try:
+            codes, lut, atlas = (
+                load(os.path.join(entryDir, name), mmap_mode="r")
+                for name in AtlasCache.FILES
+            )
+            os.utime(entryDir)  # 更新最近使用时间
+        except Exception:
+            shutil.rmtree(entryDir, ignore_errors=True)
+            return None
+        return "".join(map(chr, codes)), lut, atlas
+
+    def store(self, key: str, chars: str, lut, atlas) -> bool:
+        """写入缓存，先写入临时目录再整体改名，多个进程同时写入同一条目也不会互相破坏"""
+        tempDir = None
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            tempDir = tempfile.mkdtemp(dir=self.cacheDir, prefix=".tmp")
+            codes = asarray([ord(char) for char in chars], uint32)
+            for name, array in zip(AtlasCache.FILES, (codes, lut, atlas)):
+                save(os.path.join(tempDir, name), array)
+            os.replace(tempDir, os.path.join(self.cacheDir, key))
+        except Exception:
+            if tempDir is not None:
+                shutil.rmtree(tempDir, ignore_errors=True)
+            return False
+        try:
+            self.evict()
+        except Exception:
+            pass  # 淘汰失败不影响已写入的条目，下次写入时再淘汰
+        return True
+
+    def evict(self):
+        """按最近使用时间淘汰超出上限的缓存条目，其他进程同时淘汰或清空缓存时跳过已消失的条目"""
+        entries = list()
+        try:
+            for entry in os.scandir(self.cacheDir):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir():
+                        entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue  # 条目已被其他进程删除
+        except OSError:
+            return
+        entries.sort(reverse=True)
+        for _, entryPath in entries[self.maxEntries :]:
+            shutil.rmtree(entryPath, ignore_errors=True)
+
+    def clear(self):
+        """清空全部缓存"""
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+class CharRenderer:
+    def __init__(
+        self,
+        chars: str,
+        fontPath: str = "",
+        fontSize: int = 14,
+        horzSep: int = 2,
+        vertSep: int = 2,
+        cache: AtlasCache = None,
+    ):
+        """
+        ### 字符图像渲染器，用 NumPy 向量化地将灰度网格渲染为字符图像
+
+        初始化时将字符按等效灰度值排序并预先栅格化为字形图集，同时建立 256 项的灰度到字形序号查找表
+
+        之后每帧只需一次查表及一次花式索引即可拼出整幅字符图像，无需逐个绘制字符
+
+        ```
+        参数 chars: str，使用的字符，字符数应大于 1，无需手动按灰度值排序
+        参数 fontPath: str，字体文件路径，为空则使用 Pillow 默认字体，可忽略
+        参数 fontSize: int，字体大小，仅在指定字体文件时生效，可忽略
+        参数 horzSep: int，字符横向间隔，可忽略
+        参数 vertSep: int，字符纵向间隔，可忽略
+        参数 cache: AtlasCache，字形图集磁盘缓存，为 None 则不使用缓存，可忽略
+        ```
+        """
+        if not isinstance(chars, str):
+            raise TypeError("参数chars的值的数据类型必须是字符串。")
+        if len(chars) < 2:
+            raise ValueError("参数chars的值中字符个数不能少于2个。")
+        if not (isinstance(horzSep, int) and isinstance(vertSep, int)):
+            raise TypeError("参数horzSep或vertSep的值数据类型应为整型。")
+        if not ((0 <= horzSep <= 30) and (0 <= vertSep <= 30)):
+            raise ValueError("参数horzSep或vertSep的值应在0与30之间。")
+        self.horzSep, self.vertSep = horzSep, vertSep
+        self.fontPath, self.fontSize = fontPath, fontSize
+        cached = key = None
+        if cache is not None:
+            key = AtlasCache.key(chars, fontPath, fontSize, horzSep, vertSep)
+            cached = cache.load(key)
+        if cached is not None:
+            self.chars, self.lut, self.atlas = cached
+        else:
+            imgFont = _loadFont(fontPath, fontSize)
+            self.chars = CharRenderer.sortChars(chars, imgFont)
+            fontWidth, fontHeight = _textSize(imgFont, self.chars[0])
+            cellSize = fontWidth + horzSep, fontHeight + vertSep
+            self.atlas = CharRenderer.rasterize(self.chars, imgFont, cellSize)
+            lenChars = len(self.chars)
+            self.lut = (arange(256) * (lenChars - 1) / 255).round().astype(uint8)
+            if cache is not None:
+                cache.store(key, self.chars, self.lut, self.atlas)
+        self.cellSize = self.atlas.shape[2], self.atlas.shape[1]
+        self.__prepare()
+
+    def __prepare(self):
+        """将字形图集的每一像素行视作一个定长元素，拼图时每次取出字形的一整行"""
+        cellWidth, cellHeight = self.cellSize
+        glyphRows = ascontiguousarray(self.atlas).reshape(-1, cellWidth)
+        self.__glyphRows = glyphRows.view(dtype((void, cellWidth))).ravel()
+        self.__rowOffsets = arange(cellHeight, dtype=intp)[None, :, None]
+        # 彩色模式为黑底，亮处应使用笔画密的字符，即灰度反转后再查表
+        self.__inverseLut = ascontiguousarray(self.lut[::-1])
+
+    def reorder(self, chars: str):
+        """按给定顺序重排字符及字形图集，chars 须是当前字符的一个排列，用于还原按其他字体排序的字形序号"""
+        if sorted(chars) != sorted(self.chars):
+            raise ValueError("参数chars的值必须是当前字符的一个排列。")
+        order = [self.chars.index(char) for char in chars]
+        self.chars = chars
+        self.atlas = ascontiguousarray(self.atlas[order])
+        self.__prepare()
+
+    @staticmethod
+    def sortChars(chars: str, imgFont) -> str:
+        """按字符的等效灰度值由低到高排序给定字符，计算方式同 imgtoch.grayscaleOf"""
+        grayscales = list()
+        for char in chars:
+            width, height = _textSize(imgFont, char)
+            glyph = Image.new("L", (max(width, 1), max(height, 1)), 255)
+            ImageDraw.Draw(glyph).text((0, 0), char, 0, imgFont)
+            grayscales.append((char, round(asarray(glyph).mean())))
+        grayscales.sort(key=lambda x: x[1])
+        return "".join(grayscaleTuple[0] for grayscaleTuple in grayscales)
+
+    @staticmethod
+    def rasterize(chars: str, imgFont, cellSize: tuple):
+        """将字符逐个绘制在白底单元格左上角，返回形如 (字符数, 单元格高, 单元格宽) 的字形图集"""
+        glyphs = list()
+        for char in chars:
+            glyph = Image.new("L", cellSize, 255)
+            ImageDraw.Draw(glyph).text((0, 0), char, 0, imgFont)
+            glyphs.append(asarray(glyph))
+        return stack(glyphs)
+
+    def gridSize(self, size: tuple, acqRate: float):
+        """
+        ### 根据原图像的 (宽, 高) 及采集率计算字符网格的 (列数, 行数)
+
+        与 makeImage 的计算方式一致，行数按字符单元格的宽高比修正
+        """
+        incrementX, incrementY = self.cellSize
+        columns = max(round(size[0] * acqRate), 1)
+        rows = max(round(incrementX / incrementY * round(size[1] * acqRate)), 1)
+        return columns, rows
+
+    def indices(self, grid):
+        """将灰度网格映射为字形序号网格"""
+        return self.lut[grid]
+
+    def compose(self, indices):
+        """按字形序号网格拼出完整的字符图像，大小同 makeImage(..., keepSize=0)"""
+        rows, columns = indices.shape
+        cellWidth, cellHeight = self.cellSize
+        canvas = empty(
+            (rows * cellHeight + self.vertSep, columns * cellWidth + self.horzSep),
+            uint8,
+        )
+        canvas[: self.vertSep] = 255
+        canvas[:, : self.horzSep] = 255
+        # 形如 (行数, 单元格高, 列数) 的字形行序号，取出后的内存布局即为最终图像的行优先布局
+        rowIndices = indices.astype(intp)[:, None, :] * cellHeight + self.__rowOffsets
+        canvas[self.vertSep :, self.horzSep :] = (
+            take(self.__glyphRows, rowIndices, mode="clip")
+            .view(uint8)
+            .reshape(rows * cellHeight, columns * cellWidth)
+        )
+        return canvas
+
+    def render(self, grid, size: tuple = None, out=None, palette: int = None):
+        """
+        ### 将字符网格大小的灰度数组渲染为字符图像数组，给定彩色数组时渲染为黑底彩色字符图像
+
+        ```
+        参数 grid: numpy.ndarray，形如 (行数, 列数) 的 uint8 灰度数组，或形如 (行数, 列数, 3) 的 uint8 BGR 数组
+        参数 size: tuple，输出图像的 (宽, 高)，与原图一致时效果同 makeImage(..., keepSize=1)，为 None 则不缩放
+        参数 out: numpy.ndarray，直接写入结果的数组，形状须与输出图像一致，可忽略
+        参数 palette: int，彩色模式下每个颜色通道的色阶数，见 composeColor，可忽略
+        ```
+        """
+        if grid.ndim == 3:
+            return self.renderColor(grid, size, out, palette)
+        return self.scale(self.compose(self.indices(grid)), size, out)
+
+    def renderColor(self, cells, size: tuple = None, out=None, palette: int = None):
+        """
+        ### 将字符网格大小的 BGR 数组渲染为黑底彩色字符图像，每个字形按其单元格的平均颜色着色
+
+        先拼出并缩放灰度字符图像，反转即得笔画覆盖率，再与按最近邻放大到同样大小的单元格颜色逐像素相乘
+
+        着色在缩放后的输出大小上进行，每帧的开销与灰度模式相近
+
+        ```
+        参数 cells: numpy.ndarray，形如 (行数, 列数, 3) 的 uint8 BGR 数组，即按区域均值缩小到字符网格大小的彩色帧
+        参数 size: tuple，输出图像的 (宽, 高)，为 None 则不缩放
+        参数 out: numpy.ndarray，直接写入结果的数组，形状须为 (高, 宽, 3)，可忽略
+        参数 palette: int，每个颜色通道量化为几个色阶，如 4 即 64 色，颜色越少编码后的视频越小，为 None 则不量化，可忽略
+        ```
+        """
+        if palette is not None:
+            cells = _paletteLut(palette)[cells]
+        canvas = self.compose(self.__inverseLut[cvtColor(cells, COLOR_BGR2GRAY)])
+        coverage = cvtColor(bitwise_not(self.scale(canvas, size)), COLOR_GRAY2BGR)
+        height, width = coverage.shape[:2]
+        # 左侧及上方的间隔缩放后的宽度，单元格颜色只铺在间隔之外的区域
+        offsetX = round(self.horzSep * width / canvas.shape[1])
+        offsetY = round(self.vertSep * height / canvas.shape[0])
+        colors = zeros_like(coverage)
+        resize(
+            cells,
+            (width - offsetX, height - offsetY),
+            colors[offsetY:, offsetX:],
+            interpolation=INTER_NEAREST,
+        )
+        return multiply(coverage, colors, out, scale=1 / 255)
+
+    def blit(self, canvas, rows, columns, indices):
+        """将给定单元格 (行号数组, 列号数组) 处的字形替换为 indices 中的字形，直接修改 canvas"""
+        cellWidth, cellHeight = self.cellSize
+        cells = canvas[self.vertSep :, self.horzSep :].view()
+        # 直接设置 shape 而非调用 reshape，无法不复制地变形时会报错而不是静默地写入副本
+        cells.shape = (
+            cells.shape[0] // cellHeight,
+            cellHeight,
+            cells.shape[1] // cellWidth,
+            cellWidth,
+        )
+        cells[rows, :, columns, :] = self.atlas[indices]
+
+    @staticmethod
+    def scale(image, size: tuple = None, out=None):
+        """将拼好的字符图像缩放到给定的 (宽, 高)，为 None 或大小一致则原样返回，给定 out 则写入 out"""
+        if size is not None and (image.shape[1], image.shape[0]) != tuple(size):
+            return resize(image, tuple(size), out, interpolation=INTER_LINEAR)
+        if out is None:
+            return image
+        out[...] = image
+        return out
+
+
+class DeltaRenderer:
+    def __init__(self, renderer: CharRenderer, size: tuple = None, ratio=0.5):
+        """
+        ### 增量字符图像渲染器
+
+        将每帧的字形序号网格与上一帧比较，只重绘变化了的字符单元格，完全没有变化的帧直接复用上一帧的渲染结果
+
+        输出与 CharRenderer.render 完全一致，但帧必须按顺序逐一传入；返回的图像数组只读，后续帧可能原样返回同一数组
+
+        ```
+        参数 renderer: CharRenderer，实际使用的渲染器
+        参数 size: tuple，输出图像的 (宽, 高)，为 None 则不缩放，可忽略
+        参数 ratio: float，变化的单元格超过此比例时整帧重绘，可忽略
+        ```
+        """
+        if not isinstance(renderer, CharRenderer):
+            raise TypeError("参数renderer的值必须是CharRenderer对象。")
+        self.renderer = renderer
+        self.size = size
+        self.ratio = ratio
+        self.frames = self.framesSkipped = 0
+        self.cells = self.cellsSkipped = 0
+        self.__indices = self.__canvas = self.__image = None
+
+    def render(self, grid):
+        """渲染下一帧"""
+        indices = self.renderer.indices(grid)
+        self.frames += 1
+        self.cells += indices.size
+        if self.__indices is None or self.__indices.shape != indices.shape:
+            return self.__redraw(indices)
+        changed = indices != self.__indices
+        count = count_nonzero(changed)
+        if not count:
+            self.framesSkipped += 1
+            self.cellsSkipped += indices.size
+            return self.__image
+        if count > indices.size * self.ratio:
+            return self.__redraw(indices)
+        rows, columns = nonzero(changed)
+        self.renderer.blit(self.__canvas, rows, columns, indices[rows, columns])
+        self.cellsSkipped += indices.size - count
+        self.__indices = indices
+        return self.__finish()
+
+    def __redraw(self, indices):
+        self.__canvas = self.renderer.compose(indices)
+        self.__indices = indices
+        return self.__finish()
+
+    def __finish(self):
+        image = CharRenderer.scale(self.__canvas, self.size)
+        if image is self.__canvas:
+            image = image.copy()  # 画布之后还会被修改，不能直接交给调用者
+        self.__image = image
+        return image
+
+    def summary(self) -> str:
+        """返回跳过的帧数及单元格数的统计文本"""
+        return (
+            f"共{self.frames}帧，复用{self.framesSkipped}帧，"
+            f"跳过{self.cellsSkipped}/{self.cells}个字符单元格。"
+        )
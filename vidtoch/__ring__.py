@@ -0,0 +1,134 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+from collections import deque
+
+from numpy import ndarray, prod, uint8
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7 没有 shared_memory 模块
+    shared_memory = None
+
+
+class FrameRing:
+    def __init__(self, slots: int, inShape: tuple, outShape: tuple, names=None):
+        """
+        ### 基于共享内存的帧环形缓冲区
+
+        输入帧与输出帧各占一块共享内存，均划分为 slots 个槽位，解码端把帧写入输入槽，工作进程就地读取并把结果写入对应的输出槽
+
+        进程间只传递槽位序号，传输开销不再随分辨率增长
+
+        ```
+        参数 slots: int，槽位数，即同时在途的最大帧数
+        参数 inShape: tuple，输入帧的形状，如 (行数, 列数)
+        参数 outShape: tuple，输出帧的形状，如 (高, 宽)
+        参数 names: tuple，已有共享内存块的 (输入块名, 输出块名)，为 None 则新建，工作进程连接时使用，可忽略
+        ```
+        """
+        if shared_memory is None:
+            raise RuntimeError(
+                "当前Python版本不支持共享内存，需要Python3.8或以上版本。"
+            )
+        if not isinstance(slots, int) or slots < 1:
+            raise ValueError("参数slots的值必须是大于0的整数。")
+        self.slots = slots
+        self.inShape, self.outShape = tuple(inShape), tuple(outShape)
+        self.__owner = names is None
+        if self.__owner:
+            self.__inShm = shared_memory.SharedMemory(
+                create=True, size=slots * int(prod(self.inShape))
+            )
+            try:
+                self.__outShm = shared_memory.SharedMemory(
+                    create=True, size=slots * int(prod(self.outShape))
+                )
+            except Exception:
+                self.__inShm.close()
+                self.__inShm.unlink()
+                raise
+        else:
+            self.__inShm = shared_memory.SharedMemory(names[0])
+            self.__outShm = shared_memory.SharedMemory(names[1])
+        self.__inputs = ndarray((slots, *self.inShape), uint8, self.__inShm.buf)
+        self.__outputs = ndarray((slots, *self.outShape), uint8, self.__outShm.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    @property
+    def spec(self):
+        """供工作进程连接此缓冲区的参数元组，可直接作为 FrameRing 的参数"""
+        return (
+            self.slots,
+            self.inShape,
+            self.outShape,
+            (self.__inShm.name, self.__outShm.name),
+        )
+
+    def input(self, slot: int):
+        """返回给定输入槽的数组视图"""
+        return self.__inputs[slot]
+
+    def output(self, slot: int):
+        """返回给定输出槽的数组视图"""
+        return self.__outputs[slot]
+
+    def imap(self, pool, func, frames, kwdargs=None):
+        """
+        ### 经由缓冲区将帧分发给进程池，并按提交顺序逐个产出输出槽的数组视图
+
+        func 须是形如 func(slot, **kwdargs) 的函数，在工作进程中读取输入槽、写入输出槽，并返回槽位序号
+
+        所有槽位都在途时等待最早提交的帧完成，产出的视图在下一次迭代前有效，需要保留的请自行复制
+        """
+        pending = deque()
+        for frameNum, frame in enumerate(frames):
+            slot = frameNum % self.slots
+            if len(pending) == self.slots:
+                # 最早提交的帧恰好占用的就是本帧将要使用的槽位
+                yield self.output(pending.popleft().get())
+            self.__inputs[slot] = frame
+            pending.append(pool.apply_async(func, (slot,), kwdargs))
+        while pending:
+            yield self.output(pending.popleft().get())
+
+    def close(self):
+        """断开与共享内存的连接，创建者同时释放共享内存"""
+        self.__inputs = self.__outputs = None
+        for shm in (self.__inShm, self.__outShm):
+            shm.close()
+            if self.__owner:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
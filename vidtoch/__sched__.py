@@ -0,0 +1,143 @@
+# coding: utf-8
+
+################################################################################
+# MIT License
+
+# Copyright (c) 2021 hrp/hrpzcf <hrpzcf@foxmail.com>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+################################################################################
+# Formatted with black 20.8b1.
+################################################################################
+
+
+import os
+from math import ceil
+
+CGROUPROOT = "/sys/fs/cgroup"
+# cgroup v1 中 cpu 控制器可能单独挂载，也可能与 cpuacct 合并挂载
+CPUCONTROLLERS = ("cpu", "cpu,cpuacct", "cpuacct,cpu")
+
+
+def _readText(filePath: str):
+    """读取小文本文件的内容，文件不存在或无法读取时返回 None"""
+    try:
+        with open(filePath, "r", encoding="ascii") as file:
+            return file.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def _cgroupPaths():
+    """由 /proc/self/cgroup 得到本进程在 cgroup v2 及 v1 cpu 控制器中的路径"""
+    v2Path = v1Path = "/"
+    text = _readText("/proc/self/cgroup")
+    for line in (text or "").splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+        if parts[0] == "0" and parts[1] == "":
+            v2Path = parts[2]
+        elif "cpu" in parts[1].split(","):
+            v1Path = parts[2]
+    return v2Path, v1Path
+
+
+def _ancestors(mountPoint: str, cgroupPath: str):
+    """
+    ### 由本进程所在的 cgroup 目录起依次产出各级父目录，直到挂载点
+
+    容器中挂载点通常就是本容器的 cgroup，此时 cgroupPath 所指的目录并不存在，只会产出挂载点本身
+    """
+    parts = [part for part in cgroupPath.split("/") if part]
+    for depth in range(len(parts), -1, -1):
+        dirPath = os.path.join(mountPoint, *parts[:depth])
+        if os.path.isdir(dirPath):
+            yield dirPath
+
+
+def cgroupCpuLimit(root: str = CGROUPROOT):
+    """
+    ### 返回 cgroup 限制的 CPU 配额，即可同时占满的 CPU 数，可能是小数
+
+    依次读取 cgroup v2 的 cpu.max 及 v1 的 cpu.cfs_quota_us / cpu.cfs_period_us，各级父 cgroup 的配额取最小值
+
+    没有配额限制、不是 Linux 或无法读取时返回 None
+    """
+    v2Path, v1Path = _cgroupPaths()
+    limits = list()
+    for dirPath in _ancestors(root, v2Path):
+        text = _readText(os.path.join(dirPath, "cpu.max"))
+        if not text:
+            continue
+        quota, _, period = text.partition(" ")
+        if quota != "max" and period:
+            limits.append(int(quota) / int(period))
+    if not limits:
+        for controller in CPUCONTROLLERS:
+            for dirPath in _ancestors(os.path.join(root, controller), v1Path):
+                quota = _readText(os.path.join(dirPath, "cpu.cfs_quota_us"))
+                period = _readText(os.path.join(dirPath, "cpu.cfs_period_us"))
+                if quota and period and int(quota) > 0:
+                    limits.append(int(quota) / int(period))
+    return min(limits) if limits else None
+
+
+def effectiveCpus() -> int:
+    """
+    ### 返回本进程实际可用的 CPU 数
+
+    取 CPU 亲和性允许使用的核数与 cgroup 配额(向上取整)中较小者，至少为 1
+
+    容器中 os.cpu_count() 返回的是宿主机的核数，据此开进程会严重超额订阅
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows 及 macOS 没有 sched_getaffinity
+        cpus = os.cpu_count() or 1
+    limit = cgroupCpuLimit()
+    if limit is not None:
+        cpus = min(cpus, ceil(limit))
+    return max(cpus, 1)
+
+
+def planStages(costs: dict, cpus: int, limits: dict = None) -> dict:
+    """
+    ### 按各阶段每帧的单线程耗时分配 CPU，使流水线各阶段的吞吐量尽量平衡
+
+    每个阶段先分配 1 个，之后每次把 1 个 CPU 分给当前每帧耗时(耗时/个数)最长的瓶颈阶段，直到分完
+
+    瓶颈阶段已达到 limits 中的上限时，再增加其他阶段也不能提高整体速度，提前结束
+
+    ```
+    参数 costs: dict，{阶段名: 单线程处理一帧的秒数}
+    参数 cpus: int，可分配的 CPU 数，少于阶段数时每个阶段仍分配 1 个
+    参数 limits: dict，{阶段名: 最多分配的个数}，如只能在单个线程中进行的阶段，可忽略
+    ```
+
+    返回值：{阶段名: 分配的线程数或进程数}
+    """
+    limits = limits or dict()
+    plan = {stage: 1 for stage in costs}
+    while sum(plan.values()) < cpus:
+        stage = max(plan, key=lambda name: costs[name] / plan[name])
+        if plan[stage] >= limits.get(stage, cpus):
+            break
+        plan[stage] += 1
+    return plan
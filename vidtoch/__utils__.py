@@ -27,25 +27,41 @@
 ################################################################################
 
 import os
+import re
 import shutil
 import sys
 import tempfile
+from collections import deque
+from itertools import chain, islice
+from math import ceil, floor
+from functools import lru_cache
 from multiprocessing import Pool
-from subprocess import STARTUPINFO, run
-from time import localtime, strftime
+from multiprocessing.pool import ThreadPool
+from subprocess import PIPE, Popen, run
+from time import localtime, perf_counter, strftime
 
 from cv2 import (
-    CAP_PROP_FPS,
-    CAP_PROP_FRAME_COUNT,
-    CAP_PROP_FRAME_HEIGHT,
-    CAP_PROP_FRAME_WIDTH,
     CAP_PROP_POS_FRAMES,
+    COLOR_BGR2GRAY,
+    COLOR_GRAY2BGR,
     IMWRITE_JPEG_QUALITY,
+    INTER_AREA,
     VIDEOWRITER_PROP_QUALITY,
 )
 from cv2 import VideoCapture as vcapt
-from cv2 import VideoWriter, VideoWriter_fourcc, imread, imwrite
+from cv2 import VideoWriter, VideoWriter_fourcc, cvtColor, imread, imwrite, resize
 from imgtoch import VERSION, VERSIONNUM, makeImage
+from numpy import ascontiguousarray, frombuffer, uint8
+
+from .__chv__ import CharVideoWriter
+from .__ffmpeg__ import STARTUP, ffmpegInfo, findExecutable
+from .__job__ import JobManifest, fingerprint
+from .__luma__ import LumaStack
+from .__media__ import probeMedia
+from .__metrics__ import Metrics
+from .__render__ import AtlasCache, CharRenderer, DeltaRenderer
+from .__ring__ import FrameRing, shared_memory
+from .__sched__ import effectiveCpus, planStages
 
 if VERSIONNUM < (0, 2, 0):
     print(f"错误：依赖库imgtoch({VERSION})版本低于0.2.0。")
@@ -53,6 +69,521 @@ if VERSIONNUM < (0, 2, 0):
 
 NONETYPE = type(None)
 PRESETCHARS = "HR#PXCFJIv?!+^-:. "
+DEFAULTCHARS = (
+    "HdRQA#PXCFJIv?!+^-:. "  # 与 imgtoch.makeImage 在未指定字符时使用的字符相同
+)
+HORZSEP, VERTSEP = 2, 2
+CHUNKSECONDS = 60  # 可续传任务默认的分段时长(秒)
+EXECUTORS = ("inline", "threads", "processes")  # 渲染的执行方式
+CALIBFRAMES = 16  # 自动调度时用于测量各阶段耗时的开头帧数
+SCHEDULEEPS = 1e-9  # 抽帧时间表的容差，避免帧率换算的浮点误差使本应保留的帧被丢弃
+# 各容器可直接复制的音频编码，及音频编码不兼容时转码使用的编码器
+MP4AUDIO = {"aac", "mp3", "alac", "ac3", "eac3"}
+AUDIOCODECS = {
+    ".mp4": (MP4AUDIO, "aac"),
+    ".m4v": (MP4AUDIO, "aac"),
+    ".mov": (MP4AUDIO | {"pcm_s16le", "pcm_s24le", "pcm_s16be", "pcm_s24be"}, "aac"),
+    ".avi": ({"mp3", "mp2", "ac3", "aac", "pcm_s16le"}, "ac3"),
+    ".flv": ({"aac", "mp3"}, "aac"),
+    ".ts": ({"aac", "mp3", "mp2", "ac3", "eac3", "opus"}, "aac"),
+}
+# 生成的视频总是 h264 编码，这些容器不能封装 h264
+H264EXCLUDED = (".webm",)
+# 针对字符视频调校的编码配置：画面平坦、对比强烈且帧间大量重复，以恒定质量(CRF)代替按源文件估算的码率
+# 实测 stillimage 调校在此类画面上比 animation 码率更低，gray 为输入是灰度帧时的输出像素格式
+ENCODERPROFILES = {
+    "fast-preview": dict(
+        crf=30, preset="ultrafast", tune=None, gop=50, gray="yuv420p", color="yuv420p"
+    ),
+    "archive": dict(
+        crf=16, preset="slow", tune="stillimage", gop=250, gray="gray", color="yuv444p"
+    ),
+    "small-web": dict(
+        crf=32,
+        preset="slow",
+        tune="stillimage",
+        gop=250,
+        gray="yuv420p",
+        color="yuv420p",
+        faststart=True,
+    ),
+}
+ATLASCACHE = AtlasCache()
+_RING = None  # 工作进程中连接的共享内存帧缓冲区
+
+
+@lru_cache(maxsize=16)
+def _getRenderer(chars: str = None):
+    """
+    ### 返回给定字符对应的渲染器，同一进程内相同字符只构建一次字形图集
+
+    未指定字符时使用与 makeImage 相同的默认字符，流式与非流式转换的效果一致
+    """
+    if chars is None:
+        chars = DEFAULTCHARS
+    return CharRenderer(chars, horzSep=HORZSEP, vertSep=VERTSEP, cache=ATLASCACHE)
+
+
+def _gridSize(size: tuple, acqRate: float, chars: str = None):
+    """根据原视频帧的 (宽, 高) 及采集率计算字符网格的 (列数, 行数)"""
+    return _getRenderer(chars).gridSize(size, acqRate)
+
+
+def _sampleFrame(frame, gridSize: tuple, color: bool = False):
+    """将 OpenCV 读取的彩色帧转为灰度并按区域均值缩小到字符网格大小，彩色模式保留颜色"""
+    if color:
+        return resize(frame, gridSize, interpolation=INTER_AREA)
+    return resize(cvtColor(frame, COLOR_BGR2GRAY), gridSize, interpolation=INTER_AREA)
+
+
+def _charImage(grid, size: tuple, chars: str = None, palette: int = None):
+    """
+    ### 将字符网格大小的灰度数组转换为字符图像数组
+
+    效果等同于 makeImage(..., keepSize=1)，但输入输出均为内存中的数组，不经过图片文件
+
+    参数 grid 为已缩小到字符网格大小的单通道灰度数组(彩色模式为 BGR 数组)，参数 size 为输出图像的 (宽, 高)
+    """
+    return _getRenderer(chars).render(grid, size, palette=palette)
+
+
+def _attachRing(spec):
+    """进程池初始化函数，使工作进程连接到共享内存帧缓冲区"""
+    global _RING
+    _RING = FrameRing(*spec)
+
+
+def _renderSlot(slot: int, size: tuple, chars: str = None, palette: int = None):
+    """在工作进程中渲染共享内存帧缓冲区的一个槽位，结果直接写入对应的输出槽"""
+    _getRenderer(chars).render(_RING.input(slot), size, _RING.output(slot), palette)
+    return slot
+
+
+def _openRing(slots: int, inShape: tuple, outShape: tuple):
+    """尝试创建共享内存帧缓冲区，不支持或共享内存空间不足时返回 None"""
+    if shared_memory is None:
+        return None
+    try:
+        return FrameRing(slots, inShape, outShape)
+    except OSError as err:
+        print(f"共享内存帧缓冲区创建失败，改为经管道传输帧：{err}。")
+        return None
+
+
+def _renderInline(
+    grids, size: tuple, chars: str = None, delta: bool = False, palette: int = None
+):
+    """在当前进程中逐帧渲染字符图像，供已在工作进程中运行、不宜再开进程池的场合使用"""
+    renderer = _getRenderer(chars)
+    if delta:
+        renderer = DeltaRenderer(renderer, size)
+        for grid in grids:
+            yield renderer.render(grid)
+    else:
+        for grid in grids:
+            yield renderer.render(grid, size, palette=palette)
+
+
+def _sourceBitRate(media: dict, videoPath: str):
+    """返回源视频流的比特率(kbit/s)，未指定码率时作为输出视频的码率，元数据中没有时由文件大小及时长估算，无法估算时返回 None"""
+    bitRate = media["videoBitRate"] or media["bitRate"]
+    if bitRate is None and media["duration"]:
+        bitRate = int(os.path.getsize(videoPath) * 8 / 1000 / media["duration"])
+    return bitRate
+
+
+def _h264Ready(ffutils) -> bool:
+    """返回 ffmpeg 能否把原始灰度帧及 BGR 帧编码为 yuv420p 像素格式的 h264 视频"""
+    return ffutils.canEncode("h264", *FFCmdUtils.PIXFMTS, "yuv420p")
+
+
+def _profileReady(ffutils, profile: str) -> bool:
+    """返回 ffmpeg 能否按给定编码配置以 libx264 编码"""
+    settings = ENCODERPROFILES[profile]
+    return ffutils.canEncode("libx264", settings["gray"], settings["color"])
+
+
+def _convertSegment(
+    ffmpeg: str,
+    videoPath: str,
+    savePath: str,
+    segment: tuple,
+    size: tuple,
+    fps: float,
+    bitRate: int,
+    acqRate: float,
+    chars: str,
+    delta: bool,
+    color: bool = False,
+    palette: int = None,
+    profile: str = None,
+    ratio: float = None,
+    first: int = 0,
+    crop: tuple = None,
+):
+    """
+    ### 在工作进程中独立完成一个时间段的解码、渲染及编码
+
+    参数 segment 为 (起始秒, 帧数) 元组，帧数为 None 表示直到视频结尾，抽帧时帧数为输出帧数
+
+    参数 fps 为输出帧率，ratio 为抽帧的保留比例，first 为该段首帧在源视频中的序号，crop 为缩放前裁剪的画面区域，size 为裁剪后的大小
+
+    返回值：(是否成功, 写入的帧数)，失败时帧数为 0
+    """
+    ffutils = FFCmdUtils(ffmpeg)
+    start, frames = segment
+    pixFmt = FFCmdUtils.PIXFMTS[bool(color)]
+    decoder = ffutils.openDecoder(
+        videoPath,
+        _gridSize(size, acqRate, chars),
+        pixFmt,
+        start,
+        frames,
+        ratio,
+        first,
+        crop=crop,
+    )
+    if decoder is None:
+        return False, 0
+    encoder = ffutils.openEncoder(
+        savePath, size, fps, bitRate, "h264", pixFmt, True, profile
+    )
+    if encoder is None:
+        decoder.close()
+        return False, 0
+    written = 0
+    with decoder, encoder:
+        for image in _renderInline(decoder, size, chars, delta, palette):
+            if not encoder.write(image):
+                return False, 0
+            written += 1
+        if not decoder.close():
+            return False, 0  # 解码异常结束，该段不完整
+    if not encoder.close():
+        return False, 0
+    return True, written
+
+
+def _convertTask(task: tuple):
+    """进程池的任务包装，返回 (段序号, 是否成功)"""
+    segNum, args = task
+    return segNum, _convertSegment(*args)[0]
+
+
+def _frameRate(fps: float, targetFps: float = None):
+    """
+    ### 根据源视频帧率及目标帧率返回 (输出帧率, 保留比例)
+
+    目标帧率未给定、源帧率未知或目标帧率不低于源帧率时保持原帧率，保留比例为 None
+    """
+    if targetFps is None or not fps or fps <= 0 or targetFps >= fps:
+        return fps, None
+    return targetFps, targetFps / fps
+
+
+def _keepFrame(frameNum: int, ratio: float) -> bool:
+    """按时间表判断源视频第 frameNum 帧是否保留：输出的第 k 帧取时间上不早于 k/目标帧率 的第一个源帧"""
+    if ratio is None or frameNum == 0:
+        return True
+    return floor(frameNum * ratio + SCHEDULEEPS) > floor(
+        (frameNum - 1) * ratio + SCHEDULEEPS
+    )
+
+
+def _keptFrames(frameCount: int, ratio: float) -> int:
+    """源视频前 frameCount 帧中按时间表保留的帧数"""
+    if ratio is None:
+        return frameCount
+    if frameCount <= 0:
+        return 0
+    return floor((frameCount - 1) * ratio + SCHEDULEEPS) + 1
+
+
+def _segmentFrames(segment: tuple, fps: float, ratio: float):
+    """将以源视频帧计的分段 (起始秒, 帧数) 换算为抽帧后的 (起始秒, 输出帧数, 首帧序号)"""
+    start, frames = segment
+    # 分段计划跳转到首帧前半帧处，据此还原首帧在源视频中的序号
+    first = round(start * fps + 0.5) if start else 0
+    if ratio is not None and frames is not None:
+        frames = _keptFrames(first + frames, ratio) - _keptFrames(first, ratio)
+    return start, frames, first
+
+
+def _checkClip(start: float, end: float, crop):
+    """检查截取的时间范围及画面区域"""
+    for name, value in (("start", start), ("end", end)):
+        if not isinstance(value, (int, float, NONETYPE)):
+            raise TypeError(f"参数{name}的值必须是整型或浮点型。")
+        if value is not None and value < 0:
+            raise ValueError(f"参数{name}的值不能小于0。")
+    if start is not None and end is not None and end <= start:
+        raise ValueError("参数end的值必须大于参数start的值。")
+    if crop is None:
+        return
+    if (
+        not isinstance(crop, (tuple, list))
+        or len(crop) != 4
+        or not all(isinstance(value, int) for value in crop)
+    ):
+        raise TypeError("参数crop的值必须是由 (x, y, 宽, 高) 四个整数组成的元组。")
+    if crop[0] < 0 or crop[1] < 0 or crop[2] < 1 or crop[3] < 1:
+        raise ValueError("参数crop的值无效，x、y不能小于0，宽、高必须大于0。")
+    if crop[2] % 2 or crop[3] % 2:
+        # yuv420p 编码要求宽高为偶数，在解码之前检查，避免编码到中途才失败
+        raise ValueError("参数crop的值无效，宽、高必须是偶数。")
+
+
+def _clipRange(media: dict, start: float = None, end: float = None, crop=None):
+    """
+    ### 按源视频元数据将截取范围换算为源视频的帧，不截取时返回 None
+
+    取时间戳不早于 start 且早于 end 的帧；返回字典的键为 start，解码时跳转到的秒数(首帧前半帧处)；frames，源视频帧数，为 None 则直到视频结尾；first，首帧在源视频中的序号；crop，画面区域 (x, y, 宽, 高) 或 None
+    """
+    if start is None and end is None and crop is None:
+        return None
+    fps, total = media["fps"], media["frames"]
+    if (start or end is not None) and not fps:
+        raise ValueError("无法读取源视频的帧率，不能按时间截取。")
+    first = ceil(start * fps - SCHEDULEEPS) if start else 0
+    last = None if end is None else ceil(end * fps - SCHEDULEEPS)
+    if total:
+        if first >= total:
+            raise ValueError(f"参数start的值超出了视频时长({total / fps:.3f}秒)。")
+        if last is not None and last >= total:
+            last = None  # 直到视频结尾
+    if crop is not None:
+        x, y, width, height = crop
+        if x + width > media["width"] or y + height > media["height"]:
+            raise ValueError(
+                f"参数crop的区域超出了画面范围({media['width']}x{media['height']})。"
+            )
+        crop = tuple(crop)
+    return dict(
+        start=max(first - 0.5, 0) / fps if first else 0,
+        frames=None if last is None else max(last - first, 1),
+        first=first,
+        crop=crop,
+    )
+
+
+def _clipSize(media: dict, clip: dict = None) -> tuple:
+    """输出画面的 (宽, 高)：转正后的源视频画面大小，截取区域时为区域大小"""
+    if clip is not None and clip["crop"] is not None:
+        return tuple(clip["crop"][2:])
+    return media["width"], media["height"]
+
+
+def _clipFrames(media: dict, clip: dict = None, ratio: float = None) -> int:
+    """截取范围内按时间表保留的帧数，未知时为 0"""
+    first = 0 if clip is None else clip["first"]
+    last = media["frames"] or 0
+    if clip is not None and clip["frames"] is not None:
+        last = first + clip["frames"]
+    if last <= first:
+        return 0
+    return _keptFrames(last, ratio) - _keptFrames(first, ratio)
+
+
+def _clipSegment(clip: dict, fps: float, ratio: float):
+    """将截取范围换算为解码参数 (跳转秒数, 输出帧数, 首帧序号, 画面区域)，不截取时为 (None, None, 0, None)"""
+    if clip is None:
+        return None, None, 0, None
+    start, frames, first = _segmentFrames((clip["start"], clip["frames"]), fps, ratio)
+    return start, frames, first, clip["crop"]
+
+
+def _clipAudio(clip: dict, fps: float):
+    """截取范围对应的音频 (起始秒, 时长)，不截取时间时为 (None, None)"""
+    if clip is None or not fps:
+        return None, None
+    duration = None if clip["frames"] is None else clip["frames"] / fps
+    return (clip["first"] / fps or None), duration
+
+
+def _readFrames(
+    videoCapt,
+    gridSize: tuple = None,
+    color: bool = False,
+    ratio: float = None,
+    clip: dict = None,
+):
+    """
+    ### 逐帧读取视频，读取完毕即停止；指定 gridSize 则产出缩小到字符网格大小的灰度帧，彩色模式产出 BGR 帧
+
+    给定保留比例 ratio 时按时间表抽帧，丢弃的帧只 grab 而不 retrieve，省去像素格式转换及缩放
+
+    给定截取范围 clip 时先跳转到首帧，只读取范围内的帧，并在缩小之前裁剪画面区域
+    """
+    frameNum, last, crop = 0, None, None
+    if clip is not None:
+        # OpenCV 跳转到之前最近的关键帧后解码到目标帧，不必从头解码
+        videoCapt.set(CAP_PROP_POS_FRAMES, clip["first"])
+        frameNum, crop = clip["first"], clip["crop"]
+        if clip["frames"] is not None:
+            last = frameNum + clip["frames"]
+    while (last is None or frameNum < last) and videoCapt.grab():
+        if _keepFrame(frameNum, ratio):
+            boolResult, frame = videoCapt.retrieve()
+            if not boolResult:
+                break
+            if crop is not None:
+                x, y, width, height = crop
+                frame = frame[y : y + height, x : x + width]
+            if gridSize is None:
+                yield frame
+            else:
+                yield _sampleFrame(frame, gridSize, color)
+        frameNum += 1
+
+
+def _orderedMap(pool, func, iterable, window: int, kwdargs=None):
+    """
+    ### 以有界的在途窗口将任务分发给进程池，并按提交顺序逐个产出结果
+
+    同一时刻最多只有 window 个任务在途，内存占用与视频长度无关；工作进程抛出的异常会在此处重新抛出
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,), kwdargs))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class _InlineResult:
+    """_InlinePool 的任务结果，接口同 multiprocessing 的 AsyncResult"""
+
+    def __init__(self, func, args: tuple, kwds: dict):
+        self.__value = self.__error = None
+        try:
+            self.__value = func(*args, **kwds)
+        except Exception as err:
+            self.__error = err
+
+    def ready(self) -> bool:
+        return True
+
+    def successful(self) -> bool:
+        return self.__error is None
+
+    def get(self, timeout=None):
+        if self.__error is not None:
+            raise self.__error
+        return self.__value
+
+
+class _InlinePool:
+    """在当前线程中立即执行任务的池，接口同 multiprocessing.Pool 中用到的部分，不创建任何进程或线程"""
+
+    def __init__(self, initializer=None, initargs: tuple = ()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        pass
+
+    def apply_async(self, func, args: tuple = (), kwds: dict = None):
+        return _InlineResult(func, args, kwds or dict())
+
+    def imap_unordered(self, func, iterable):
+        return map(func, iterable)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def _makePool(executor: str, procNum: int, initializer=None, initargs: tuple = ()):
+    """按执行方式创建进程池、线程池或在当前线程中直接执行的池，三者的任务接口及结果顺序语义相同"""
+    if executor == "processes":
+        return Pool(procNum, initializer, initargs)
+    if executor == "threads":
+        return ThreadPool(procNum, initializer, initargs)
+    return _InlinePool(initializer, initargs)
+
+
+def _checkExecutor(executor: str):
+    """检查渲染执行方式"""
+    if executor not in EXECUTORS:
+        raise ValueError(f"参数executor的值无效，可用值为：{EXECUTORS}。")
+
+
+def _checkObservers(observers):
+    """检查观察者参数，返回观察者列表"""
+    if observers is None:
+        return list()
+    if callable(observers):
+        observers = (observers,)
+    if not isinstance(observers, (list, tuple)):
+        raise TypeError("参数observers的值必须是可调用对象或其列表。")
+    for observer in observers:
+        if not callable(observer):
+            raise TypeError("参数observers中的观察者必须是可调用对象。")
+    return list(observers)
+
+
+def _checkProfile(profile: str):
+    """检查编码配置名称"""
+    if profile is not None and profile not in ENCODERPROFILES:
+        raise ValueError(f"参数profile的值无效，可用值为：{tuple(ENCODERPROFILES)}。")
+
+
+def _checkSaveExt(savePath: str):
+    """检查保存路径的后缀名，生成的视频为 h264 编码，不能保存为不支持 h264 的容器"""
+    ext = os.path.splitext(savePath)[1].lower()
+    if ext in H264EXCLUDED:
+        raise ValueError(
+            f"生成的视频为h264编码，不能保存为'{ext}'文件，请使用'.mp4'等后缀。"
+        )
+
+
+def _report(message: str, metrics: Metrics = None):
+    """打印错误信息，有观察者时同时发出 error 事件"""
+    print(message)
+    if metrics is not None:
+        metrics.emit("error", message=message)
+
+
+def _checkResults(asyncResults: list, metrics: Metrics = None) -> int:
+    """检查进程池任务的结果，报告失败的任务数及首个异常，返回成功的任务数"""
+    failures = [result for result in asyncResults if not result.successful()]
+    if failures:
+        try:
+            failures[0].get()
+        except Exception as err:
+            _report(f"{len(failures)}帧图像转换失败，首个错误：{err!r}。", metrics)
+    succeeded = len(asyncResults) - len(failures)
+    if metrics is not None:
+        metrics.counters["rendered"] += succeeded
+    return succeeded
+
+
+def _writeFrames(write, images, metrics: Metrics = None) -> bool:
+    """
+    ### 将字符图像逐帧交给 write 写入，write 返回 False 时中断并返回 False
+
+    较新的 OpenCV 中 VideoWriter.write 写入失败时返回 False，较旧的版本总是返回 None
+
+    有观察者时记录每帧的写入耗时、帧数及字节数，并定时发出进度事件
+    """
+    if metrics is None:
+        for image in images:
+            if write(image) is False:
+                return False
+        return True
+    for image in images:
+        started = perf_counter()
+        result = write(image)
+        metrics.encoded(perf_counter() - started, image.nbytes)
+        if result is False:
+            return False
+    return True
 
 
 def makeVideo(
@@ -61,15 +592,27 @@ def makeVideo(
     acqRate: float = 0.2,
     chars=None,
     overwrite: bool = False,
+    stream: bool = True,
+    window: int = None,
+    delta: bool = False,
+    observers=None,
+    color: bool = False,
+    palette: int = None,
+    targetFps: float = None,
+    procNum=None,
+    executor: str = "processes",
+    start: float = None,
+    end: float = None,
+    crop=None,
 ):
     """
     ### 将视频转换为字符视频
 
     注意事项：
 
-    因 makeVideo 函数使用了多进程工作方式，且因 windows 平台新进程创建机制问题
+    默认以多进程方式渲染，因 windows 平台新进程创建机制问题
 
-    请确保你的程序运行入口唯一且处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果
+    请确保你的程序运行入口唯一且处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果；executor 为 'inline' 或 'threads' 时不创建进程，没有此限制
 
     ```
     参数 videoPath：str，源视频文件路径
@@ -79,10 +622,36 @@ def makeVideo(
     且使字符的等效灰度值分布尽量均匀，单字符的等效灰度值可以使用 imgtoch 模块的 grayscaleOf 函数查询
 
     参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+    参数 stream: bool，是否使用流式转换，帧以数组形式在内存中流转，不产生临时图片，可忽略
+    参数 window: int，流式转换时同时在途的最大帧数，决定内存占用上限，默认是进程数*2，可忽略
+    参数 delta: bool，流式转换时是否使用增量渲染，只重绘变化的字符，适合屏幕录像、动画等画面变化少的视频，可忽略
+    参数 observers: list，观察者列表，每个观察者是接受一个事件字典的可调用对象，事件格式见 Metrics，可忽略
+    参数 color: bool，是否生成彩色字符视频，每个字符按其所在区域的平均颜色着色(黑底)，需要流式转换，不支持增量渲染，可忽略
+    参数 palette: int，彩色模式下每个颜色通道量化为几个色阶，如 4 即 64 色，颜色越少生成的视频越小，可忽略
+    参数 targetFps: float，输出视频的帧率，低于源视频帧率时按时间均匀抽帧，丢弃的帧不再转换、渲染及编码，需要流式转换，可忽略
+    参数 procNum: int，渲染进程数，默认是可用cpu数*2；为'auto'时按容器配额等实际可用的cpu数，并以开头几帧测量各阶段耗时后自动确定，可忽略
+    参数 executor: str，渲染的执行方式，可用值：'processes'，进程池；'threads'，线程池，没有进程启动及传帧开销；'inline'，在当前线程中逐帧渲染，适合短视频或禁止创建进程的环境，可忽略
+    参数 start: float，只转换源视频从第几秒开始的部分，跳转到之前最近的关键帧后解码，不从头解码，可忽略
+    参数 end: float，只转换到源视频的第几秒(不含)，之后的帧不再解码，可忽略
+    参数 crop: tuple，只转换画面中 (x, y, 宽, 高) 的区域，宽、高须为偶数，在缩小到字符网格之前裁剪，生成的视频大小即区域大小，可忽略
     ```
     """
     if not isinstance(savePath, str):
         raise TypeError("保存路径参数值数据类型必须为字符串。")
+    observers = _checkObservers(observers)
+    _checkExecutor(executor)
+    _checkClip(start, end, crop)
+    procNum, auto = _checkProcNum(procNum, effectiveCpus() * 2)
+    streamOpts = _streamOptions(
+        stream,
+        window,
+        delta,
+        procNum,
+        color=color,
+        palette=palette,
+        targetFps=targetFps,
+        executor=executor,
+    )
     if os.path.splitext(savePath)[1] != ".avi":
         raise ValueError("文件保存路径中文件名需为'.avi'后缀。")
     if os.path.exists(savePath):
@@ -97,124 +666,754 @@ def makeVideo(
         print("参数videoPath的值数据类型不正确，仅接受字符串。")
     if not videoCapt.isOpened():
         return print("源视频文件无法打开，请检查路径是否正确或其他问题。")
-    fps = videoCapt.get(CAP_PROP_FPS)
-    width = int(videoCapt.get(CAP_PROP_FRAME_WIDTH))
-    height = int(videoCapt.get(CAP_PROP_FRAME_HEIGHT))
+    # 解码前读取元数据，帧数、画面方向不依赖 OpenCV 的估算
+    media = probeMedia(videoPath)
+    clip = _clipRange(media, start, end, crop)
+    fps, (width, height) = media["fps"], _clipSize(media, clip)
+    metrics = None
+    if observers:
+        outFps, ratio = _frameRate(fps, targetFps)
+        frameCount = _clipFrames(media, clip, ratio)
+        metrics = Metrics(observers, videoPath, savePath, frameCount)
+        metrics.emit("start", frames=frameCount, fps=outFps, size=[width, height])
+    success = False
+    try:
+        success = _makeVideo(
+            videoCapt,
+            videoPath,
+            savePath,
+            (width, height),
+            fps,
+            acqRate,
+            chars,
+            streamOpts,
+            procNum,
+            metrics,
+            auto,
+            executor,
+            clip,
+        )
+    except Exception as err:
+        if metrics is not None:
+            metrics.emit("error", message=repr(err))
+        raise
+    finally:
+        if metrics is not None:
+            metrics.finish(success)
+    return success
+
+
+def _makeVideo(
+    videoCapt,
+    videoPath,
+    savePath,
+    size,
+    fps,
+    acqRate,
+    chars,
+    streamOpts,
+    procNum,
+    metrics,
+    auto=False,
+    executor="processes",
+    clip=None,
+):
+    """makeVideo 的转换过程，clip 为截取范围，见 _clipRange"""
+    width, height = size
+    if streamOpts is not None:
+        return _streamVideo(
+            videoCapt,
+            savePath,
+            size,
+            fps,
+            acqRate,
+            chars,
+            streamOpts,
+            metrics,
+            auto,
+            clip,
+        )
     imgTemp, charImgTemp = tempfile.mkdtemp(), tempfile.mkdtemp()
     baseName = os.path.basename(videoPath)
     prefix = os.path.splitext(baseName)[0]
     frameNum, imgNameList = 0, list()
     print("开始分解视频...")
-    while True:
-        boolResult, frame = videoCapt.read()
-        if not boolResult:
-            break
+    for frame in _readFrames(videoCapt, clip=clip):
         name = f"{prefix}_{frameNum}.jpg"
         imgNameList.append(name)
         imwrite(os.path.join(imgTemp, name), frame, [IMWRITE_JPEG_QUALITY, 80])
         frameNum += 1
     videoCapt.release()
-    makeImageProcessPool = Pool(os.cpu_count() * 2)
+    if metrics is not None:
+        metrics.counters["decoded"] = frameNum
+    makeImageProcessPool = _makePool(executor, procNum)
     kwdargs = dict(scale=acqRate, keepSize=1, chars=chars)
     print("开始转换图像...")
+    asyncResults = list()
     for imgName in imgNameList:
         imgPath = os.path.join(imgTemp, imgName)
         imgSave = os.path.join(charImgTemp, imgName)
-        makeImageProcessPool.apply_async(makeImage, (imgPath, imgSave), kwdargs)
+        asyncResults.append(
+            makeImageProcessPool.apply_async(makeImage, (imgPath, imgSave), kwdargs)
+        )
     makeImageProcessPool.close()
     makeImageProcessPool.join()  # 等待进程全部结束
     shutil.rmtree(imgTemp)
+    if _checkResults(asyncResults, metrics) < len(asyncResults):
+        shutil.rmtree(charImgTemp)
+        return False
     fourcc = VideoWriter_fourcc(*"MP42")
     try:
         videoWrt = VideoWriter(savePath, fourcc, fps, (width, height), True)
     except Exception:
-        print("视频写入失败，检查保存位置是否有写入权限。")
+        _report("视频写入失败，检查保存位置是否有写入权限。", metrics)
         return False
     videoWrt.set(VIDEOWRITER_PROP_QUALITY, 50)
     print("开始合成视频...")
-    for imgName in imgNameList:
-        videoWrt.write(imread(os.path.join(charImgTemp, imgName)))
+    images = (imread(os.path.join(charImgTemp, name)) for name in imgNameList)
+    success = _writeFrames(videoWrt.write, images, metrics)
     videoWrt.release()
     shutil.rmtree(charImgTemp)
+    if not success:
+        _report("视频写入失败，检查保存路径及文件格式是否受支持。", metrics)
+    return success
+
+
+def _streamOptions(
+    stream: bool,
+    window: int,
+    delta: bool,
+    procNum: int,
+    segments: int = None,
+    resume: bool = False,
+    color: bool = False,
+    palette: int = None,
+    targetFps: float = None,
+    executor: str = "processes",
+):
+    """检查并整理流式转换选项，不使用流式转换时返回 None"""
+    if not isinstance(window, (int, NONETYPE)):
+        raise TypeError("参数window的值必须是整型数据。")
+    if window is not None and window < 1:
+        raise ValueError("参数window的值必须大于0。")
+    if not isinstance(segments, (int, NONETYPE)):
+        raise TypeError("参数segments的值必须是整型数据。")
+    if segments is not None and segments < 1:
+        raise ValueError("参数segments的值必须大于0。")
+    if not isinstance(palette, (int, NONETYPE)):
+        raise TypeError("参数palette的值必须是整型数据。")
+    if palette is not None and not (2 <= palette <= 256):
+        raise ValueError("参数palette的值应在2与256之间。")
+    if color and not stream:
+        raise ValueError("彩色模式需要流式转换，参数stream的值不能为False。")
+    if color and delta:
+        raise ValueError("彩色模式不支持增量渲染，参数delta的值不能为True。")
+    if not isinstance(targetFps, (int, float, NONETYPE)):
+        raise TypeError("参数targetFps的值必须是整型或浮点型。")
+    if targetFps is not None and targetFps <= 0:
+        raise ValueError("参数targetFps的值必须大于0。")
+    if targetFps is not None and not stream:
+        raise ValueError("降低帧率需要流式转换，参数stream的值不能为False。")
+    if not stream:
+        return None
+    if window is None:
+        window = procNum * 2
+    return dict(
+        procNum=procNum,
+        window=window,
+        delta=bool(delta),
+        segments=segments,
+        resume=bool(resume),
+        color=bool(color),
+        palette=palette if color else None,
+        targetFps=targetFps,
+        executor=executor,
+        plan=None,
+    )
+
+
+def _renderFrames(grids, size: tuple, chars: str, streamOpts: dict):
+    """
+    ### 将字符网格大小的灰度帧逐帧渲染为字符图像数组，按原顺序产出
+
+    增量渲染需要上一帧的结果，因此在当前进程中顺序进行，否则按执行方式在当前线程、线程池或进程池中渲染
+
+    线程池共用同一个渲染器，渲染主要是释放 GIL 的 NumPy 及 OpenCV 运算，可利用多核且没有进程启动及传输开销
+
+    进程池渲染时优先经由共享内存帧缓冲区传递帧，进程间只传递槽位序号；产出的数组在下一次迭代前有效
+    """
+    if streamOpts["delta"]:
+        renderer = DeltaRenderer(_getRenderer(chars), size)
+        for grid in grids:
+            yield renderer.render(grid)
+        print(f"增量渲染：{renderer.summary()}")
+        return
+    if streamOpts["executor"] == "inline":
+        yield from _renderInline(grids, size, chars, palette=streamOpts["palette"])
+        return
+    kwdargs = dict(size=size, chars=chars, palette=streamOpts["palette"])
+    if streamOpts["executor"] == "threads":
+        _getRenderer(chars)  # 先在当前线程中构建字形图集，避免各线程重复构建
+        with ThreadPool(streamOpts["procNum"]) as makeImageThreadPool:
+            yield from _orderedMap(
+                makeImageThreadPool, _charImage, grids, streamOpts["window"], kwdargs
+            )
+        return
+    grids = iter(grids)
+    first = next(grids, None)
+    if first is None:
+        return
+    grids = chain((first,), grids)
+    outShape = (size[1], size[0], 3) if streamOpts["color"] else (size[1], size[0])
+    ring = _openRing(streamOpts["window"], first.shape, outShape)
+    if ring is None:
+        with Pool(streamOpts["procNum"]) as makeImageProcessPool:
+            yield from _orderedMap(
+                makeImageProcessPool, _charImage, grids, streamOpts["window"], kwdargs
+            )
+        return
+    with ring, Pool(
+        streamOpts["procNum"], _attachRing, (ring.spec,)
+    ) as makeImageProcessPool:
+        yield from ring.imap(makeImageProcessPool, _renderSlot, grids, kwdargs)
+
+
+def _trackFrames(grids, size: tuple, chars: str, streamOpts: dict, metrics=None):
+    """渲染字符图像，有观察者时分别统计解码及渲染的帧数和耗时"""
+    if metrics is None:
+        return _renderFrames(grids, size, chars, streamOpts)
+    grids = metrics.track("decode", grids, "decoded")
+    images = _renderFrames(grids, size, chars, streamOpts)
+    return metrics.track("render", images, "rendered")
+
+
+def _calibrate(grids, size: tuple, chars: str, palette: int, write, close):
+    """
+    ### 以开头几帧分别测量解码、渲染、编码每帧的单线程耗时(秒)
+
+    grids 为单线程解码开头几帧的可迭代对象，write 及 close 为测量用的单线程编码器的写入及关闭函数
+
+    首帧含进程启动等一次性开销，解码及编码都从第二帧起计时；返回 {阶段名: 每帧秒数}，不足 2 帧时返回 None
+    """
+    try:
+        grids = iter(grids)
+        first = next(grids, None)
+        started = perf_counter()
+        samples = [grid.copy() for grid in islice(grids, CALIBFRAMES - 1)]
+        decode = perf_counter() - started
+        if first is None or not samples:
+            return None
+        samples.insert(0, first)
+        renderer = _getRenderer(chars)
+        started = perf_counter()
+        images = [renderer.render(grid, size, palette=palette) for grid in samples]
+        render = perf_counter() - started
+        write(images[0])
+        started = perf_counter()
+        for image in images[1:]:
+            write(image)
+        close()
+        encode = perf_counter() - started
+    finally:
+        close()
+    frames = len(samples)
+    return dict(
+        decode=decode / (frames - 1),
+        render=render / frames,
+        encode=encode / (frames - 1),
+    )
+
+
+def _schedule(
+    grids, size: tuple, chars: str, streamOpts: dict, probe, inline=(), metrics=None
+):
+    """
+    ### 自动调度：测量开头几帧各阶段的耗时，按实际可用的 CPU 分别确定解码、渲染、编码的线程数或进程数
+
+    在 ffmpeg 中进行的解码、编码阶段可指定线程数，渲染阶段为进程池的进程数；inline 中的阶段在当前进程中顺序进行，合计只占 1 个 CPU
+
+    参数 probe 为测量用编码器的 (写入函数, 关闭函数)；返回加入调度结果 plan 并以渲染进程数为 procNum 的流式转换选项，测量失败时原样返回
+    """
+    costs = _calibrate(grids, size, chars, streamOpts["palette"], *probe)
+    if costs is None:
+        return streamOpts
+    if streamOpts["executor"] == "inline":
+        inline = (*inline, "render")
+    cpus = effectiveCpus()
+    stages = {stage: cost for stage, cost in costs.items() if stage not in inline}
+    if inline:
+        stages["main"] = sum(costs[stage] for stage in inline)
+    plan = planStages(stages, cpus, dict(main=1))
+    plan = {stage: plan.get(stage, 1) for stage in costs}
+    print(
+        "自动调度：可用{}个CPU，解码{}线程，渲染{}{}，编码{}线程。".format(
+            cpus,
+            plan["decode"],
+            plan["render"],
+            ("线程", "进程")[streamOpts["executor"] == "processes"],
+            plan["encode"],
+        )
+    )
+    if metrics is not None:
+        metrics.emit("schedule", cpus=cpus, costs=costs, inline=list(inline), **plan)
+    return dict(streamOpts, procNum=plan["render"], plan=plan)
+
+
+def _checkProcNum(procNum, default: int):
+    """检查进程数参数，'auto' 表示自动调度，返回 (进程数, 是否自动调度)"""
+    if procNum == "auto":
+        return effectiveCpus(), True
+    if procNum is None:
+        return default, False
+    if not isinstance(procNum, int):
+        raise TypeError("参数procNum的值必须是整型数据或'auto'。")
+    if procNum < 1:
+        raise ValueError("参数procNum的值必须大于0。")
+    return procNum, False
+
+
+def _cv2Writer(videoWrt, color: bool):
+    """返回向 OpenCV 写入字符图像的函数，灰度图像先转为三通道"""
+    if color:
+        return videoWrt.write
+    return lambda image: videoWrt.write(cvtColor(image, COLOR_GRAY2BGR))
+
+
+def _cv2Probe(size: tuple, fps: float, color: bool):
+    """打开自动调度测量用的 OpenCV 编码器，返回 (写入函数, 关闭函数)，关闭时一并删除临时文件"""
+    tempDir = tempfile.mkdtemp()
+    fourcc = VideoWriter_fourcc(*"MP42")
+    probePath = os.path.join(tempDir, "calibration.avi")
+    videoWrt = VideoWriter(probePath, fourcc, fps, size, True)
+
+    def close():
+        videoWrt.release()
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    return _cv2Writer(videoWrt, color), close
+
+
+def _streamVideo(
+    videoCapt,
+    savePath,
+    size,
+    fps,
+    acqRate,
+    chars,
+    streamOpts,
+    metrics=None,
+    auto: bool = False,
+    clip: dict = None,
+):
+    """流式转换：解码、转换、写入同时进行，不产生任何临时图片，给定截取范围 clip 时只解码范围内的帧"""
+    fps, ratio = _frameRate(fps, streamOpts["targetFps"])
+    gridSize = _gridSize(size, acqRate, chars)
+    if auto:
+        # 解码及编码都由 OpenCV 在当前进程中顺序进行
+        grids = _readFrames(videoCapt, gridSize, streamOpts["color"], ratio, clip)
+        probe = _cv2Probe(size, fps, streamOpts["color"])
+        inline = ("decode", "encode")
+        streamOpts = _schedule(grids, size, chars, streamOpts, probe, inline, metrics)
+        videoCapt.set(CAP_PROP_POS_FRAMES, 0)
+    fourcc = VideoWriter_fourcc(*"MP42")
+    try:
+        videoWrt = VideoWriter(savePath, fourcc, fps, size, True)
+    except Exception:
+        videoCapt.release()
+        _report("视频写入失败，检查保存位置是否有写入权限。", metrics)
+        return False
+    videoWrt.set(VIDEOWRITER_PROP_QUALITY, 50)
+    grids = _readFrames(videoCapt, gridSize, streamOpts["color"], ratio, clip)
+    print("开始流式转换视频...")
+    success = _writeFrames(
+        _cv2Writer(videoWrt, streamOpts["color"]),
+        _trackFrames(grids, size, chars, streamOpts, metrics),
+        metrics,
+    )
+    videoWrt.release()
+    videoCapt.release()
+    if not success:
+        _report("视频写入失败，检查保存路径及文件格式是否受支持。", metrics)
+    return success
+
+
+def _clearObstacle(path):
+    """检查路径是否存在并尝试删除文件或空文件夹"""
+    if os.path.exists(path):
+        if os.path.isfile(path):
+            try:
+                os.remove(path)
+            except Exception:
+                print("已存在同名文件且无法删除，生成中断。")
+                return False
+        else:
+            try:
+                os.rmdir(path)
+            except Exception:
+                print("已存在同名非空文件夹，生成中断。")
+                return False
     return True
 
 
-def _clearObstacle(path):
-    """检查路径是否存在并尝试删除文件或空文件夹"""
-    if os.path.exists(path):
-        if os.path.isfile(path):
-            try:
-                os.remove(path)
-            except Exception:
-                print("已存在同名文件且无法删除，生成中断。")
-                return False
-        else:
-            try:
-                os.rmdir(path)
-            except Exception:
-                print("已存在同名非空文件夹，生成中断。")
-                return False
-    return True
+class FFEncoder:
+    """
+    ### ffmpeg 编码管道
+
+    启动一个从标准输入读取原始像素数据(rawvideo)的 ffmpeg 进程，逐帧写入即边写边编码，不产生任何临时图片
+
+    请通过 FFCmdUtils.openEncoder 方法创建，使用完毕需调用 close 方法，或使用 with 语句
+    """
+
+    def __init__(self, command):
+        self.__proc = Popen(command, stdin=PIPE, startupinfo=FFCmdUtils.STARTUP)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    def write(self, frame) -> bool:
+        """写入一帧，帧的尺寸及像素格式须与创建编码管道时指定的一致"""
+        try:
+            self.__proc.stdin.write(ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError, ValueError):
+            return False
+        return True
+
+    def close(self) -> bool:
+        """关闭输入并等待 ffmpeg 编码结束，返回编码是否成功"""
+        try:
+            self.__proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        return not self.__proc.wait()
+
+
+class _DecodeError(RuntimeError):
+    """ffmpeg 解码进程异常结束，已解码的帧不完整"""
+
+
+class FFDecoder:
+    """
+    ### ffmpeg 解码管道
+
+    启动一个将视频解码并缩放为原始像素数据(rawvideo)写到标准输出的 ffmpeg 进程，迭代即可逐帧得到图像数组
+
+    请通过 FFCmdUtils.openDecoder 方法创建，使用完毕需调用 close 方法，或使用 with 语句
+    """
+
+    def __init__(self, command, size: tuple, channels: int):
+        self.__size = width, height = size
+        self.__shape = (height, width) if channels == 1 else (height, width, channels)
+        self.__frameBytes = width * height * channels
+        self.__finished = False
+        self.__proc = Popen(command, stdout=PIPE, startupinfo=FFCmdUtils.STARTUP)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTB):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                break
+            yield frame
+
+    @property
+    def size(self):
+        """输出帧的 (宽, 高)"""
+        return self.__size
+
+    def read(self):
+        """读取下一帧，已无帧可读时返回 None"""
+        buffer = self.__proc.stdout.read(self.__frameBytes)
+        if len(buffer) < self.__frameBytes:
+            self.__finished = True
+            return None
+        return frombuffer(buffer, uint8).reshape(self.__shape)
+
+    def close(self) -> bool:
+        """结束 ffmpeg 进程，返回解码是否正常结束，未读完即关闭视为提前终止"""
+        if not self.__finished and self.__proc.poll() is None:
+            self.__proc.kill()
+        self.__proc.stdout.close()
+        return not self.__proc.wait()
+
+
+class FFCmdUtils:
+    STARTUP = STARTUP  # 仅 Windows 下有值，用于隐藏子进程的控制台窗口
+    PIXFMTS = "gray", "bgr24"
+    # 子类可替换编解码管道的实现，如异步版本的 AsyncFFCmdUtils
+    ENCODER, DECODER = FFEncoder, FFDecoder
+
+    def __init__(self, ffmpeg: str = None):
+        if ffmpeg is None:
+            self.__fm = self.detExecutable()
+        elif isinstance(ffmpeg, str):
+            ffmpeg = os.path.abspath(ffmpeg)
+            if os.path.isfile(ffmpeg) and os.access(ffmpeg, 1):
+                self.__fm = ffmpeg
+            else:
+                self.__fm = self.detExecutable()
+                print("参数 ffmpegPath 的值是无效路径，使用自动检测值。")
+        else:
+            self.__fm = self.detExecutable()
+            print("参数 ffmpegPath 值的数据类型不正确，使用自动检测值。")
+        self.__cmd = self.__fm, "-nostats", "-loglevel", "quiet"
+        self.__fp = self.detProbe(self.__fm)
+
+    @staticmethod
+    def detExecutable():
+        """
+        ### 探测 ffmpeg 可执行文件位置
+
+        首先会在当前目录寻找，找不到则在系统环境变量中寻找，再找不到则返回 None；同一进程内只查找一次
+        """
+        execPath = findExecutable("ffmpeg")
+        if execPath is None:
+            print("找不到任何ffmpeg可执行文件。")
+        return execPath
+
+    @staticmethod
+    def detProbe(ffmpeg: str):
+        """探测与 ffmpeg 同目录的 ffprobe 可执行文件，找不到则返回 None"""
+        if ffmpeg is None:
+            return None
+        dirPath, fileName = os.path.split(ffmpeg)
+        execPath = os.path.join(dirPath, fileName.replace("ffmpeg", "ffprobe", 1))
+        if execPath != ffmpeg and os.path.isfile(execPath) and os.access(execPath, 1):
+            return execPath
+        return None
+
+    def isReady(self) -> bool:
+        """返回 FFCmdUtils 是否可用"""
+        return self.__fm is not None
+
+    @property
+    def executable(self):
+        """ffmpeg 可执行文件的路径，不可用时为 None"""
+        return self.__fm
+
+    @staticmethod
+    def executeCmd(cmd):
+        try:
+            result = run(cmd, startupinfo=FFCmdUtils.STARTUP)
+        except Exception:
+            return False
+        return not result.returncode
+
+    @staticmethod
+    def captureCmd(cmd):
+        """执行命令并返回其标准输出文本，执行失败则返回 None"""
+        try:
+            result = run(cmd, stdout=PIPE, startupinfo=FFCmdUtils.STARTUP)
+        except Exception:
+            return None
+        if result.returncode:
+            return None
+        return result.stdout.decode("utf-8", "replace")
+
+    def keyframes(self, videoPath: str):
+        """
+        ### 返回视频流中关键帧的时间(秒)列表
+
+        只读取数据包，不解码，需要 ffprobe 与 ffmpeg 位于同一目录，ffprobe 不可用或读取失败时返回 None；结果来自 probe，同一文件只读取一次
+        """
+        if self.__fp is None:
+            return None
+        media = self.probe(videoPath)
+        return None if media is None else media["keyframes"]
+
+    def probe(self, videoPath: str, refresh: bool = False):
+        """
+        ### 读取视频文件的元数据，包括准确的帧数、时长、各流的编码及比特率、旋转角度、关键帧位置等，格式见 probeMedia
+
+        优先使用与 ffmpeg 位于同一目录的 ffprobe，只读取一遍数据包，不解码；ffprobe 不可用时退回使用 OpenCV，帧数为估算值
+
+        结果按源视频指纹缓存，同一文件只需读取一次，无法读取时返回 None
+        """
+        return probeMedia(videoPath, self.__fp, refresh)
+
+    def concat(self, videoPaths: list, savePath: str, overwrite: bool = False):
+        """
+        ### 使用 concat 分离器无损拼接编码参数相同的多个视频
+
+        ```
+        参数 videoPaths: list，要拼接的视频文件路径列表，按顺序拼接
+        参数 savePath: str，拼接后的视频的保存路径，包括文件名
+        参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        ```
+        """
+        if not self.isReady():
+            return False
+        if not isinstance(savePath, str):
+            raise TypeError("参数savePath的值数据类型必须是字符串。")
+        listPath = f"{savePath}.concat.txt"
+        try:
+            with open(listPath, "w", encoding="utf-8") as listFile:
+                for videoPath in videoPaths:
+                    escaped = os.path.abspath(videoPath).replace("'", "'\\''")
+                    listFile.write(f"file '{escaped}'\n")
+        except Exception as err:
+            print(f"拼接列表文件写入失败：{err}。")
+            return False
+        command = [
+            *self.__cmd,
+            "-f",  # 指定输入格式
+            "concat",  # 使用 concat 分离器
+            "-safe",  # 允许绝对路径
+            "0",
+            "-i",  # 指定输入路径
+            listPath,
+            "-c",  # 指定编码器
+            "copy",  # 编码器是"复制"
+        ]
+        if overwrite:
+            command.extend(("-y", savePath))
+        else:
+            command.extend(("-n", savePath))
+        try:
+            return FFCmdUtils.executeCmd(command)
+        finally:
+            os.remove(listPath)
+
+    def info(self, refresh: bool = False):
+        """
+        ### 返回 ffmpeg 的版本及支持的编码器、像素格式，格式见 ffmpegInfo
+
+        探测结果缓存在进程内及磁盘上，同一 ffmpeg 只需查询一次，ffmpeg 不可用时返回 None
+        """
+        if not self.isReady():
+            return None
+        return ffmpegInfo(self.__fm, refresh)
+
+    def encoders(self) -> set:
+        """返回 ffmpeg 支持的编码器名称集合，ffmpeg 不可用时返回空集合"""
+        info = self.info()
+        return set() if info is None else set(info["encoders"])
+
+    def canEncode(self, codec: str, *pixFmts: str) -> bool:
+        """
+        ### 返回 ffmpeg 能否以给定编码器或编码格式(如 'libx264'、'h264')编码，并支持给定的全部像素格式
 
+        用于在开始转换前检查编码参数，避免解码、渲染到中途才因 ffmpeg 不支持而失败；无法探测 ffmpeg 的能力时返回 True，交由 ffmpeg 自行判断
+        """
+        info = self.info()
+        if info is None or not info["encoders"]:
+            return self.isReady()
+        encoders = info["encoders"]
+        if codec not in encoders and codec not in encoders.values():
+            return False
+        return not info["pixFmts"] or all(p in info["pixFmts"] for p in pixFmts)
 
-class FFCmdUtils:
-    STARTUP = STARTUPINFO(dwFlags=1, wShowWindow=0)
+    def __checkCodec(self, codec: str, profile: str = None) -> bool:
+        """开始编码前检查 ffmpeg 是否支持将要使用的编码器，不支持时打印提示并返回 False"""
+        if profile is not None and self.canEncode("libx264"):
+            return True
+        if codec is None or self.canEncode(codec):
+            return True
+        print(f"ffmpeg不支持编码器'{codec}'。")
+        return False
 
-    def __init__(self, ffmpeg: str = None):
-        if ffmpeg is None:
-            self.__fm = self.detExecutable()
-        elif isinstance(ffmpeg, str):
-            ffmpeg = os.path.abspath(ffmpeg)
-            if os.path.isfile(ffmpeg) and os.access(ffmpeg, 1):
-                self.__fm = ffmpeg
-            else:
-                self.__fm = self.detExecutable()
-                print("参数 ffmpegPath 的值是无效路径，使用自动检测值。")
-        else:
-            self.__fm = self.detExecutable()
-            print("参数 ffmpegPath 值的数据类型不正确，使用自动检测值。")
-        self.__cmd = self.__fm, "-nostats", "-loglevel", "quiet"
+    def __videoArgs(
+        self,
+        codec: str,
+        bitRate: int,
+        profile: str = None,
+        gray: bool = False,
+        pixFmt: str = None,
+    ) -> list:
+        """
+        ### 返回视频编码相关的 ffmpeg 输出参数
 
-    @staticmethod
-    def detExecutable():
+        给定编码配置时以 libx264 按配置的 CRF、预设、调校、关键帧间隔及像素格式编码，bitRate 作为码率上限
+
+        未给定编码配置或 ffmpeg 不支持 libx264 时按 codec 及 bitRate 编码，给定 pixFmt 则同时指定输出像素格式
         """
-        ### 探测 ffmpeg 可执行文件位置
+        if profile is not None and not self.canEncode("libx264"):
+            print(
+                f"ffmpeg不支持libx264编码器，编码配置'{profile}'无效，使用默认编码参数。"
+            )
+            profile = None
+        args = list()
+        if profile is None:
+            if codec is not None:
+                args.extend(("-c:v", codec))  # 指定视频编码器
+            if bitRate is not None:
+                args.extend(("-b:v", f"{bitRate}k"))  # 指定视频比特率
+            if pixFmt is not None:
+                args.extend(("-pix_fmt", pixFmt))  # 指定输出像素格式
+            return args
+        settings = ENCODERPROFILES[profile]
+        args.extend(
+            (
+                "-c:v",  # 指定视频编码器
+                "libx264",
+                "-preset",  # 编码速度与压缩率的权衡
+                settings["preset"],
+                "-crf",  # 恒定质量，值越大质量越低文件越小
+                f"{settings['crf']}",
+                "-g",  # 最大关键帧间隔
+                f"{settings['gop']}",
+                "-pix_fmt",  # 指定输出像素格式
+                settings["gray" if gray else "color"],
+            )
+        )
+        if settings["tune"] is not None:
+            args.extend(("-tune", settings["tune"]))  # 针对画面内容调校
+        if bitRate is not None:
+            # 恒定质量下限制码率峰值
+            args.extend(("-maxrate", f"{bitRate}k", "-bufsize", f"{bitRate * 2}k"))
+        if settings.get("faststart"):
+            args.extend(("-movflags", "+faststart"))  # 索引前置，网页可边下边播
+        return args
 
-        首先会在当前目录寻找，找不到则在系统环境变量中寻找，再找不到则返回 None。
+    def audioCodec(self, videoPath: str):
         """
-        osName = os.name == "nt"
-        ffexecutable = ("ffmpeg", "ffmpeg.exe")[osName]
-        cuiDir = os.path.abspath(os.getcwd())
-        try:
-            fileList = os.listdir(cuiDir)
-            execPath = os.path.join(cuiDir, ffexecutable)
-            if (
-                ffexecutable in fileList
-                and os.path.isfile(execPath)
-                and os.access(execPath, 1)
-            ):
-                return execPath
-        except Exception:
-            pass
-        pathsInPATH = os.getenv("PATH", "").split(os.pathsep)
-        for path in pathsInPATH:
-            execPath = os.path.join(path, ffexecutable)
-            if os.path.isfile(execPath) and os.access(execPath, 1):
-                return execPath
-        print("找不到任何ffmpeg可执行文件。")
-        return None
+        ### 返回文件中第一条音频流的编码名称，如 'aac'、'opus'、'pcm_s16le'
 
-    def isReady(self) -> bool:
-        """返回 FFCmdUtils 是否可用"""
-        return self.__fm is not None
+        有 ffprobe 时由 ffprobe 读取，否则解析 ffmpeg 打印的输入文件信息，只读取文件头，不解码
 
-    @staticmethod
-    def executeCmd(cmd):
+        返回值：编码名称，没有音频流时返回空字符串，无法读取时返回 None
+        """
+        if not isinstance(videoPath, str):
+            raise TypeError("参数videoPath的值数据类型必须是字符串。")
+        if self.__fp is not None:
+            command = [
+                self.__fp,
+                "-loglevel",
+                "error",
+                "-select_streams",  # 只选择第一条音频流
+                "a:0",
+                "-show_entries",  # 只输出编码名称
+                "stream=codec_name",
+                "-of",  # 输出为不带键名的 csv
+                "csv=p=0",
+                videoPath,
+            ]
+            output = FFCmdUtils.captureCmd(command)
+            if output is not None:
+                return output.strip()
+        if not self.isReady():
+            return None
         try:
-            result = run(cmd, startupinfo=FFCmdUtils.STARTUP)
+            # 只指定输入时 ffmpeg 打印输入信息后以非零状态退出，信息在标准错误中
+            result = run(
+                [self.__fm, "-hide_banner", "-i", videoPath],
+                stderr=PIPE,
+                startupinfo=FFCmdUtils.STARTUP,
+            )
         except Exception:
-            return False
-        return not result.returncode
+            return None
+        info = result.stderr.decode("utf-8", "replace")
+        if "Input #0" not in info:
+            return None
+        match = re.search(r"Stream #0:\d+.*?: Audio: (\w+)", info)
+        return match.group(1) if match else ""
 
     def mux(
         self,
@@ -222,15 +1421,25 @@ class FFCmdUtils:
         audioPath: str,
         savePath: str = None,
         overwrite: bool = False,
+        start: float = None,
+        duration: float = None,
+        codec: str = None,
     ):
         """
         ### 封装音频及视频
 
+        直接从 audioPath 中映射第一条音频流，可以是音频文件，也可以是含音轨的视频文件(如转换前的源视频)，无需先拆分音频
+
+        音频编码与输出容器兼容时原样复制，否则(如 WebM 中的 Opus 封装到 .mp4)只对音频转码；audioPath 没有音频流时只复制视频流
+
         ```
-        参数 videoPath: str，要封装的视频文件路径
-        参数 audioPath: str，要封装的音频文件路径
+        参数 videoPath: str，要封装的视频文件路径，取其第一条视频流
+        参数 audioPath: str，音频来源文件路径，取其第一条音频流
         参数 savePath: str，封装后的视频文件保存路径，包括文件名，忽略则保存到源视频目录，并以'[时间]源视频文件名.原后缀名'作文件名
         参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 start: float，音频从 audioPath 的第几秒开始取，与截取片段转换得到的视频对齐，可忽略
+        参数 duration: float，最多取多少秒音频，为 None 则取到结尾，可忽略
+        参数 codec: str，audioPath 中音频的编码名称，即 audioCodec 方法的返回值，为 None 则在封装前读取，可忽略
         ```
         """
         if not self.isReady():
@@ -239,6 +1448,13 @@ class FFCmdUtils:
             raise TypeError("参数videoPath的值数据类型必须是字符串。")
         if not isinstance(audioPath, str):
             raise TypeError("参数audioPath的值数据类型必须是字符串。")
+        if codec is None:
+            codec = self.audioCodec(audioPath)
+        trim = list()
+        if start:
+            trim.extend(("-ss", f"{start:.6f}"))  # 在输入端跳转，只读取所需部分
+        if duration is not None:
+            trim.extend(("-t", f"{duration:.6f}"))  # 限制读取时长
         dirPath, basename = os.path.split(videoPath)
         if savePath is None:
             prefix = strftime("[%Y-%m-%d_%H-%M-%S]", localtime())
@@ -248,20 +1464,34 @@ class FFCmdUtils:
         command = [
             *self.__cmd,
             "-i",  # 指定输入路径
-            audioPath,
-            "-i",  # 指定输入路径
             videoPath,
-            "-c:v",  # 指定视频解码器
-            "copy",  # 视频解码器是"复制"
-            "-c:a",  # 指定音频解码器
-            "copy",  # 音频解码器是"复制"
+            *trim,
+            "-i",  # 指定输入路径
+            audioPath,
+            "-map",  # 取第一个输入的第一条视频流
+            "0:v:0",
+            "-map",  # 取第二个输入的第一条音频流，没有则忽略
+            "1:a:0?",
+            "-c:v",  # 指定视频编码器
+            "copy",  # 视频编码器是"复制"
+            "-c:a",  # 指定音频编码器
+            self.__audioEncoder(codec, savePath),
             savePath,  # 文件输出路径
         ]
         if overwrite:
             command.append("-y")
         else:
             command.append("-n")
-        return FFCmdUtils.executeCmd(command)
+        return self.executeCmd(command)
+
+    @staticmethod
+    def __audioEncoder(codec: str, savePath: str) -> str:
+        """音频编码可直接放入输出容器时返回 'copy'，否则返回该容器适用的音频编码器"""
+        ext = os.path.splitext(savePath)[1].lower()
+        if not codec or ext not in AUDIOCODECS:
+            return "copy"
+        compatible, encoder = AUDIOCODECS[ext]
+        return "copy" if codec in compatible else encoder
 
     def demux(
         self,
@@ -322,7 +1552,7 @@ class FFCmdUtils:
             command.extend(("-an", "-c:v", "copy", videoSavePath))
         else:
             return False
-        return FFCmdUtils.executeCmd(command)
+        return self.executeCmd(command)
 
     def convert(
         self,
@@ -332,6 +1562,7 @@ class FFCmdUtils:
         bitRate: int = None,
         codec: str = None,
         overwrite: bool = False,
+        profile: str = None,
     ):
         """
         ### 转换视频格式
@@ -343,10 +1574,12 @@ class FFCmdUtils:
         参数 bitRate: int，转换后的视频的码率，默认单位为k，例如此参数值为'1500'则代表转换后视频限制其码率在1500k左右，可忽略
         参数 codec: str，指定转换使用的编码器名，建议使用'h264'(要求ffmpeg是完整版，否则转换会出错)，可忽略
         参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 profile: str，编码配置名称，可用值见 ENCODERPROFILES，给定时忽略 codec，bitRate 作为码率上限，可忽略
         ```
         """
         if not self.isReady():
             return False
+        _checkProfile(profile)
         if not isinstance(videoPath, str):
             raise TypeError("参数videoPath的值数据类型必须是字符串。")
         dirPath, basename = os.path.split(videoPath)
@@ -363,19 +1596,18 @@ class FFCmdUtils:
             raise TypeError("参数bitRate的值数据类型必须是整型。")
         if not isinstance(codec, (str, NONETYPE)):
             raise TypeError("参数codec的值数据类型必须是字符串类型。")
+        if not self.__checkCodec(codec, profile):
+            return False
         command = [*self.__cmd, "-i", videoPath]
-        if codec is not None:
-            command.extend(("-c:v", f"{codec}"))  # 指定视频解码器
+        command.extend(self.__videoArgs(codec, bitRate, profile))
         if fps is not None:
             command.extend(("-r", f"{fps}"))  # 指定视频帧率
-        if bitRate is not None:
-            command.extend(("-b:v", f"{bitRate}k"))  # 指定视频比特率
         if overwrite:
             command.append("-y")
         else:
             command.append("-n")
         command.append(savePath)
-        return FFCmdUtils.executeCmd(command)
+        return self.executeCmd(command)
 
     def combine(
         self,
@@ -385,6 +1617,7 @@ class FFCmdUtils:
         bitRate: int = None,
         codec: str = None,
         overwrite: bool = None,
+        profile: str = None,
     ):
         """
         ### 将图片封装为视频
@@ -399,10 +1632,12 @@ class FFCmdUtils:
         参数 bitRate: int，转换后的视频的码率，默认单位为k，例如此参数值为'1500'则代表转换后视频限制其码率在1500k左右，可忽略
         参数 codec: str，指定转换使用的编码器名，建议使用'h264'(要求ffmpeg是完整版，否则转换会出错)，可忽略
         参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 profile: str，编码配置名称，可用值见 ENCODERPROFILES，给定时忽略 codec，bitRate 作为码率上限，可忽略
         ```
         """
         if not self.isReady():
             return False
+        _checkProfile(profile)
         if not isinstance(imageDir, str):
             raise TypeError("参数imageDir的值数据类型必须是字符串。")
         if not isinstance(bitRate, (int, NONETYPE)):
@@ -421,20 +1656,184 @@ class FFCmdUtils:
         except Exception as err:
             print(f"图片目录读取出错了：{err}。")
             return False
+        if not self.__checkCodec(codec, profile):
+            return False
         fileName, ext = os.path.splitext(imageNames[0])
         pathWithName = os.path.join(imageDir, fileName.rsplit("_", 1)[0])
         command = [*self.__cmd, "-i", f"{pathWithName}_%d{ext}"]
-        if codec is not None:
-            command.extend(("-c:v", codec))  # 指定视频解码器
+        command.extend(self.__videoArgs(codec, bitRate, profile))
         if fps is not None:
             command.extend(("-r", f"{fps}"))  # 指定视频帧率
-        if bitRate is not None:
-            command.extend(("-b:v", f"{bitRate}k"))  # 指定视频比特率
         if overwrite:
             command.extend(("-y", savePath))
         else:
             command.extend(("-n", savePath))
-        return FFCmdUtils.executeCmd(command)
+        return self.executeCmd(command)
+
+    def openEncoder(
+        self,
+        savePath: str,
+        size: tuple,
+        fps: float,
+        bitRate: int = None,
+        codec: str = None,
+        pixFmt: str = "gray",
+        overwrite: bool = False,
+        profile: str = None,
+        threads: int = None,
+    ):
+        """
+        ### 打开一个 ffmpeg 编码管道，向其逐帧写入图像数组即可直接编码为视频
+
+        ```
+        参数 savePath: str，生成的视频的保存路径，包括文件名
+        参数 size: tuple，帧的 (宽, 高)
+        参数 fps: int or float，视频的帧率
+        参数 bitRate: int，视频的码率，默认单位为k，例如此参数值为'1500'则代表视频限制其码率在1500k左右，可忽略
+        参数 codec: str，指定使用的编码器名，建议使用'h264'(要求ffmpeg是完整版，否则转换会出错)，可忽略
+        参数 pixFmt: str，写入帧的像素格式，可用值：'gray'，单通道灰度图；'bgr24'，OpenCV 的三通道彩色图
+        参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 profile: str，编码配置名称，可用值见 ENCODERPROFILES，给定时忽略 codec，bitRate 作为码率上限，可忽略
+        参数 threads: int，编码器的线程数，为 None 则由 ffmpeg 按核数自动决定，可忽略
+        ```
+
+        返回值：FFEncoder 对象，ffmpeg 不可用时返回 None
+        """
+        if not self.isReady():
+            return None
+        _checkProfile(profile)
+        if not isinstance(savePath, str):
+            raise TypeError("参数savePath的值数据类型必须是字符串。")
+        if not isinstance(fps, (int, float)):
+            raise TypeError("参数fps的值数据类型必须是整型或者浮点型。")
+        if not isinstance(bitRate, (int, NONETYPE)):
+            raise TypeError("参数bitRate的值数据类型必须是整型。")
+        if not isinstance(codec, (str, NONETYPE)):
+            raise TypeError("参数codec的值数据类型必须是字符串类型。")
+        if pixFmt not in FFCmdUtils.PIXFMTS:
+            raise ValueError(f"参数pixFmt的值无效，可用值为：{FFCmdUtils.PIXFMTS}。")
+        if not self.__checkCodec(codec, profile):
+            return None
+        width, height = size
+        command = [
+            *self.__cmd,
+            "-f",  # 指定输入格式
+            "rawvideo",  # 输入为原始像素数据
+            "-pix_fmt",  # 指定输入像素格式
+            pixFmt,
+            "-s",  # 指定输入帧尺寸
+            f"{width}x{height}",
+            "-framerate",  # 指定输入帧率
+            f"{fps}",
+            "-i",  # 指定输入路径
+            "-",  # 从标准输入读取
+        ]
+        # 未使用编码配置时输出 yuv420p 像素格式，兼容绝大多数播放器
+        command.extend(
+            self.__videoArgs(codec, bitRate, profile, pixFmt == "gray", "yuv420p")
+        )
+        if threads is not None:
+            command.extend(("-threads", f"{threads}"))  # 指定编码线程数
+        if overwrite:
+            command.extend(("-y", savePath))
+        else:
+            command.extend(("-n", savePath))
+        try:
+            return self.ENCODER(command)
+        except Exception as err:
+            print(f"ffmpeg编码管道启动失败：{err}。")
+            return None
+
+    def openDecoder(
+        self,
+        videoPath: str,
+        size: tuple = None,
+        pixFmt: str = "gray",
+        start: float = None,
+        frames: int = None,
+        ratio: float = None,
+        first: int = 0,
+        threads: int = None,
+        crop: tuple = None,
+    ):
+        """
+        ### 打开一个 ffmpeg 解码管道，迭代即可逐帧得到缩放到指定大小的图像数组
+
+        缩放在 ffmpeg 内部按区域均值完成，只有缩小后的像素数据会传给 Python
+
+        ```
+        参数 videoPath: str，要解码的视频文件路径
+        参数 size: tuple，输出帧的 (宽, 高)，为 None 则保持原大小(此时需由调用者确保与源视频一致)
+        参数 pixFmt: str，输出帧的像素格式，可用值：'gray'，单通道灰度图；'bgr24'，OpenCV 的三通道彩色图
+        参数 start: float，从第几秒开始解码，ffmpeg 先跳转到之前最近的关键帧再精确地丢弃多余的帧，可忽略
+        参数 frames: int，最多输出的帧数，为 None 则解码到结尾，可忽略
+        参数 ratio: float，抽帧的保留比例，即目标帧率/源帧率，按时间表均匀保留帧，丢弃的帧不再缩放及传输，为 None 则保留全部帧，可忽略
+        参数 first: int，首个解码帧在源视频中的序号，分段解码时使各段的抽帧位置与整体解码一致，可忽略
+        参数 threads: int，解码器的线程数，为 None 则由 ffmpeg 按核数自动决定，可忽略
+        参数 crop: tuple，在缩放之前裁剪的画面区域 (x, y, 宽, 高)，坐标按转正后的画面计，size 为 None 时输出区域大小，可忽略
+        ```
+
+        返回值：FFDecoder 对象，ffmpeg 不可用时返回 None
+        """
+        if not self.isReady():
+            return None
+        if not isinstance(videoPath, str):
+            raise TypeError("参数videoPath的值数据类型必须是字符串。")
+        if pixFmt not in FFCmdUtils.PIXFMTS:
+            raise ValueError(f"参数pixFmt的值无效，可用值为：{FFCmdUtils.PIXFMTS}。")
+        if size is None and crop is not None:
+            size = tuple(crop[2:])
+        if size is None:
+            media = self.probe(videoPath)
+            if media is None:
+                print("无法读取视频信息，ffmpeg解码管道未启动。")
+                return None
+            size = media["width"], media["height"]
+        width, height = size
+        filters = f"scale={width}:{height}:flags=area"  # 按区域均值缩放
+        if crop is not None:
+            # 先裁剪再缩放，区域外的像素不参与缩放
+            # exact=1 使奇数坐标不按色度采样取整，与 OpenCV 解码时的裁剪一致
+            filters = "crop={2}:{3}:{0}:{1}:exact=1,{4}".format(*crop, filters)
+        if ratio is not None:
+            # 与 _keepFrame 相同的时间表，按帧序号选取，不受时间戳误差影响；选取在缩放之前，丢弃的帧不再缩放
+            n, eps = f"(n+{first})", f"{SCHEDULEEPS:.12f}"
+            filters = (
+                f"select='eq({n},0)+gt(floor({n}*{ratio!r}+{eps}),"
+                f"floor(({n}-1)*{ratio!r}+{eps}))',{filters}"
+            )
+        command = list(self.__cmd)
+        if threads is not None:
+            command.extend(("-threads", f"{threads}"))  # 指定解码线程数
+        if start:
+            command.extend(("-ss", f"{start:.6f}"))  # 在输入端跳转，只解码所需部分
+        command.extend(
+            (
+                "-i",  # 指定输入路径
+                videoPath,
+                "-an",  # 跳过音频流
+                "-vf",  # 指定视频滤镜
+                filters,
+                "-vsync",  # 指定帧同步方式
+                "passthrough",  # 每个解码出的帧原样输出一次，不补帧也不丢帧
+            )
+        )
+        if frames is not None:
+            command.extend(("-frames:v", f"{frames}"))  # 限制输出帧数
+        command.extend(
+            (
+                "-f",  # 指定输出格式
+                "rawvideo",  # 输出为原始像素数据
+                "-pix_fmt",  # 指定输出像素格式
+                pixFmt,
+                "-",  # 输出到标准输出
+            )
+        )
+        try:
+            return self.DECODER(command, size, (1, 3)[pixFmt == "bgr24"])
+        except Exception as err:
+            print(f"ffmpeg解码管道启动失败：{err}。")
+            return None
 
     def extract(
         self,
@@ -480,20 +1879,27 @@ class FFCmdUtils:
             command.append("-y")
         else:
             command.append("-n")
-        return FFCmdUtils.executeCmd(command)
+        return self.executeCmd(command)
 
 
 class vTools:
-    def __init__(self, chars: str = None, ffmpeg: str = None, procNum: int = None):
+    def __init__(
+        self,
+        chars: str = None,
+        ffmpeg: str = None,
+        procNum=None,
+        executor: str = "processes",
+    ):
         """
         ### vTools 类，包含 open, save, close, isOpened 四个公共方法
 
-        请确保你的程序运行入口处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果
+        默认以多进程方式渲染，请确保你的程序运行入口处于 __name__ == '__main__' 分支下，否则会造成递归调用而发生不可预知的后果；executor 为 'inline' 或 'threads' 时没有此限制
 
         ```
         参数 chars: str，生成的视频要使用的字符，字符串中字符数应大于2个，字符串无需按等效灰度手动排序，可忽略
         参数 ffmpeg: str，ffmpeg可执行文件的路径，为 None 则在当前目录或环境变量中查找，找不到则生成的文件无声音，可忽略
-        参数 process: int，转换成字符视频时使用的进程数，默认是 cpu数*2，可忽略
+        参数 procNum: int，转换成字符视频时使用的进程数，默认是可用cpu数*2；为'auto'时按容器配额等实际可用的cpu数，流式转换时以开头几帧测量各阶段耗时后分别确定解码、渲染、编码的线程数或进程数，可忽略
+        参数 executor: str，渲染及分段转换的执行方式，可用值：'processes'，进程池；'threads'，线程池，没有进程启动及传帧开销；'inline'，在当前线程中逐帧进行，适合短视频或禁止创建进程的环境，可忽略
         ```
         """
         if chars is not None:
@@ -504,20 +1910,26 @@ class vTools:
         self.__chars = chars
         if not isinstance(ffmpeg, (str, NONETYPE)):
             raise TypeError("参数ffmpeg的值必须是字符串类型。")
-        if procNum is None:
-            procNum = os.cpu_count() * 2
-        if not isinstance(procNum, int):
-            raise TypeError("参数procNum的值必须是整型数据。")
-        if procNum > 32:
-            raise ValueError("参数procNum的值过大，即进程数过多。")
+        _checkExecutor(executor)
+        procNum, auto = _checkProcNum(procNum, effectiveCpus() * 2)
         self.__ffutils = FFCmdUtils(ffmpeg)
         self.__procNum = procNum
+        self.__auto = auto  # 是否自动调度
+        self.__executor = executor
         self.__vPath = None
         self.__vCapt = None
+        self.__media = None  # 源视频的元数据，见 probeMedia
+        self.__clip = None  # 本次保存的截取范围，见 _clipRange
+        self.__source = None
         self.__imgTmp = tempfile.mkdtemp()
         self.__gImgTmp = tempfile.mkdtemp()
-        self.__audioTmp = tempfile.mkdtemp()
         self.__videoTmp = tempfile.mkdtemp()
+        self.__lumaTmp = tempfile.mkdtemp()
+        self.__lumaStacks = (
+            dict()
+        )  # (列数, 行数, 是否彩色, 抽帧比例, 截取范围) -> 亮度帧栈路径
+        self.__observers = list()
+        self.__metrics = None  # 本次保存的统计，没有观察者时为 None
 
     def __enter__(self):
         return self
@@ -538,8 +1950,34 @@ class vTools:
             self.__vPath = videoPath
         except Exception:
             print(f"参数videoPath的值数据类型不正确，仅接受字符串。")
+        # 解码前一次读取帧数、时长、比特率、旋转角度及关键帧等元数据，之后的调度、分段及编码参数均据此确定
+        self.__media = self.__ffutils.probe(videoPath)
+        self.__lumaStacks.clear()
+        vTools.__clearD(self.__lumaTmp)
+        # ffmpeg 可用时由 ffmpeg 解码并缩放帧，否则退回使用 OpenCV 解码
+        self.__source = ("cv2", "ffmpeg")[self.__ffutils.isReady()]
         return self
 
+    def addObserver(self, observer):
+        """
+        ### 添加观察者，之后每次保存都会向其发送事件
+
+        观察者是接受一个事件字典的可调用对象，如 JsonLinesSink，事件格式见 Metrics；没有观察者时不做任何统计
+
+        ```
+        参数 observer: callable，观察者
+        ```
+        """
+        if not callable(observer):
+            raise TypeError("参数observer的值必须是可调用对象。")
+        if observer not in self.__observers:
+            self.__observers.append(observer)
+
+    def removeObserver(self, observer):
+        """移除观察者，观察者不存在时忽略"""
+        if observer in self.__observers:
+            self.__observers.remove(observer)
+
     @property
     def chars(self):
         return self.__chars
@@ -563,15 +2001,39 @@ class vTools:
         acqRate: float = 0.2,
         bitRate: int = None,
         overwrite: bool = False,
+        stream: bool = True,
+        window: int = None,
+        delta: bool = False,
+        segments: int = None,
+        resume: bool = False,
+        color: bool = False,
+        palette: int = None,
+        profile: str = None,
+        targetFps: float = None,
+        start: float = None,
+        end: float = None,
+        crop=None,
     ):
         """
         ### 保存为字符视频
 
         ```
-        参数 savePath：str，生成的视频的保存路径，包括文件名
+        参数 savePath：str，生成的视频的保存路径，包括文件名，后缀名为'.chv'时保存为字符视频文件，只记录每帧的字符，可用 CharVideoReader 读取或转换为普通视频
         参数 acqRate: float，对原视频的采集率，0 < acqRate <= 1，值越大视频越清晰字体越小，可忽略
         参数 bitRate: int，生成的视频的码率，默认单位为k，例如值为'1500'则代表生成的视频码率限制在1500k，可忽略
         参数 overwrite: bool，如果保存目录已有同名文件，此参数控制是否覆盖同名文件，可忽略
+        参数 stream: bool，是否使用流式转换，帧以数组形式在内存中流转，不产生临时图片，可忽略
+        参数 window: int，流式转换时同时在途的最大帧数，决定内存占用上限，默认是进程数*2，可忽略
+        参数 delta: bool，流式转换时是否使用增量渲染，只重绘变化的字符，适合屏幕录像、动画等画面变化少的视频，可忽略
+        参数 segments: int，流式转换时按关键帧将视频分为几段，各段在独立进程中同时完成解码、渲染及编码后再拼接，需要ffmpeg，适合长视频，可忽略
+        参数 resume: bool，是否作为可续传任务转换，在输出文件旁记录任务清单及已完成的视频段，中断后以相同参数再次调用即从已完成处继续，需要ffmpeg，可忽略
+        参数 color: bool，是否生成彩色字符视频，每个字符按其所在区域的平均颜色着色(黑底)，需要流式转换，不支持增量渲染，可忽略
+        参数 palette: int，彩色模式下每个颜色通道量化为几个色阶，如 4 即 64 色，颜色越少生成的视频越小，可忽略
+        参数 profile: str，编码配置名称，可用值：'fast-preview'，编码最快；'archive'，高质量存档；'small-web'，体积最小且适合网页播放；给定时不再按源视频估算码率，bitRate 作为码率上限，需要ffmpeg，可忽略
+        参数 targetFps: float，输出视频的帧率，低于源视频帧率时按时间均匀抽帧，丢弃的帧不再转换、渲染及编码，音画保持同步，需要流式转换，可忽略
+        参数 start: float，只转换源视频从第几秒开始的部分，跳转到之前最近的关键帧后解码，不从头解码，音频同样截取，可忽略
+        参数 end: float，只转换到源视频的第几秒(不含)，之后的帧不再解码，可忽略
+        参数 crop: tuple，只转换画面中 (x, y, 宽, 高) 的区域，宽、高须为偶数，坐标按转正后的画面计，在缩小到字符网格之前裁剪，生成的视频大小即区域大小，可忽略
         ```
         """
         if not isinstance(savePath, str):
@@ -582,24 +2044,102 @@ class vTools:
             raise ValueError("参数acqRate的值必须大于0小于等于1。")
         if not isinstance(bitRate, (int, NONETYPE)):
             raise TypeError("参数bitRate的值必须是整型数据。")
+        _checkSaveExt(savePath)
+        _checkProfile(profile)
+        _checkClip(start, end, crop)
+        streamOpts = _streamOptions(
+            stream,
+            window,
+            delta,
+            self.__procNum,
+            segments,
+            resume,
+            color,
+            palette,
+            targetFps,
+            self.__executor,
+        )
+        if self.isOpened():
+            self.__clip = _clipRange(self.__media, start, end, crop)
+        try:
+            if not self.__observers:
+                return self.__generate(
+                    savePath, acqRate, bitRate, overwrite, streamOpts, profile
+                )
+            return self.__observe(
+                savePath, acqRate, bitRate, overwrite, streamOpts, profile
+            )
+        finally:
+            self.__clip = None
+
+    def __observe(self, savePath, acqRate, bitRate, overwrite, streamOpts, profile):
+        """有观察者时在转换前后发出事件并统计各阶段"""
+        frameCount, fps, size = None, None, None
+        if self.isOpened():
+            targetFps = None if streamOpts is None else streamOpts["targetFps"]
+            fps, ratio = _frameRate(self.__media["fps"], targetFps)
+            frameCount = _clipFrames(self.__media, self.__clip, ratio)
+            size = list(_clipSize(self.__media, self.__clip))
+        metrics = Metrics(self.__observers, self.__vPath, savePath, frameCount)
+        metrics.emit("start", frames=frameCount, fps=fps, size=size)
+        self.__metrics, success = metrics, False
+        try:
+            success = self.__generate(
+                savePath, acqRate, bitRate, overwrite, streamOpts, profile
+            )
+        except Exception as err:
+            metrics.emit("error", message=repr(err))
+            raise
+        finally:
+            self.__metrics = None
+            metrics.finish(success)
+        return success
+
+    def __generate(self, savePath, acqRate, bitRate, overwrite, streamOpts, profile):
+        try:
+            return self.__dispatch(
+                savePath, acqRate, bitRate, overwrite, streamOpts, profile
+            )
+        except _DecodeError as err:
+            _report(str(err), self.__metrics)
+            return False
+
+    def __dispatch(self, savePath, acqRate, bitRate, overwrite, streamOpts, profile):
+        """按保存格式及 ffmpeg 的可用性选择生成方式"""
+        if savePath.lower().endswith(".chv"):
+            if streamOpts is not None and streamOpts["color"]:
+                raise ValueError("字符视频(.chv)文件只记录字符，不支持彩色模式。")
+            targetFps = None if streamOpts is None else streamOpts["targetFps"]
+            return self.__GenByChv(savePath, acqRate, overwrite, targetFps)
         if self.__ffutils.isReady():
-            return self.__GenByFFm(savePath, acqRate, bitRate, overwrite)
-        else:
-            return self.__GenByCV2(savePath, acqRate, overwrite)
+            # 开始解码前检查编码参数，避免转换到中途才因 ffmpeg 不支持而失败
+            if profile is not None and not _profileReady(self.__ffutils, profile):
+                print(
+                    f"ffmpeg不支持libx264编码器，编码配置'{profile}'无效，使用默认编码参数。"
+                )
+                profile = None
+            if _h264Ready(self.__ffutils):
+                return self.__GenByFFm(
+                    savePath, acqRate, bitRate, overwrite, streamOpts, profile
+                )
+            print("ffmpeg不支持h264编码，使用OpenCV合成，生成的视频没有声音。")
+        elif profile is not None:
+            print("编码配置需要ffmpeg，使用OpenCV默认编码参数。")
+        return self.__GenByCV2(savePath, acqRate, overwrite, streamOpts)
 
     def close(self):
         self.__vPath = None
-        if hasattr(self, "__vCapt") and isinstance(self.__vCapt, vcapt):
+        self.__media = None
+        # 私有属性名会被改写为 _vTools__xxx，hasattr 需使用改写后的名称
+        if hasattr(self, "_vTools__vCapt") and isinstance(self.__vCapt, vcapt):
             self.__vCapt.release()
+        if hasattr(self, "_vTools__lumaStacks"):
+            self.__lumaStacks.clear()
         try:
-            if hasattr(self, "__audioTmp"):
-                shutil.rmtree(self.__audioTmp)
-            if hasattr(self, "__videoTmp"):
-                shutil.rmtree(self.__videoTmp)
-            if hasattr(self, "__imgTmp"):
-                shutil.rmtree(self.__imgTmp)
-            if hasattr(self, "__gImgTmp"):
-                shutil.rmtree(self.__gImgTmp)
+            for attrName in ("videoTmp", "imgTmp", "gImgTmp", "lumaTmp"):
+                tmpDir = getattr(self, f"_vTools__{attrName}", None)
+                if tmpDir is not None and os.path.isdir(tmpDir):
+                    shutil.rmtree(tmpDir)
         except Exception as err:
             print(f"临时文件清除失败：{err}。")
 
@@ -622,7 +2162,10 @@ class vTools:
 
     def isOpened(self) -> bool:
         return (
-            self.__vPath and isinstance(self.__vCapt, vcapt) and self.__vCapt.isOpened()
+            self.__vPath
+            and self.__media is not None
+            and isinstance(self.__vCapt, vcapt)
+            and self.__vCapt.isOpened()
         )
 
     def __extractByFFm(self):
@@ -632,20 +2175,14 @@ class vTools:
         pass
 
     def __mkGrayImgs(self, acqRate: float = 0.2):
-        """拆分音频文件及生成字符图片"""
+        """拆分音频文件及生成字符图片，视频未打开或有图片转换失败时返回 None"""
         if not self.isOpened():
             return print("视频文件没有被打开，请检查路径是否正确或其他问题。")
         vTools.__clearD(self.__imgTmp)
-        vTools.__clearD(self.__audioTmp)
-        if self.__ffutils.isReady():
-            self.__ffutils.demux(self.__vPath, self.__audioTmp)
         prefix = os.path.splitext(os.path.basename(self.__vPath))[0]
         frameNum, imgNameList = 0, list()
         print("开始分解视频...")
-        while True:
-            boolResult, frame = self.__vCapt.read()
-            if not boolResult:
-                break
+        for frame in _readFrames(self.__vCapt, clip=self.__clip):
             name = f"{prefix}_{frameNum}.jpg"
             imgNameList.append(name)
             imwrite(
@@ -653,23 +2190,353 @@ class vTools:
             )
             frameNum += 1
         self.__vCapt.set(CAP_PROP_POS_FRAMES, 0)
-        makeImageProcessPool = Pool(self.__procNum)
+        if self.__metrics is not None:
+            self.__metrics.counters["decoded"] = frameNum
+        makeImageProcessPool = _makePool(self.__executor, self.__procNum)
         kwdargs = dict(scale=acqRate, keepSize=1, chars=self.__chars)
         print("开始转换图像...")
+        asyncResults = list()
         for imgName in imgNameList:
             imgPath = os.path.join(self.__imgTmp, imgName)
             imgSave = os.path.join(self.__gImgTmp, imgName)
-            makeImageProcessPool.apply_async(makeImage, (imgPath, imgSave), kwdargs)
+            asyncResults.append(
+                makeImageProcessPool.apply_async(makeImage, (imgPath, imgSave), kwdargs)
+            )
         makeImageProcessPool.close()
         makeImageProcessPool.join()  # 等待进程全部结束
+        if _checkResults(asyncResults, self.__metrics) < len(asyncResults):
+            return None  # 缺帧的图片序列不再合成
         return (
             imgNameList,
-            int(self.__vCapt.get(CAP_PROP_FRAME_WIDTH)),
-            int(self.__vCapt.get(CAP_PROP_FRAME_HEIGHT)),
-            self.__vCapt.get(CAP_PROP_FPS),
+            *_clipSize(self.__media, self.__clip),
+            self.__media["fps"],
+        )
+
+    def __streamImgs(self, acqRate: float, streamOpts: dict):
+        """以流式方式逐帧产出字符图像数组"""
+        size = _clipSize(self.__media, self.__clip)
+        gridSize = _gridSize(size, acqRate, self.__chars)
+        _, ratio = _frameRate(self.__media["fps"], streamOpts["targetFps"])
+        plan = streamOpts["plan"]
+        threads = None if plan is None else plan["decode"]
+        grids = self.__frameSource(gridSize, streamOpts["color"], ratio, threads)
+        print("开始流式转换视频...")
+        yield from _trackFrames(grids, size, self.__chars, streamOpts, self.__metrics)
+
+    def __frameSource(
+        self,
+        gridSize: tuple,
+        color: bool = False,
+        ratio: float = None,
+        threads: int = None,
+    ):
+        """
+        ### 逐帧产出缩小到字符网格大小的灰度帧，彩色模式产出 BGR 帧，给定保留比例 ratio 时只产出按时间表保留的帧
+
+        同一视频同一网格大小只解码一次，解码时顺带写入亮度帧栈，之后直接以内存映射方式读取，更换字符、码率等再次保存时无需重新解码
+        """
+        clip = self.__clip
+        clipKey = (
+            None if clip is None else (clip["first"], clip["frames"], clip["crop"])
+        )
+        key = (*gridSize, bool(color), ratio, clipKey)
+        stackPath = self.__lumaStacks.get(key)
+        if stackPath is not None:
+            print("使用已缓存的亮度帧，跳过解码。")
+            yield from LumaStack.load(stackPath)
+            return
+        stackName = "{}x{}{}{}{}.npy".format(
+            *gridSize,
+            ("", "_bgr")[bool(color)],
+            "" if ratio is None else f"_{ratio:.6f}",
+            "" if clipKey is None else "_{}_{}_{}".format(*clipKey),
+        )
+        stackPath = os.path.join(self.__lumaTmp, stackName)
+        lumaStack = LumaStack(stackPath, gridSize, (1, 3)[bool(color)])
+        completed = False
+        try:
+            for grid in self.__decode(gridSize, color, ratio, threads):
+                lumaStack.append(grid)
+                yield grid
+            completed = True
+        finally:
+            if completed:
+                lumaStack.finish()
+                self.__lumaStacks[key] = stackPath
+            else:
+                lumaStack.discard()
+
+    def __decode(
+        self,
+        gridSize: tuple,
+        color: bool = False,
+        ratio: float = None,
+        threads: int = None,
+        frames: int = None,
+    ):
+        """解码视频并逐帧产出缩小到字符网格大小的灰度帧或 BGR 帧，优先由 ffmpeg 解码缩放，threads 为 ffmpeg 解码线程数，只解码截取范围内的帧"""
+        if self.__source == "ffmpeg":
+            pixFmt = FFCmdUtils.PIXFMTS[bool(color)]
+            start, outFrames, first, crop = _clipSegment(
+                self.__clip, self.__media["fps"], ratio
+            )
+            if outFrames is not None:
+                frames = outFrames if frames is None else min(frames, outFrames)
+            decoder = self.__ffutils.openDecoder(
+                self.__vPath,
+                gridSize,
+                pixFmt,
+                start,
+                frames,
+                ratio,
+                first,
+                threads,
+                crop,
+            )
+            if decoder is not None:
+                with decoder:
+                    yield from decoder
+                    # 源视频损坏等导致 ffmpeg 中途退出时，已产出的帧不完整，不能当作正常结束
+                    if not decoder.close():
+                        raise _DecodeError("ffmpeg解码异常结束，生成中断。")
+                return
+            print("ffmpeg解码管道不可用，使用OpenCV解码。")
+        self.__vCapt.set(CAP_PROP_POS_FRAMES, 0)
+        grids = _readFrames(self.__vCapt, gridSize, color, ratio, self.__clip)
+        yield from islice(grids, frames)
+        self.__vCapt.set(CAP_PROP_POS_FRAMES, 0)
+
+    def __schedule(self, acqRate: float, streamOpts: dict, probe, inline=()):
+        """自动调度：以单线程解码开头几帧，与测量用编码器 probe 一起测量各阶段耗时，返回加入调度结果的流式转换选项"""
+        size = _clipSize(self.__media, self.__clip)
+        gridSize = _gridSize(size, acqRate, self.__chars)
+        _, ratio = _frameRate(self.__media["fps"], streamOpts["targetFps"])
+        if self.__source != "ffmpeg":
+            inline = ("decode", *inline)
+        grids = self.__decode(gridSize, streamOpts["color"], ratio, 1, CALIBFRAMES)
+        return _schedule(
+            grids, size, self.__chars, streamOpts, probe, inline, self.__metrics
+        )
+
+    def __encodeByFFm(
+        self,
+        savePath: str,
+        acqRate: float,
+        fps: float,
+        bitRate: int,
+        streamOpts: dict,
+        profile: str = None,
+    ):
+        """将字符图像逐帧写入 ffmpeg 编码管道，转换与编码同时进行"""
+        size = _clipSize(self.__media, self.__clip)
+        fps, _ = _frameRate(fps, streamOpts["targetFps"])
+        pixFmt = FFCmdUtils.PIXFMTS[streamOpts["color"]]
+        if self.__auto:
+            probePath = os.path.join(
+                self.__videoTmp, f"calibration{os.path.splitext(savePath)[1]}"
+            )
+            probe = self.__ffutils.openEncoder(
+                probePath, size, fps, bitRate, "h264", pixFmt, True, profile, 1
+            )
+            if probe is not None:
+                streamOpts = self.__schedule(
+                    acqRate, streamOpts, (probe.write, probe.close)
+                )
+                _clearObstacle(probePath)
+        plan = streamOpts["plan"]
+        encoder = self.__ffutils.openEncoder(
+            savePath,
+            size,
+            fps,
+            bitRate,
+            "h264",
+            pixFmt,
+            profile=profile,
+            threads=None if plan is None else plan["encode"],
+        )
+        if encoder is None:
+            return False
+        print("开始使用ffmpeg流式合成...")
+        with encoder:
+            images = self.__streamImgs(acqRate, streamOpts)
+            if not _writeFrames(encoder.write, images, self.__metrics):
+                _report("ffmpeg编码管道已中断，生成失败。", self.__metrics)
+        return encoder.close()
+
+    def __planSegments(self, segments: int, fps: float):
+        """
+        ### 将视频划分为至多 segments 段，返回 [(起始秒, 帧数), ...]
+
+        分段点尽量落在关键帧上，使各段跳转后无需解码多余的帧；最后一段的帧数为 None，即直到视频结尾
+
+        有截取范围时只划分范围内的帧，范围有终点时最后一段的帧数为到终点的帧数
+        """
+        clip = self.__clip
+        base, tail = (0, None) if clip is None else (clip["first"], clip["frames"])
+        last = self.__media["frames"] or 0
+        if tail is not None:
+            last = base + tail
+        if last <= base or fps <= 0:
+            return [(0 if clip is None else clip["start"], tail)]
+        keyIndices = None
+        keyTimes = self.__ffutils.keyframes(self.__vPath)
+        if keyTimes:
+            keyIndices = sorted({round((t - keyTimes[0]) * fps) for t in keyTimes})
+        bounds = [base]
+        for segNum in range(1, segments):
+            target = base + round(segNum * (last - base) / segments)
+            if keyIndices:
+                target = min(keyIndices, key=lambda k: abs(k - target))
+            if bounds[-1] < target < last:
+                bounds.append(target)
+        plan = list()
+        for segNum, first in enumerate(bounds):
+            # 跳转到两帧之间，避免时间戳的浮点误差导致多取或少取一帧
+            start = max(first - 0.5, 0) / fps
+            if segNum + 1 < len(bounds):
+                plan.append((start, bounds[segNum + 1] - first))
+            else:
+                plan.append((start, None if tail is None else last - first))
+        return plan
+
+    def __encodeBySeg(
+        self,
+        savePath: str,
+        acqRate: float,
+        fps: float,
+        bitRate: int,
+        streamOpts: dict,
+        job: JobManifest = None,
+        profile: str = None,
+    ):
+        """
+        ### 将视频分段，各段在独立进程中同时完成解码、渲染及编码，最后无损拼接
+
+        给定任务清单时，视频段保存在输出文件旁，每完成一段即记录到清单中，已完成的段不再重复转换
+        """
+        size = _clipSize(self.__media, self.__clip)
+        ext = os.path.splitext(savePath)[1]
+        if job is None:
+            plan = self.__planSegments(streamOpts["segments"], fps)
+            segPaths = [
+                os.path.join(self.__videoTmp, f"seg_{segNum}{ext}")
+                for segNum in range(len(plan))
+            ]
+        else:
+            plan = self.__planJob(job, acqRate, fps, bitRate, size, streamOpts, profile)
+            segPaths = [job.partPath(segNum, ext) for segNum in range(len(plan))]
+        outFps, ratio = _frameRate(fps, streamOpts["targetFps"])
+        tasks = list()
+        for segNum, segment in enumerate(plan):
+            if job is not None and job.isDone(segNum):
+                continue
+            start, frames, first = _segmentFrames(segment, fps, ratio)
+            args = (
+                self.__ffutils.executable,
+                self.__vPath,
+                segPaths[segNum],
+                (start, frames),
+                size,
+                outFps,
+                bitRate,
+                acqRate,
+                self.__chars,
+                streamOpts["delta"],
+                streamOpts["color"],
+                streamOpts["palette"],
+                profile,
+                ratio,
+                first,
+                None if self.__clip is None else self.__clip["crop"],
+            )
+            tasks.append((segNum, args))
+        if tasks:
+            print(f"开始分{len(plan)}段并行转换，本次转换{len(tasks)}段...")
+            finished = len(plan) - len(tasks)
+            with _makePool(
+                self.__executor, min(len(tasks), self.__procNum)
+            ) as segmentProcessPool:
+                for segNum, success in segmentProcessPool.imap_unordered(
+                    _convertTask, tasks
+                ):
+                    if not success:
+                        _report(f"第{segNum}段视频转换失败，生成中断。", self.__metrics)
+                        return False
+                    if job is not None:
+                        job.complete(segNum)
+                    if self.__metrics is not None:
+                        self.__metrics.emit(
+                            "segment", segment=segNum, segments=len(plan)
+                        )
+                        finished += 1
+                        self.__metrics.progress(finished, "segments", len(plan))
+        print("开始拼接视频段...")
+        success = self.__ffutils.concat(segPaths, savePath, True)
+        if job is None:
+            for segPath in segPaths:
+                os.remove(segPath)
+        return success
+
+    def __planJob(
+        self,
+        job: JobManifest,
+        acqRate: float,
+        fps: float,
+        bitRate: int,
+        size: tuple,
+        streamOpts: dict,
+        profile: str = None,
+    ):
+        """载入与本次转换一致的任务清单，没有则按固定时长分段并新建清单，返回分段计划"""
+        source = dict(
+            path=os.path.abspath(self.__vPath), fingerprint=fingerprint(self.__vPath)
+        )
+        params = dict(
+            acqRate=acqRate,
+            chars=self.__chars,
+            bitRate=bitRate,
+            codec="h264",
+            profile=profile,
+            delta=streamOpts["delta"],
+            color=streamOpts["color"],
+            palette=streamOpts["palette"],
+            targetFps=streamOpts["targetFps"],
+            size=list(size),
+            fps=fps,
+            clip=self.__clipParams(),
+        )
+        if job.load(source, params):
+            print(f"继续未完成的任务，已完成{len(job.done)}/{len(job.plan)}段。")
+            return job.plan
+        segments = streamOpts["segments"]
+        if segments is None:
+            # 按固定时长分段，中断时最多损失正在转换的几段
+            frameCount = _clipFrames(self.__media, self.__clip)
+            segments = max(self.__procNum, ceil(frameCount / (fps * CHUNKSECONDS)))
+        plan = self.__planSegments(segments, fps)
+        job.begin(source, params, plan)
+        return plan
+
+    def __clipParams(self):
+        """以可写入任务清单的形式返回截取范围，不截取时为 None"""
+        if self.__clip is None:
+            return None
+        crop = self.__clip["crop"]
+        return dict(
+            first=self.__clip["first"],
+            frames=self.__clip["frames"],
+            crop=None if crop is None else list(crop),
         )
 
-    def __GenByFFm(self, savePath: str, acqRate: float, bitRate: int, overwrite):
+    def __GenByFFm(
+        self,
+        savePath: str,
+        acqRate: float,
+        bitRate: int,
+        overwrite: bool,
+        streamOpts: dict = None,
+        profile: str = None,
+    ):
         if os.path.exists(savePath):
             if not overwrite:
                 print("已有同名文件或目录且参数overwrite值为'False'，生成中断。")
@@ -678,36 +2545,97 @@ class vTools:
                 _clearObstacle(savePath)
         vTools.__clearD(self.__gImgTmp)
         vTools.__clearD(self.__videoTmp)
-        *_, fps = self.__mkGrayImgs(acqRate)
-        if bitRate is None:
-            try:
-                fileSize = os.path.getsize(self.__vPath)
-                bitRate = int(
-                    (fileSize * 8 / 1024)
-                    / (self.__vCapt.get(CAP_PROP_FRAME_COUNT) / fps)
-                )
-            except Exception:
-                bitRate = None
+        job = None
+        if streamOpts is None:
+            grayImgs = self.__mkGrayImgs(acqRate)
+            if grayImgs is None:
+                return False
+            *_, fps = grayImgs
+        else:
+            if not self.isOpened():
+                return print("视频文件没有被打开，请检查路径是否正确或其他问题。")
+            fps = self.__media["fps"]
+        if bitRate is None and profile is None:
+            bitRate = _sourceBitRate(self.__media, self.__vPath)
         ext = os.path.splitext(savePath)[1]
         vidTmpFileName = f"{strftime('%Y-%m-%d_%H-%M-%S', localtime())}{ext}"
         vidTmpFullPath = os.path.join(self.__videoTmp, vidTmpFileName)
-        print("开始使用ffmpeg合成...")
-        if not self.__ffutils.combine(
-            self.__gImgTmp, vidTmpFullPath, fps, bitRate, "h264", overwrite
+        if streamOpts is None:
+            print("开始使用ffmpeg合成...")
+            if not self.__ffutils.combine(
+                self.__gImgTmp, vidTmpFullPath, fps, bitRate, "h264", overwrite, profile
+            ):
+                return False
+        else:
+            if streamOpts["resume"]:
+                job = JobManifest(savePath)
+                if not self.__encodeBySeg(
+                    vidTmpFullPath, acqRate, fps, bitRate, streamOpts, job, profile
+                ):
+                    return False
+            elif (streamOpts["segments"] or 1) > 1:
+                if not self.__encodeBySeg(
+                    vidTmpFullPath, acqRate, fps, bitRate, streamOpts, None, profile
+                ):
+                    return False
+            elif not self.__encodeByFFm(
+                vidTmpFullPath, acqRate, fps, bitRate, streamOpts, profile
+            ):
+                return False
+        # 直接从源视频中取音频流封装，源视频没有音频时只复制视频流，截取时只取对应时段的音频
+        audioStart, audioDuration = _clipAudio(self.__clip, fps)
+        if not self.__ffutils.mux(
+            vidTmpFullPath,
+            self.__vPath,
+            savePath,
+            True,
+            audioStart,
+            audioDuration,
+            self.__media["audioCodec"],  # 打开时已读取，未知时为 None
         ):
-            return False
+            print("音频封装失败，生成的视频没有声音。")
+            shutil.move(vidTmpFullPath, savePath)
+        if job is not None:
+            job.remove()
+        return True
+
+    def __GenByChv(
+        self, savePath: str, acqRate: float, overwrite: bool, targetFps: float = None
+    ):
+        """保存为字符视频(.chv)文件，只保存字形序号网格，不渲染字符图像"""
+        if os.path.exists(savePath):
+            if not overwrite:
+                print("已有同名文件或目录且参数overwrite值为'False'，生成中断。")
+                return False
+            else:
+                _clearObstacle(savePath)
+        if not self.isOpened():
+            return print("视频文件没有被打开，请检查路径是否正确或其他问题。")
+        size = _clipSize(self.__media, self.__clip)
+        renderer = _getRenderer(self.__chars)
+        gridSize = renderer.gridSize(size, acqRate)
+        fps, ratio = _frameRate(self.__media["fps"], targetFps)
+        grids = self.__frameSource(gridSize, ratio=ratio)
+        if self.__metrics is not None:
+            grids = self.__metrics.track("decode", grids, "decoded")
+        print("开始生成字符视频(.chv)...")
         try:
-            audio = os.listdir(self.__audioTmp)
+            writer = CharVideoWriter(savePath, renderer, gridSize, fps, size)
         except Exception:
-            audio = None
-        if audio:
-            audioFullPath = os.path.join(self.__audioTmp, audio[0])
-            self.__ffutils.mux(vidTmpFullPath, audioFullPath, savePath)
-        else:
-            print("音频缓存文件读取失败，无法添加音频。")
-            shutil.move(vidTmpFullPath, savePath)
+            _report("字符视频写入失败，检查保存位置是否有写入权限。", self.__metrics)
+            return False
+        with writer:
+            return _writeFrames(
+                writer.append, map(renderer.indices, grids), self.__metrics
+            )
 
-    def __GenByCV2(self, savePath: str, acqRate: float, overwrite: bool):
+    def __GenByCV2(
+        self,
+        savePath: str,
+        acqRate: float,
+        overwrite: bool,
+        streamOpts: dict = None,
+    ):
         if os.path.exists(savePath):
             if not overwrite:
                 print("已有同名文件或目录且参数overwrite值为'False'，生成中断。")
@@ -715,7 +2643,19 @@ class vTools:
             else:
                 _clearObstacle(savePath)
         vTools.__clearD(self.__gImgTmp)
-        imgNameList, width, height, fps = self.__mkGrayImgs(acqRate)
+        if streamOpts is None:
+            grayImgs = self.__mkGrayImgs(acqRate)
+            if grayImgs is None:
+                return False
+            imgNameList, width, height, fps = grayImgs
+        else:
+            if not self.isOpened():
+                return print("视频文件没有被打开，请检查路径是否正确或其他问题。")
+            width, height = _clipSize(self.__media, self.__clip)
+            fps, _ = _frameRate(self.__media["fps"], streamOpts["targetFps"])
+            if self.__auto:
+                probe = _cv2Probe((width, height), fps, streamOpts["color"])
+                streamOpts = self.__schedule(acqRate, streamOpts, probe, ("encode",))
         fourcc = VideoWriter_fourcc(*"MP42")
         try:
             videoWrt = VideoWriter(savePath, fourcc, fps, (width, height), True)
@@ -723,7 +2663,18 @@ class vTools:
             print("视频写入失败，检查保存位置是否有写入权限。")
             return False
         print("开始使用OpenCV合成(无音频)...")
-        for imgName in imgNameList:
-            videoWrt.write(imread(os.path.join(self.__gImgTmp, imgName)))
-        videoWrt.release()
-        return True
+        try:
+            if streamOpts is None:
+                images = (imread(os.path.join(self.__gImgTmp, n)) for n in imgNameList)
+                success = _writeFrames(videoWrt.write, images, self.__metrics)
+            else:
+                success = _writeFrames(
+                    _cv2Writer(videoWrt, streamOpts["color"]),
+                    self.__streamImgs(acqRate, streamOpts),
+                    self.__metrics,
+                )
+        finally:
+            videoWrt.release()  # 解码中断时同样释放写入器
+        if not success:
+            _report("视频写入失败，检查保存路径及文件格式是否受支持。", self.__metrics)
+        return success